@@ -1,35 +1,41 @@
-from flask import request, jsonify, send_file 
-from werkzeug.utils import secure_filename
-from db import app, mysql 
+from flask import request, jsonify, send_file, stream_with_context 
+from db import app, db_cursor, db_stream_cursor, db_transaction, pool, release_db, PoolTimeout
+from zip_stream import map_ordered, stream_zip
 from flask_cors import CORS
 CORS(app) 
 
 import os
 import json
 import io 
-from datetime import datetime
+import base64
+import math
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import csv 
-import zipfile 
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image 
-from io import BytesIO 
 
 try:
     import pillow_heif
     pillow_heif.register_heif_opener() 
 except ImportError:
-    print("AVISO: pillow-heif não instalado. Arquivos HEIC/HEIF não serão processados.")
+    pillow_heif = None
 
-# --- Importação FPDF2 ---
-try:
-    from fpdf import FPDF
-    try:
-        from fpdf import XPos, YPos
-    except ImportError:
-        class XPos: LMARGIN = 'L'
-        class YPos: NEXT = 'Y'
-
-except ImportError:
-    FPDF = None
+from reports import FPDF, PdfCache, PdfRenderPool, render_pdf_cached
+from images import PHOTO_EXPORT_FORMATS, VARIANT_FORMATS, VARIANT_WIDTHS, PhotoVariantCache, create_derivatives, export_photo, remove_upload, resolve_photo, variant_width
+from storage import inspection_photo_paths, photo_store
+from reaper import FileReaper, FolderDeleter
+from jobs import ExportJobManager
+from uploads import UploadError, UploadSessionStore
+from gps import extract_gps_data, extract_gps_from_upload, gps_numeric
+from changelog import record_change, record_changes
+from search import MIN_TERM_LENGTH, boolean_query, find_matches, parse_query, snippet
+from columnar import compact_dashboard, pa, stream_columnar
+from instrumentation import RequestProfiler, configure_logging, init_app as init_instrumentation, render_metrics, stage
+from compression import Compressor, compress_stream, init_app as init_compression
+from serialization import init_app as init_serialization
 
 
 
@@ -37,235 +43,632 @@ UPLOAD_FOLDER = "static/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# Log estruturado (JSON por linha); LOG_LEVEL=OFF desliga o log da aplicação por completo
+app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO")
+app.config["LOG_FORMAT"] = os.environ.get("LOG_FORMAT", "json")
+logger = configure_logging(app.config["LOG_LEVEL"], app.config["LOG_FORMAT"])
+
+if pillow_heif is None:
+    logger.warning("pillow-heif não instalado. Arquivos HEIC/HEIF não serão processados.")
+
+# Latência por rota (/metrics) e perfil (cProfile) de uma amostra das requisições lentas
+app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+app.config["PROFILE_SLOW_SECONDS"] = float(os.environ.get("PROFILE_SLOW_SECONDS", 1.0))
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", os.path.join(app.root_path, "cache", "profiles"))
+
+init_instrumentation(app, RequestProfiler(
+    app.config["PROFILE_DIR"],
+    sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+    slow_seconds=app.config["PROFILE_SLOW_SECONDS"]
+))
+
+# jsonify com orjson (se instalado) e compressão gzip/brotli negociada das respostas JSON e CSV
+app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+app.config["COMPRESS_GZIP_LEVEL"] = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+app.config["COMPRESS_BROTLI_QUALITY"] = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+
+if not init_serialization(app):
+    logger.info("orjson não instalado; usando o serializador JSON padrão.")
+init_compression(
+    app,
+    min_size=app.config["COMPRESS_MIN_SIZE"],
+    gzip_level=app.config["COMPRESS_GZIP_LEVEL"],
+    brotli_quality=app.config["COMPRESS_BROTLI_QUALITY"]
+)
+
+# Gravação paralela das fotos e geração dos derivados fora da requisição
+app.config["UPLOAD_WORKERS"] = int(os.environ.get("UPLOAD_WORKERS", 8))
+upload_executor = ThreadPoolExecutor(max_workers=app.config["UPLOAD_WORKERS"], thread_name_prefix="upload")
+
+# Derivados (thumb/print) em pool próprio: decodificar fotos grandes não pode atrasar os uploads
+app.config["DERIVATIVE_WORKERS"] = int(os.environ.get("DERIVATIVE_WORKERS", 2))
+derivative_executor = ThreadPoolExecutor(max_workers=app.config["DERIVATIVE_WORKERS"], thread_name_prefix="derivatives")
+
+# Uploads em partes (retomáveis); sessões abandonadas são removidas após UPLOAD_SESSION_MAX_AGE
+app.config["UPLOAD_SESSIONS_DIR"] = os.environ.get("UPLOAD_SESSIONS_DIR", os.path.join(app.root_path, "cache", "uploads"))
+app.config["UPLOAD_MAX_FILE_SIZE"] = int(os.environ.get("UPLOAD_MAX_FILE_SIZE", 100 * 1024 * 1024))
+app.config["UPLOAD_SESSION_MAX_AGE"] = int(os.environ.get("UPLOAD_SESSION_MAX_AGE", 24 * 3600))
+
+upload_sessions = UploadSessionStore(
+    app.config["UPLOAD_SESSIONS_DIR"],
+    max_size=app.config["UPLOAD_MAX_FILE_SIZE"],
+    max_age=app.config["UPLOAD_SESSION_MAX_AGE"]
+)
+
+# Renderização paralela dos PDFs (exportação da pasta inteira)
+app.config["PDF_RENDER_WORKERS"] = int(os.environ.get("PDF_RENDER_WORKERS", os.cpu_count() or 1))
+app.config["PDF_RENDER_TIMEOUT"] = float(os.environ.get("PDF_RENDER_TIMEOUT", 60))
+
+pdf_render_pool = PdfRenderPool(
+    workers=app.config["PDF_RENDER_WORKERS"],
+    timeout=app.config["PDF_RENDER_TIMEOUT"]
+)
+
+# Cache em disco dos PDFs gerados (limite de tamanho com remoção LRU)
+app.config["PDF_CACHE_DIR"] = os.environ.get("PDF_CACHE_DIR", os.path.join(app.root_path, "cache", "pdf"))
+app.config["PDF_CACHE_MAX_BYTES"] = int(os.environ.get("PDF_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+pdf_cache = PdfCache(app.config["PDF_CACHE_DIR"], app.config["PDF_CACHE_MAX_BYTES"])
+
+# Conversões das fotos para os ZIPs em paralelo (o Pillow libera o GIL ao decodificar/codificar)
+app.config["PHOTO_EXPORT_WORKERS"] = int(os.environ.get("PHOTO_EXPORT_WORKERS", os.cpu_count() or 1))
+photo_export_executor = ThreadPoolExecutor(max_workers=app.config["PHOTO_EXPORT_WORKERS"], thread_name_prefix="photo-export")
+
+# Versões reduzidas das fotos servidas por /api/inspection/<id>/photo/<rótulo> (cache em disco com LRU)
+app.config["PHOTO_VARIANT_CACHE_DIR"] = os.environ.get("PHOTO_VARIANT_CACHE_DIR", os.path.join(app.root_path, "cache", "photos"))
+app.config["PHOTO_VARIANT_CACHE_MAX_BYTES"] = int(os.environ.get("PHOTO_VARIANT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+app.config["PHOTO_CACHE_MAX_AGE"] = int(os.environ.get("PHOTO_CACHE_MAX_AGE", 24 * 3600))
+
+photo_variants = PhotoVariantCache(app.config["PHOTO_VARIANT_CACHE_DIR"], app.config["PHOTO_VARIANT_CACHE_MAX_BYTES"])
+
+# Exportações pesadas em segundo plano (estado persistido em disco, limpeza automática)
+app.config["EXPORT_JOBS_DIR"] = os.environ.get("EXPORT_JOBS_DIR", os.path.join(app.root_path, "cache", "exports"))
+app.config["EXPORT_JOB_WORKERS"] = int(os.environ.get("EXPORT_JOB_WORKERS", 2))
+app.config["EXPORT_JOB_MAX_AGE"] = int(os.environ.get("EXPORT_JOB_MAX_AGE", 24 * 3600))
+
+export_jobs = ExportJobManager(
+    app.config["EXPORT_JOBS_DIR"],
+    workers=app.config["EXPORT_JOB_WORKERS"],
+    max_age=app.config["EXPORT_JOB_MAX_AGE"]
+)
+
+
+def legacy_photos_in_use(cur, paths):
+    """Fotos antigas (arquivos soltos, sem photo_objects) de `paths` ainda citadas por alguma inspeção."""
+    if not paths:
+        return set()
+    placeholders = ", ".join(["%s"] * len(paths))
+    like_conditions = " OR ".join(["other_photos LIKE %s"] * len(paths))
+    cur.execute(f"""
+        SELECT jusante_photo, montante_photo, other_photos FROM inspections
+        WHERE jusante_photo IN ({placeholders}) OR montante_photo IN ({placeholders}) OR {like_conditions}
+    """, [*paths, *paths, *["%" + escape_like(path) + "%" for path in paths]])
+    referenced = {path for row in cur.fetchall() for path in inspection_photo_paths(row)}
+    return referenced & set(paths)
+
+
+def photo_still_referenced(path):
+    """Conferência final do reaper, feita com a foto já na lápide."""
+    with app.app_context(), db_cursor() as cur:
+        if photo_store.is_object(path):
+            cur.execute("SELECT 1 FROM photo_objects WHERE path=%s AND refcount > 0", [path])
+            return cur.fetchone() is not None
+        return bool(legacy_photos_in_use(cur, [path]))
+
+
+def reap_photos(batch):
+    """
+    Executado na thread do reaper: remove as fotos de inspeções excluídas.
+    Objetos deduplicados só saem do disco se o refcount chegou a zero; fotos
+    antigas, se nenhuma outra inspeção as cita. remove_upload confere de novo
+    com a foto já renomeada, para não perder um reenvio que chegou no meio.
+    """
+    paths = sorted({path for path, _ in batch if path})
+    objects = [path for path in paths if photo_store.is_object(path)]
+    legacy = [path for path in paths if not photo_store.is_object(path)]
+    in_use = set()
+    if paths:
+        with app.app_context(), db_transaction() as cur:
+            if objects:
+                placeholders = ", ".join(["%s"] * len(objects))
+                cur.execute(f"""
+                    SELECT path FROM photo_objects
+                    WHERE path IN ({placeholders}) AND refcount > 0 FOR UPDATE
+                """, objects)
+                in_use = {row['path'] for row in cur.fetchall()}
+                cur.execute(f"""
+                    DELETE FROM photo_objects WHERE path IN ({placeholders}) AND refcount = 0
+                """, objects)
+            in_use |= legacy_photos_in_use(cur, legacy)
+
+    freed = 0
+    for path, enqueued_at in batch:
+        if path not in in_use:
+            freed += remove_upload(path, not_modified_since=enqueued_at, still_referenced=photo_still_referenced)
+    logger.debug("Reaper: %d fotos processadas, %d bytes liberados", len(batch), freed)
+
+
+# Remoção das fotos de inspeções excluídas em segundo plano, limitada a REAPER_RATE arquivos/s
+app.config["REAPER_RATE"] = float(os.environ.get("REAPER_RATE", 50))
+app.config["REAPER_BATCH_SIZE"] = int(os.environ.get("REAPER_BATCH_SIZE", 100))
+
+file_reaper = FileReaper(
+    reap_photos,
+    rate=app.config["REAPER_RATE"],
+    batch_size=app.config["REAPER_BATCH_SIZE"]
+)
+
+# Exclusão de pastas em segundo plano: lotes de FOLDER_DELETE_BATCH_SIZE inspeções,
+# no máximo FOLDER_DELETE_RATE inspeções/s (ver FolderDeleter, criado junto das rotas de pastas)
+app.config["FOLDER_DELETE_BATCH_SIZE"] = int(os.environ.get("FOLDER_DELETE_BATCH_SIZE", 500))
+app.config["FOLDER_DELETE_RATE"] = float(os.environ.get("FOLDER_DELETE_RATE", 2000))
 
 
 
-def convert_dms_to_decimal(dms, ref):
-    """Converte coordenadas EXIF (Graus, Minutos, Segundos) para formato decimal."""
-    degrees = dms[0][0] / dms[0][1]
-    minutes = dms[1][0] / dms[1][1]
-    seconds = dms[2][0] / dms[2][1]
-    
-    decimal = degrees + (minutes / 60.0) + (seconds / 3600.0)
-    
-    if ref in ('S', 'W'):
-        decimal = -decimal
-    return f"{decimal:.6f}" # Retorna como string formatada
 
-def extract_gps_data(file_path):
+# ==============================================================================
+# FUNÇÕES AUXILIARES EXISTENTES
+# ==============================================================================
+
+def save_file(file):
     """
-    Extrai Latitude e Longitude de uma imagem usando dados EXIF.
-    Retorna (latitude_str, longitude_str) ou (None, None).
+    Salva um upload no armazenamento de fotos e retorna o caminho relativo.
+    Fotos idênticas são gravadas uma única vez (caminho derivado do SHA-256).
+    Os derivados ficam por conta de quem chamou (depois do commit).
     """
-    if not file_path:
-        print("DIAGNOSTICO GPS: Caminho do arquivo não fornecido.")
-        return None, None
-        
-    full_path = os.path.join(app.root_path, file_path)
-    if not os.path.exists(full_path):
-        print(f"DIAGNOSTICO GPS: Arquivo não encontrado no caminho: {full_path}")
-        return None, None
+    if file:
+        file.stream.seek(0)
+        return photo_store.put_stream(file.stream, file.filename)
+    return None
 
-    try:
-        img = Image.open(full_path)
-        exif_data = img.getexif() 
-        
-        if not exif_data:
-            print("DIAGNOSTICO GPS: NENHUM dado EXIF encontrado na imagem.")
-            return None, None
 
-        GPS_IFD_TAG = 34853 # ID da tag para o bloco GPS
-        
+def save_completed_upload(upload_id):
+    """
+    Move um upload em partes concluído para o armazenamento de fotos e retorna o caminho relativo.
+    O checksum já foi conferido no complete; a sessão só é descartada após o commit da inspeção.
+    """
+    data_path, original_name = upload_sessions.claim(upload_id)
+    session = upload_sessions.get(upload_id)
+    return photo_store.put_file(data_path, original_name, sha256=session['sha256'])
+
+
+def photo_source(file_field, upload_id_field):
+    """Retorna o arquivo enviado no multipart ou o id do upload em partes (ou None)."""
+    file = request.files.get(file_field)
+    if file and file.filename:
+        return file
+    return request.form.get(upload_id_field) or None
+
+
+def store_photo(source):
+    """Grava uma foto vinda do multipart (FileStorage) ou de um upload em partes (id)."""
+    with stage('save_file'):
+        if isinstance(source, str):
+            return save_completed_upload(source)
+        return save_file(source)
+
+
+def save_photo_sources(sources):
+    """
+    Grava em paralelo as fotos (FileStorage ou id de upload em partes) e
+    retorna os caminhos na mesma ordem. Uma fonte repetida (o mesmo campo do
+    multipart ou o mesmo upload) é gravada uma única vez: duas threads lendo
+    o mesmo stream misturariam o conteúdo. Se alguma falhar, propaga o erro;
+    as já gravadas vão para o reaper, que só as remove se nada as referencia.
+    """
+    def source_key(source):
+        return source if isinstance(source, str) else id(source)
+
+    unique = {}
+    for source in sources:
+        unique.setdefault(source_key(source), source)
+    save_futures = {key: upload_executor.submit(store_photo, source) for key, source in unique.items()}
+
+    saved = {}
+    save_error = None
+    for key, future in save_futures.items():
         try:
-            gps_info = exif_data.get_ifd(GPS_IFD_TAG)
-        except AttributeError:
-             gps_info = exif_data.get(GPS_IFD_TAG)
-        
-        if not gps_info:
-            print("DIAGNOSTICO GPS: Dados de GPS (Tag 34853) não encontrados (sem localização).")
-            return None, None
-            
-        GPS_LATITUDE_REF = 2 
-        GPS_LATITUDE = 1     
-        GPS_LONGITUDE_REF = 4 
-        GPS_LONGITUDE = 3    
+            saved[key] = future.result()
+        except Exception as e:
+            save_error = save_error or e
 
-        if all(tag in gps_info for tag in [GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE]):
-            
-            lat_dms_raw = gps_info.get(GPS_LATITUDE)
-            lon_dms_raw = gps_info.get(GPS_LONGITUDE)
-            lat_ref_raw = gps_info.get(GPS_LATITUDE_REF)
-            lon_ref_raw = gps_info.get(GPS_LONGITUDE_REF)
-
-            # LOGS MELHORADOS PARA VER TODOS OS DADOS BRUTOS (ajustado para o log atual)
-            print(f"DIAGNOSTICO GPS: Dados brutos de Lat DMS (Tag 1): {lat_dms_raw}") 
-            print(f"DIAGNOSTICO GPS: Dados brutos de Lat Ref (Tag 2): {lat_ref_raw}")
-            print(f"DIAGNOSTICO GPS: Dados brutos de Lon DMS (Tag 3): {lon_dms_raw}")
-            print(f"DIAGNOSTICO GPS: Dados brutos de Lon Ref (Tag 4): {lon_ref_raw}")
-            
-            # Validação principal: deve ser uma tupla de 3 elementos
-            if not isinstance(lat_dms_raw, tuple) or len(lat_dms_raw) < 3:
-                 print("DIAGNOSTICO GPS: Formato DMS inválido. O valor da Latitude (Tag 1) não é uma tupla de 3 elementos (Graus, Minutos, Segundos).")
-                 return None, None
-            
-            if not isinstance(lon_dms_raw, tuple) or len(lon_dms_raw) < 3:
-                 print("DIAGNOSTICO GPS: Formato DMS inválido. O valor da Longitude (Tag 3) não é uma tupla de 3 elementos.")
-                 return None, None
-            
-            # Se a validação passou, prossegue com a conversão
-            latitude = convert_dms_to_decimal(lat_dms_raw, lat_ref_raw)
-            longitude = convert_dms_to_decimal(lon_dms_raw, lon_ref_raw)
-            
-            print(f"DIAGNOSTICO GPS: CONVERSÃO SUCESSO. Lat: {latitude}, Lon: {longitude}")
-            return latitude, longitude
-            
+    if save_error:
+        file_reaper.enqueue(saved.values())
+        raise save_error
+
+    return [saved[source_key(source)] for source in sources]
+
+
+def create_derivatives_safe(relative_path):
+    """
+    Gera os derivados reduzidos para PDF e dashboard (o original é mantido), sem propagar erros.
+    Retorna True se algum derivado novo foi criado.
+    """
+    try:
+        return bool(create_derivatives(relative_path))
     except Exception as e:
-        print(f"DIAGNOSTICO GPS: ERRO FATAL durante a extração: {e}")
-        return None, None
-        
-    print("DIAGNOSTICO GPS: Extração falhou por motivo desconhecido.")
-    return None, None
+        logger.warning("Não foi possível gerar os derivados de %s: %s", relative_path, e)
+        return False
+
+
+def create_inspection_derivatives(inspections):
+    """
+    Executado no derivative_executor após o commit: gera os derivados das fotos
+    de cada (inspection_id, caminhos) e registra uma alteração das inspeções
+    que ganharam derivados novos. Assim o ETag do dashboard muda e os clientes
+    trocam o original pela miniatura (e o PdfCache passa a usar o 'print').
+    """
+    updated = [inspection_id for inspection_id, paths in inspections
+               if any([create_derivatives_safe(path) for path in paths])]
+    if not updated:
+        return
+    try:
+        with app.app_context(), db_transaction() as cur:
+            # Só as que ainda existem (a inspeção pode ter sido excluída enquanto isso)
+            placeholders = ", ".join(["%s"] * len(updated))
+            cur.execute(f"SELECT id, folder_id FROM inspections WHERE id IN ({placeholders}) LOCK IN SHARE MODE", updated)
+            record_changes(cur, [('inspection', row['id'], row['folder_id'], 'upsert') for row in cur.fetchall()])
+    except Exception as e:
+        logger.warning("Não foi possível registrar os derivados das inspeções %s: %s", updated, e)
+
+
+def zip_response(entries, download_name):
+    """Envia um ZIP em streaming, montado entrada por entrada a partir de `entries`."""
+    # Os dados já foram lidos; não segura a conexão do pool durante o streaming
+    release_db()
+    return app.response_class(
+        stream_with_context(stream_zip(entries)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment;filename={download_name}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 # ==============================================================================
-# FUNÇÕES AUXILIARES EXISTENTES
+# ROTAS DO DASHBOARD 
 # ==============================================================================
 
-def generate_single_pdf(pdf, inspection_data):
-    """Preenche o objeto FPDF com os dados de uma única inspeção."""
-    if FPDF is None:
-        raise ImportError("FPDF (fpdf2) library not available.")
-        
-    pdf.add_page()
-    
-    # Define XPos e YPos para compatibilidade
+DASHBOARD_PAGE_SIZE = 100
+DASHBOARD_MAX_PAGE_SIZE = 500
+DASHBOARD_FORMATS = ('rows', 'columnar')
+
+
+def encode_cursor(created_at, inspection_id):
+    """Gera um cursor opaco a partir da chave (created_at, id) do último registro da página."""
+    raw = json.dumps([created_at.isoformat(), inspection_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Converte o cursor opaco de volta para (created_at, id). Lança ValueError se inválido."""
     try:
-        from fpdf import XPos, YPos
-    except ImportError:
-        class XPos: LMARGIN = 'L'
-        class YPos: NEXT = 'Y'
-
-    # --- Conteúdo do PDF ---
-    pdf.set_font("Arial", style='B', size=16)
-    pdf.cell(0, 10, text="Relatório de Inspeção", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-    pdf.set_font("Arial", size=12)
-    pdf.ln(5)
-    
-    pdf.cell(0, 7, text=f"ID do Registro: #{str(inspection_data['id'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    pdf.cell(0, 7, text=f"Pasta: {str(inspection_data['folder_name'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    pdf.cell(0, 7, text=f"Nome: {str(inspection_data['name'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    
-    created_at = inspection_data.get('created_at')
-    if created_at and hasattr(created_at, 'strftime'):
-         created_at_str = created_at.strftime('%d/%m/%Y %H:%M')
-    else:
-         created_at_str = str(created_at)
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at_str, inspection_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at_str), int(inspection_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
 
-    pdf.cell(0, 7, text=f"Data: {created_at_str}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
-    # NOVO: Inclusão de Geolocation no PDF
-    latitude = inspection_data.get('latitude')
-    longitude = inspection_data.get('longitude')
-    
-    if latitude and longitude and latitude != 'None' and longitude != 'None':
-        pdf.ln(5)
-        pdf.set_font("Arial", style='B', size=12)
-        pdf.cell(0, 7, text="Localização (GPS):", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        pdf.set_font("Arial", size=12)
-        pdf.cell(0, 7, text=f"Latitude: {latitude}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        pdf.cell(0, 7, text=f"Longitude: {longitude}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-    pdf.ln(5) # Linha adicionada para consistência
-    
-    pdf.set_font("Arial", style='B', size=12)
-    pdf.cell(0, 7, text="Dimensões:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    pdf.set_font("Arial", size=12)
-    dim_text = f"Valor: {str(inspection_data['dimensions_value'])} {str(inspection_data['dimensions_unit'])}"
-    pdf.cell(0, 7, text=dim_text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-
-    pdf.ln(5)
-    pdf.set_font("Arial", style='B', size=12)
-    pdf.cell(0, 7, text="Observações:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 5, text=str(inspection_data['observations'] or 'N/A'))
-    pdf.ln(5)
-
-    pdf.set_font("Arial", style='B', size=12)
-    pdf.cell(0, 7, text="Fotos:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    pdf.ln(2)
-    
-    photo_paths = [
-        ("Foto Jusante", inspection_data['jusante_photo']),
-        ("Foto Montante", inspection_data['montante_photo'])
-    ]
-    
-    other_photos = json.loads(inspection_data['other_photos']) if inspection_data['other_photos'] else []
-    for i, path in enumerate(other_photos):
-        photo_paths.append((f"Outra Foto {i+1}", path))
-        
-    for label, path in photo_paths:
-        if not path:
-            continue
+def encode_value_cursor(value, inspection_id):
+    """Cursor opaco para listas ordenadas por um valor numérico (distância, relevância) e pelo id."""
+    raw = json.dumps([value, inspection_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-        full_path = os.path.join(app.root_path, path)
-        pdf.set_font("Arial", style='B', size=10)
-        pdf.cell(0, 5, text=f"{label}:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-        
-        if os.path.exists(full_path):
-            try:
-                pdf.image(full_path, w=80) 
-                pdf.ln(5)
-            except Exception as img_e:
-                 print(f"ERRO DE IMAGEM (FATAL): Falha ao carregar a imagem '{label}' no caminho '{full_path}'. Erro: {img_e}")
-                 
-                 pdf.set_text_color(255, 0, 0) # Red
-                 pdf.set_font("Arial", size=10)
-                 pdf.cell(0, 5, text=f"Erro: Não foi possível carregar {label}. Verifique o formato (JPEG, PNG).", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-                 pdf.set_text_color(0, 0, 0) # Black
-                 pdf.ln(5)
-        else:
-            pdf.set_font("Arial", size=10)
-            pdf.cell(0, 5, text="Caminho do arquivo não encontrado.", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-            pdf.ln(5)
 
+def decode_value_cursor(cursor):
+    """Converte o cursor opaco de volta para (valor, id). Lança ValueError se inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, inspection_id = json.loads(base64.urlsafe_b64decode(padded))
+        return float(value), int(inspection_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
 
-def save_file(file):
-    if file:
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        base, ext = os.path.splitext(filename)
-        safe_filename = f"{base}_{timestamp}{ext}"
-        
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
-        file.save(file_path)
-        return f"static/uploads/{safe_filename}"
-    return None
 
-# ==============================================================================
-# ROTAS DO DASHBOARD 
-# ==============================================================================
+def encode_id_cursor(inspection_id):
+    """Cursor opaco para listas ordenadas só pelo id."""
+    raw = json.dumps([inspection_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-@app.route("/api/dashboard")
-def dashboard_api():
-    """Retorna a lista de pastas e inspeções para o dashboard (GET)."""
-    cur = mysql.connection.cursor()
-    
-    cur.execute("SELECT id, name FROM folders ORDER BY name")
-    folders = cur.fetchall()
 
-    # Inclui 'latitude' e 'longitude' na seleção
+def decode_id_cursor(cursor):
+    """Converte o cursor opaco de volta para o id. Lança ValueError se inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        inspection_id, = json.loads(base64.urlsafe_b64decode(padded))
+        return int(inspection_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def parse_date_param(value, end_of_day=False):
+    """
+    Converte um parâmetro de data (AAAA-MM-DD ou ISO completo) para datetime.
+    Datas sem hora usadas como limite final avançam para o dia seguinte (limite exclusivo).
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Data inválida: {value}")
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def escape_like(value):
+    """Escapa os curingas do LIKE para buscas por prefixo."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def with_thumbnail(row):
+    """Troca o caminho da foto jusante pela URL da miniatura usada nas listas."""
+    jusante_photo = row.pop('jusante_photo', None)
+    row['thumbnail'] = f"/{resolve_photo(jusante_photo, 'thumb')}" if jusante_photo else None
+    return row
+
+
+def thumbnail_base():
+    """Prefixo comum das URLs das miniaturas (omitido no formato colunar)."""
+    return f"/{photo_store.base_dir.strip('/')}/"
+
+
+def fetch_folder_summary(cur):
+    """Lista as pastas com a contagem de inspeções e a data da mais recente (calculadas no SQL)."""
     cur.execute("""
+        SELECT 
+            f.id, f.name,
+            COUNT(i.id) AS inspection_count,
+            MAX(i.created_at) AS latest_created_at
+        FROM folders f
+        LEFT JOIN inspections i ON i.folder_id = f.id
+        WHERE f.status = 'active'
+        GROUP BY f.id, f.name
+        ORDER BY f.name
+    """)
+    return cur.fetchall()
+
+
+def inspection_filters(folder_id=None, date_from=None, date_to=None, name_prefix=None):
+    """Monta as condições WHERE (e parâmetros) dos filtros de inspeções."""
+    conditions = []
+    params = []
+
+    if folder_id is not None:
+        conditions.append("i.folder_id = %s")
+        params.append(folder_id)
+    if date_from is not None:
+        conditions.append("i.created_at >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("i.created_at < %s")
+        params.append(date_to)
+    if name_prefix:
+        conditions.append("i.name LIKE %s")
+        params.append(escape_like(name_prefix) + "%")
+    return conditions, params
+
+
+def fetch_inspections_page(cur, folder_id=None, date_from=None, date_to=None,
+                           name_prefix=None, cursor=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    Busca uma página de inspeções ordenada por (created_at, id) decrescente.
+    Retorna (inspections, next_cursor); next_cursor é None na última página.
+    """
+    conditions, params = inspection_filters(folder_id, date_from, date_to, name_prefix)
+
+    if cursor is not None:
+        cursor_created_at, cursor_id = cursor
+        conditions.append("(i.created_at < %s OR (i.created_at = %s AND i.id < %s))")
+        params.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # Busca um registro a mais para saber se existe uma próxima página
+    cur.execute(f"""
         SELECT 
             i.id, i.name, i.created_at, i.dimensions_value, i.dimensions_unit, 
-            i.latitude, i.longitude,
+            i.latitude, i.longitude, i.folder_id, i.jusante_photo,
             f.name AS folder_name
         FROM inspections i
-        JOIN folders f ON i.folder_id = f.id
-        ORDER BY i.created_at DESC
-    """)
-    inspections = cur.fetchall()
-    cur.close()
+        JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+        {where_clause}
+        ORDER BY i.created_at DESC, i.id DESC
+        LIMIT %s
+    """, params + [limit + 1])
+    inspections = list(cur.fetchall())
+
+    next_cursor = None
+    if len(inspections) > limit:
+        inspections = inspections[:limit]
+        last = inspections[-1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+
+    return [with_thumbnail(row) for row in inspections], next_cursor
+
+
+# Acima deste número de alterações o cliente deve refazer a carga completa
+DELTA_MAX_CHANGES = 5000
+
+
+def current_change_token(cur):
+    """Retorna (token, changed_at) da alteração mais recente, ou (0, None) se não houver."""
+    cur.execute("SELECT seq, changed_at FROM change_log ORDER BY seq DESC, id DESC LIMIT 1")
+    row = cur.fetchone()
+    if not row:
+        return 0, None
+    return row['seq'], row['changed_at'].replace(tzinfo=timezone.utc)
+
+
+def not_modified(etag, last_modified):
+    """Verifica If-None-Match / If-Modified-Since da requisição atual."""
+    if request.if_none_match:
+        # Comparação fraca: o ETag vira W/"..." quando a resposta é comprimida
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
 
-    return jsonify(folders=folders, inspections=inspections)
+
+def with_cache_headers(response, etag, last_modified):
+    """Adiciona ETag, Last-Modified e Cache-Control à resposta do dashboard."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def fetch_changes_since(cur, since):
+    """
+    Monta a resposta incremental a partir do change_log.
+    Retorna None se houver alterações demais (o cliente deve refazer a carga completa).
+    """
+    cur.execute("""
+        SELECT id, entity, entity_id, folder_id, action
+        FROM change_log
+        WHERE seq > %s
+        ORDER BY seq, id
+        LIMIT %s
+    """, [since, DELTA_MAX_CHANGES + 1])
+    rows = cur.fetchall()
+    if len(rows) > DELTA_MAX_CHANGES:
+        return None
+
+    # A última ação de cada entidade prevalece
+    latest = {}
+    affected_folders = set()
+    for row in rows:
+        latest[(row['entity'], row['entity_id'])] = row['action']
+        if row['entity'] == 'folder':
+            affected_folders.add(row['entity_id'])
+        elif row['folder_id'] is not None:
+            affected_folders.add(row['folder_id'])
+
+    upserted_inspections = [eid for (entity, eid), action in latest.items() if entity == 'inspection' and action == 'upsert']
+    deleted_inspections = [eid for (entity, eid), action in latest.items() if entity == 'inspection' and action == 'delete']
+    deleted_folders = [eid for (entity, eid), action in latest.items() if entity == 'folder' and action == 'delete']
+    affected_folders -= set(deleted_folders)
+
+    inspections = []
+    if upserted_inspections:
+        placeholders = ", ".join(["%s"] * len(upserted_inspections))
+        cur.execute(f"""
+            SELECT 
+                i.id, i.name, i.created_at, i.dimensions_value, i.dimensions_unit, 
+                i.latitude, i.longitude, i.folder_id, i.jusante_photo,
+                f.name AS folder_name
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE i.id IN ({placeholders})
+            ORDER BY i.created_at DESC, i.id DESC
+        """, upserted_inspections)
+        inspections = [with_thumbnail(row) for row in cur.fetchall()]
+
+    folders = []
+    if affected_folders:
+        placeholders = ", ".join(["%s"] * len(affected_folders))
+        cur.execute(f"""
+            SELECT 
+                f.id, f.name,
+                COUNT(i.id) AS inspection_count,
+                MAX(i.created_at) AS latest_created_at
+            FROM folders f
+            LEFT JOIN inspections i ON i.folder_id = f.id
+            WHERE f.id IN ({placeholders}) AND f.status = 'active'
+            GROUP BY f.id, f.name
+            ORDER BY f.name
+        """, list(affected_folders))
+        folders = cur.fetchall()
+
+    return {
+        "folders": folders,
+        "inspections": inspections,
+        "deleted_folders": deleted_folders,
+        "deleted_inspections": deleted_inspections,
+    }
+
+
+@app.route("/api/dashboard")
+def dashboard_api():
+    """
+    Retorna o resumo das pastas e uma página de inspeções para o dashboard (GET).
+
+    Parâmetros opcionais: folder_id, date_from, date_to, name (prefixo),
+    cursor (retornado em next_cursor) e limit.
+    O resumo das pastas só é enviado na primeira página (sem cursor).
+
+    Com since=<change_token> retorna apenas o que mudou depois do token,
+    incluindo os ids excluídos. Responde 304 quando nada mudou (ETag/Last-Modified).
+
+    format=columnar envia pastas e inspeções em colunas ({campo: [valores]}),
+    com folder_names no lugar do folder_name repetido, GPS numérico e
+    miniaturas relativas a thumbnail_base (ver columnar.compact_dashboard).
+    """
+    dashboard_format = request.args.get('format', 'rows')
+    if dashboard_format not in DASHBOARD_FORMATS:
+        return jsonify(success=False, message=f"Formato inválido. Use: {', '.join(DASHBOARD_FORMATS)}"), 400
+
+    try:
+        since = request.args.get('since', type=int)
+        folder_id = request.args.get('folder_id', type=int)
+        date_from = parse_date_param(request.args.get('date_from'))
+        date_to = parse_date_param(request.args.get('date_to'), end_of_day=True)
+        name_prefix = request.args.get('name', '').strip()
+        cursor_param = request.args.get('cursor')
+        cursor = decode_cursor(cursor_param) if cursor_param else None
+        limit = request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    limit = max(1, min(limit, DASHBOARD_MAX_PAGE_SIZE))
+
+    with db_cursor() as cur:
+        change_token, last_modified = current_change_token(cur)
+        etag = f"{change_token}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+        if not_modified(etag, last_modified):
+            return with_cache_headers(app.response_class(status=304), etag, last_modified)
+
+        if since is not None:
+            changes = fetch_changes_since(cur, since)
+            if changes is None:
+                response = jsonify(full_resync=True, change_token=change_token)
+            elif dashboard_format == 'columnar':
+                changes.update(compact_dashboard(changes['folders'], changes['inspections'], thumbnail_base()))
+                response = jsonify(full_resync=False, change_token=change_token, format='columnar', **changes)
+            else:
+                response = jsonify(full_resync=False, change_token=change_token, **changes)
+            return with_cache_headers(response, etag, last_modified)
+
+        folders = fetch_folder_summary(cur) if cursor is None else None
+
+        inspections, next_cursor = fetch_inspections_page(
+            cur, folder_id=folder_id, date_from=date_from, date_to=date_to,
+            name_prefix=name_prefix, cursor=cursor, limit=limit
+        )
+
+    if dashboard_format == 'columnar':
+        response = jsonify(
+            format='columnar', next_cursor=next_cursor, change_token=change_token,
+            **compact_dashboard(folders, inspections, thumbnail_base())
+        )
+    else:
+        response = jsonify(
+            folders=folders, inspections=inspections,
+            next_cursor=next_cursor, change_token=change_token
+        )
+    return with_cache_headers(response, etag, last_modified)
+
+
+@app.route("/api/folders")
+def folders_summary_api():
+    """Retorna apenas o resumo das pastas (id, nome, quantidade e última inspeção) (GET)."""
+    with db_cursor() as cur:
+        folders = fetch_folder_summary(cur)
+
+    return jsonify(folders=folders)
 
 
 @app.route("/api/folder", methods=["POST"])
@@ -275,40 +678,169 @@ def create_folder_api():
     if not folder_name:
         return jsonify(success=False, message="Nome da pasta é obrigatório"), 400
         
-    cur = mysql.connection.cursor()
-    
-    cur.execute("SELECT id FROM folders WHERE name = %s", [folder_name])
-    if cur.fetchone():
-        cur.close()
-        return jsonify(success=False, message="Pasta já existe"), 409
-        
-    cur.execute("INSERT INTO folders (name) VALUES (%s)", [folder_name])
-    mysql.connection.commit()
-    cur.close()
+    with db_transaction() as cur:
+        cur.execute("SELECT id FROM folders WHERE name = %s AND status = 'active'", [folder_name])
+        if cur.fetchone():
+            return jsonify(success=False, message="Pasta já existe"), 409
+            
+        cur.execute("INSERT INTO folders (name) VALUES (%s)", [folder_name])
+        record_change(cur, 'folder', cur.lastrowid, 'upsert')
     
     return jsonify(success=True, message="Pasta criada com sucesso")
 
 
-@app.route("/api/folder/delete/<int:folderId>")
+def delete_folder_batch(folder_id, batch_size):
+    """
+    Executado na thread do FolderDeleter: exclui um lote de inspeções da pasta
+    numa transação curta (locks só nessas linhas). Com a pasta vazia, exclui a
+    própria pasta. Retorna (inspeções excluídas, concluída).
+    """
+    photo_paths = []
+    with app.app_context(), db_transaction() as cur:
+        cur.execute("""
+            SELECT id, jusante_photo, montante_photo, other_photos
+            FROM inspections WHERE folder_id=%s
+            LIMIT %s FOR UPDATE
+        """, [folder_id, batch_size])
+        rows = cur.fetchall()
+
+        if not rows:
+            cur.execute("DELETE FROM folders WHERE id=%s AND status='deleting'", [folder_id])
+        else:
+            ids = [row['id'] for row in rows]
+            photo_paths = [path for row in rows for path in inspection_photo_paths(row)]
+            placeholders = ", ".join(["%s"] * len(ids))
+            cur.execute(f"DELETE FROM inspections WHERE id IN ({placeholders})", ids)
+            cur.execute("UPDATE folders SET delete_done = delete_done + %s WHERE id=%s", [len(ids), folder_id])
+            photo_store.release(cur, photo_paths)
+            # Tombstones para a sincronização incremental
+            record_changes(cur, [('inspection', inspection_id, folder_id, 'delete') for inspection_id in ids])
+
+    file_reaper.enqueue(photo_paths)
+    return len(rows), not rows
+
+
+def pending_folder_deletes():
+    """Pastas que ficaram marcadas como 'deleting' (ex.: servidor reiniciado no meio da exclusão)."""
+    with app.app_context(), db_cursor() as cur:
+        cur.execute("SELECT id FROM folders WHERE status='deleting' ORDER BY delete_requested_at")
+        return [row['id'] for row in cur.fetchall()]
+
+
+FOLDER_RESUME_LOCK = "campo_manager.folder_delete_resume"
+
+
+@contextmanager
+def folder_resume_lock():
+    """
+    Lock consultivo do MySQL (GET_LOCK, sem espera) para que só um processo do
+    servidor retome as exclusões pendentes. Fica preso à conexão deste contexto
+    até o fim da retomada. Produz True se obteve o lock.
+    """
+    with app.app_context(), db_cursor() as cur:
+        cur.execute("SELECT GET_LOCK(%s, 0) AS acquired", [FOLDER_RESUME_LOCK])
+        acquired = cur.fetchone()['acquired'] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cur.execute("SELECT RELEASE_LOCK(%s)", [FOLDER_RESUME_LOCK])
+
+
+folder_deleter = FolderDeleter(
+    delete_folder_batch,
+    batch_size=app.config["FOLDER_DELETE_BATCH_SIZE"],
+    rate=app.config["FOLDER_DELETE_RATE"],
+    resume=pending_folder_deletes,
+    resume_lock=folder_resume_lock
+)
+
+
+def folder_delete_status(folder):
+    """Progresso da exclusão de uma pasta marcada como 'deleting'."""
+    return {
+        'status': 'deleting',
+        'done': folder['delete_done'],
+        'total': folder['delete_total'],
+        'requested_at': folder['delete_requested_at'],
+    }
+
+
+@app.route("/api/folder/<int:folderId>", methods=["DELETE"])
 def delete_folder_api(folderId):
-    """Exclui uma pasta e todos os registros de inspeção associados a ela (GET)."""
-    cur = mysql.connection.cursor()
-    
-    cur.execute("DELETE FROM inspections WHERE folder_id=%s", [folderId])
-    cur.execute("DELETE FROM folders WHERE id=%s", [folderId])
-    
-    mysql.connection.commit()
-    cur.close()
-    
-    return jsonify(success=True, message="Pasta e registros excluídos com sucesso")
+    """
+    Exclui uma pasta e todos os registros de inspeção associados a ela (DELETE).
+    A pasta é marcada como 'deleting' e deixa de aparecer imediatamente; as
+    inspeções são excluídas em segundo plano, em lotes. Responde 202 com o
+    progresso, acompanhado em /api/folder/<id>/delete-status.
+    """
+    with db_transaction() as cur:
+        cur.execute("""
+            SELECT id, status, delete_total, delete_done, delete_requested_at
+            FROM folders WHERE id=%s FOR UPDATE
+        """, [folderId])
+        folder = cur.fetchone()
+        if not folder:
+            return jsonify(success=False, message="Pasta não encontrada"), 404
+
+        if folder['status'] == 'active':
+            cur.execute("SELECT COUNT(*) AS total FROM inspections WHERE folder_id=%s", [folderId])
+            total = cur.fetchone()['total']
+            cur.execute("""
+                UPDATE folders
+                SET status='deleting', delete_requested_at=UTC_TIMESTAMP(), delete_total=%s, delete_done=0
+                WHERE id=%s
+            """, [total, folderId])
+            record_change(cur, 'folder', folderId, 'delete')
+            cur.execute("""
+                SELECT id, status, delete_total, delete_done, delete_requested_at
+                FROM folders WHERE id=%s
+            """, [folderId])
+            folder = cur.fetchone()
+
+    pdf_cache.invalidate_folder(folderId)
+    folder_deleter.submit(folderId)
+
+    return jsonify(
+        success=True, message="Exclusão da pasta iniciada",
+        status_url=f"/api/folder/{folderId}/delete-status", **folder_delete_status(folder)
+    ), 202
+
+
+@app.route("/api/folder/<int:folderId>/delete-status")
+def folder_delete_status_api(folderId):
+    """Progresso da exclusão de uma pasta: deleting (com done/total), deleted ou active (GET)."""
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT id, status, delete_total, delete_done, delete_requested_at
+            FROM folders WHERE id=%s
+        """, [folderId])
+        folder = cur.fetchone()
+        if folder is None:
+            cur.execute("""
+                SELECT 1 FROM change_log
+                WHERE entity='folder' AND entity_id=%s AND action='delete' LIMIT 1
+            """, [folderId])
+            if not cur.fetchone():
+                return jsonify(success=False, message="Pasta não encontrada"), 404
+
+    if folder is None:
+        return jsonify(success=True, status='deleted')
+    if folder['status'] == 'active':
+        return jsonify(success=True, status='active')
+    return jsonify(success=True, **folder_delete_status(folder))
 
 
 @app.route("/api/add", methods=["POST"])
 def add_record_api():
-    """Adiciona um novo registro de inspeção com upload de arquivos (POST)."""
+    """
+    Adiciona um novo registro de inspeção com upload de arquivos (POST).
+    As fotos podem vir no multipart ou como ids de uploads em partes concluídos
+    (jusante_upload_id, montante_upload_id, outras_upload_ids).
+    """
+    saved_paths = []
+    committed = False
     try:
-        cur = mysql.connection.cursor()
-        
         # Dados de texto
         folder_id = request.form.get('folder_id')
         name = request.form.get('name')
@@ -316,94 +848,749 @@ def add_record_api():
         dim_unit = request.form.get('dim_unit')
         obs = request.form.get('obs')
 
-        # Salvar arquivos principais (obrigatórios)
-        foto_jusante_file = request.files.get('foto_jusante')
-        foto_montante_file = request.files.get('foto_montante')
+        # Arquivos principais (obrigatórios) e outras fotos (opcional, lista).
+        # Cada foto vem como arquivo no multipart ou como id de um upload em partes já concluído.
+        foto_jusante = photo_source('foto_jusante', 'jusante_upload_id')
+        foto_montante = photo_source('foto_montante', 'montante_upload_id')
+        outras_fotos = [f for f in request.files.getlist('outras_fotos') if f and f.filename]
+        outras_fotos += [u for u in request.form.getlist('outras_upload_ids') if u]
 
-        jusante_path = save_file(foto_jusante_file)
-        montante_path = save_file(foto_montante_file)
-        
-        if not jusante_path or not montante_path:
-            # Reverte o upload se um dos arquivos principais falhar
-            if jusante_path and os.path.exists(os.path.join(app.root_path, jusante_path)): 
-                os.remove(os.path.join(app.root_path, jusante_path))
-            if montante_path and os.path.exists(os.path.join(app.root_path, montante_path)): 
-                os.remove(os.path.join(app.root_path, montante_path))
+        if not foto_jusante or not foto_montante:
             return jsonify(success=False, message="Fotos Jusante e Montante são obrigatórias"), 400
 
-        # NOVO: Extrair localização do arquivo jusante
-        latitude, longitude = extract_gps_data(jusante_path)
+        photo_sources = [foto_jusante, foto_montante] + outras_fotos
+        upload_ids = [source for source in photo_sources if isinstance(source, str)]
+        try:
+            for upload_id in upload_ids:
+                upload_sessions.claim(upload_id)
+        except UploadError as e:
+            return jsonify(success=False, message=e.message), e.status
+
+        # Confere a pasta antes de gravar as fotos (conferida de novo, com lock, na transação)
+        with db_cursor() as cur:
+            cur.execute("SELECT id FROM folders WHERE id = %s AND status = 'active'", [folder_id])
+            folder_exists = cur.fetchone() is not None
+        release_db()
+        if not folder_exists:
+            return jsonify(success=False, message="Pasta não encontrada"), 404
+
+        # Localização lida do EXIF da foto jusante ainda em memória (sem reabrir do disco)
+        latitude, longitude = (None, None)
+        if not isinstance(foto_jusante, str):
+            latitude, longitude = extract_gps_from_upload(foto_jusante)
 
-        # Log dos valores de DB (para diagnóstico)
-        print(f"DIAGNOSTICO ADD: Valores finais de GPS antes do DB: Lat: {latitude}, Lon: {longitude}")
+        # Grava todas as fotos em paralelo; os derivados são gerados depois do commit
+        saved_paths = save_photo_sources(photo_sources)
 
+        jusante_path, montante_path = saved_paths[0], saved_paths[1]
+        other_photos_paths = saved_paths[2:]
 
-        # Salvar outras fotos (opcional, lista)
-        outras_fotos_files = request.files.getlist('outras_fotos')
-        other_photos_paths = [save_file(f) for f in outras_fotos_files if f and f.filename]
+        if isinstance(foto_jusante, str):
+            latitude, longitude = extract_gps_data(jusante_path)
 
         # Inserir no banco de dados. NOVOS CAMPOS: latitude, longitude
-        cur.execute("""
-            INSERT INTO inspections (
-                folder_id, name, dimensions_value, dimensions_unit, 
-                observations, jusante_photo, montante_photo, other_photos,
-                latitude, longitude
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            folder_id, name, dim_value, dim_unit, 
-            obs, jusante_path, montante_path, json.dumps(other_photos_paths),
-            latitude, longitude # NOVOS VALORES
-        ))
-        
-        mysql.connection.commit()
-        cur.close()
+        with db_transaction() as cur:
+            # Lock compartilhado: a pasta não pode ser marcada para exclusão durante a inserção
+            cur.execute("SELECT id FROM folders WHERE id = %s AND status = 'active' LOCK IN SHARE MODE", [folder_id])
+            if not cur.fetchone():
+                # Pasta marcada para exclusão enquanto as fotos eram gravadas
+                file_reaper.enqueue(saved_paths)
+                return jsonify(success=False, message="Pasta não encontrada"), 404
+
+            cur.execute("""
+                INSERT INTO inspections (
+                    folder_id, name, dimensions_value, dimensions_unit, 
+                    observations, jusante_photo, montante_photo, other_photos,
+                    latitude, longitude, gps_lat, gps_lon
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                folder_id, name, dim_value, dim_unit, 
+                obs, jusante_path, montante_path, json.dumps(other_photos_paths),
+                latitude, longitude, *gps_numeric(latitude, longitude)
+            ))
+            inspection_id = cur.lastrowid
+            photo_store.acquire(cur, saved_paths)
+            record_change(cur, 'inspection', inspection_id, 'upsert', folder_id=folder_id)
+        committed = True
+
+        # Os arquivos já foram copiados para o armazenamento de fotos; encerra as sessões de upload
+        for upload_id in upload_ids:
+            upload_sessions.discard(upload_id)
+
+        # Derivados fora do caminho da requisição (leitores usam o original enquanto não existirem)
+        derivative_executor.submit(create_inspection_derivatives, [(inspection_id, saved_paths)])
         
         return jsonify(success=True, message="Registro criado com sucesso")
 
+    except PoolTimeout:
+        # Respondido com 503 pelo pool_timeout_handler
+        if not committed:
+            file_reaper.enqueue(saved_paths)
+        raise
     except Exception as e:
-        mysql.connection.rollback()
-        print(f"Erro ao adicionar registro: {e}")
+        logger.error("Erro ao adicionar registro: %s", e)
+        # Fotos gravadas sem inspeção: o reaper as remove se nada mais as referencia
+        if not committed:
+            file_reaper.enqueue(saved_paths)
         return jsonify(success=False, message=f"Erro no servidor: {str(e)}"), 500
 
 
+BULK_MAX_ITEMS = 500
+# Campos de texto obrigatórios de cada item do lote (colunas NOT NULL)
+BULK_REQUIRED_FIELDS = ('name', 'dim_value', 'dim_unit')
+
+
+def bulk_item_sources(item):
+    """
+    Resolve as fotos de um item do manifesto: cada foto é o nome de um campo
+    de arquivo do multipart (jusante_file, montante_file, outras_files) ou o id
+    de um upload em partes (jusante_upload_id, montante_upload_id, outras_upload_ids).
+    """
+    def source(file_key, upload_key):
+        field = item.get(file_key)
+        if field:
+            file = request.files.get(field)
+            return file if file and file.filename else None
+        return item.get(upload_key) or None
+
+    jusante = source('jusante_file', 'jusante_upload_id')
+    montante = source('montante_file', 'montante_upload_id')
+    outras = [request.files.get(field) for field in item.get('outras_files') or []]
+    outras = [f for f in outras if f and f.filename]
+    outras += [u for u in item.get('outras_upload_ids') or [] if u]
+    return jusante, montante, outras
+
+
+@app.route("/api/bulk", methods=["POST"])
+def bulk_add_records_api():
+    """
+    Ingestão em lote de inspeções coletadas offline (POST).
+
+    O campo `manifest` (multipart) ou o corpo JSON traz {"items": [...]}; cada item
+    tem idempotency_key, folder_id, name, dim_value, dim_unit, obs e as referências
+    das fotos (ver bulk_item_sources). Todas as inspeções novas entram numa única
+    transação com executemany; itens já recebidos (mesma chave) são devolvidos
+    como 'duplicate'. A resposta traz o resultado de cada item.
+    """
+    try:
+        manifest = json.loads(request.form['manifest']) if 'manifest' in request.form else request.get_json(silent=True)
+        items = manifest.get('items') if isinstance(manifest, dict) else None
+    except ValueError:
+        items = None
+    if not isinstance(items, list) or not items:
+        return jsonify(success=False, message="Manifesto inválido"), 400
+    if len(items) > BULK_MAX_ITEMS:
+        return jsonify(success=False, message=f"Máximo de {BULK_MAX_ITEMS} itens por lote"), 413
+
+    results = []
+    for i, item in enumerate(items):
+        key = item.get('idempotency_key') if isinstance(item, dict) else None
+        if isinstance(key, int) and not isinstance(key, bool):
+            # client_key é VARCHAR: 123 e "123" são a mesma chave
+            key = str(key)
+        elif not isinstance(key, str):
+            key = None
+        results.append({'index': i, 'idempotency_key': key})
+
+    def fail(index, message):
+        results[index].update(status='error', message=message)
+
+    keys = list(dict.fromkeys(r['idempotency_key'] for r in results if r['idempotency_key']))
+    folder_ids = {item.get('folder_id') for item in items if isinstance(item, dict) and item.get('folder_id')}
+
+    with db_cursor() as cur:
+        existing = {}
+        if keys:
+            placeholders = ", ".join(["%s"] * len(keys))
+            cur.execute(f"SELECT id, client_key FROM inspections WHERE client_key IN ({placeholders})", keys)
+            existing = {row['client_key']: row['id'] for row in cur.fetchall()}
+        valid_folders = set()
+        if folder_ids:
+            placeholders = ", ".join(["%s"] * len(folder_ids))
+            cur.execute(f"SELECT id FROM folders WHERE id IN ({placeholders}) AND status = 'active'", list(folder_ids))
+            valid_folders = {str(row['id']) for row in cur.fetchall()}
+
+    # Validação por item; só os itens novos e válidos seguem para a gravação
+    pending = []
+    seen_keys = {}
+    repeated = []
+    for i, item in enumerate(items):
+        key = results[i]['idempotency_key']
+        if not isinstance(item, dict):
+            fail(i, "Item inválido")
+            continue
+        if not key or len(key) > 64:
+            fail(i, "idempotency_key é obrigatório (até 64 caracteres)")
+            continue
+        if key in existing:
+            results[i].update(status='duplicate', inspection_id=existing[key])
+            continue
+        if key in seen_keys:
+            # Recebe o id da primeira ocorrência depois da gravação
+            results[i]['status'] = 'duplicate'
+            repeated.append((i, seen_keys[key]))
+            continue
+        if str(item.get('folder_id')) not in valid_folders:
+            fail(i, "Pasta não encontrada")
+            continue
+        missing = [field for field in BULK_REQUIRED_FIELDS if item.get(field) is None or not str(item.get(field)).strip()]
+        if missing:
+            fail(i, f"Campos obrigatórios ausentes: {', '.join(missing)}")
+            continue
+
+        jusante, montante, outras = bulk_item_sources(item)
+        if not jusante or not montante:
+            fail(i, "Fotos Jusante e Montante são obrigatórias")
+            continue
+        try:
+            for source in [jusante, montante] + outras:
+                if isinstance(source, str):
+                    upload_sessions.claim(source)
+        except UploadError as e:
+            fail(i, e.message)
+            continue
+
+        seen_keys[key] = i
+        pending.append((i, item, [jusante, montante] + outras))
+
+    if not pending:
+        return jsonify(success=True, results=results)
+
+    # GPS lido do stream das fotos jusante enviadas no multipart (sem reabrir do disco)
+    gps = {}
+    for i, item, sources in pending:
+        if not isinstance(sources[0], str):
+            gps[i] = extract_gps_from_upload(sources[0])
+
+    # Todas as fotos do lote gravadas em paralelo
+    all_sources = [source for _, _, sources in pending for source in sources]
+    try:
+        all_paths = save_photo_sources(all_sources)
+    except Exception as e:
+        logger.error("Erro ao gravar as fotos do lote: %s", e)
+        return jsonify(success=False, message=f"Erro no servidor: {str(e)}"), 500
+
+    rows = {}
+    item_paths = {}
+    position = 0
+    for i, item, sources in pending:
+        paths = all_paths[position:position + len(sources)]
+        position += len(sources)
+        item_paths[i] = paths
+        latitude, longitude = gps.get(i) or extract_gps_data(paths[0])
+        rows[i] = (
+            item.get('folder_id'), item.get('name'), item.get('dim_value'), item.get('dim_unit'),
+            item.get('obs'), paths[0], paths[1], json.dumps(paths[2:]),
+            latitude, longitude, *gps_numeric(latitude, longitude), results[i]['idempotency_key']
+        )
+
+    try:
+        with db_transaction() as cur:
+            # Confere de novo as pastas, agora com lock compartilhado: nenhuma delas
+            # pode ser marcada para exclusão entre esta verificação e o commit
+            folder_ids = list({str(row[0]) for row in rows.values()})
+            placeholders = ", ".join(["%s"] * len(folder_ids))
+            cur.execute(f"""
+                SELECT id FROM folders
+                WHERE id IN ({placeholders}) AND status = 'active' LOCK IN SHARE MODE
+            """, folder_ids)
+            active_folders = {str(row['id']) for row in cur.fetchall()}
+            dropped = [entry for entry in pending if str(rows[entry[0]][0]) not in active_folders]
+            for i, item, sources in dropped:
+                fail(i, "Pasta não encontrada")
+            pending = [entry for entry in pending if str(rows[entry[0]][0]) in active_folders]
+
+            pending_keys = [rows[i][-1] for i, _, _ in pending]
+            placeholders = ", ".join(["%s"] * len(pending_keys))
+
+            # Trava as chaves: um reenvio concorrente com as mesmas chaves espera
+            # este commit e depois as encontra como duplicadas
+            taken = {}
+            if pending_keys:
+                cur.execute(f"""
+                    SELECT id, client_key FROM inspections
+                    WHERE client_key IN ({placeholders}) FOR UPDATE
+                """, pending_keys)
+                taken = {row['client_key']: row['id'] for row in cur.fetchall()}
+
+            new_rows = [rows[i] for i, _, _ in pending if rows[i][-1] not in taken]
+            if new_rows:
+                cur.executemany("""
+                    INSERT INTO inspections (
+                        folder_id, name, dimensions_value, dimensions_unit, 
+                        observations, jusante_photo, montante_photo, other_photos,
+                        latitude, longitude, gps_lat, gps_lon, client_key
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, new_rows)
+
+                cur.execute(f"""
+                    SELECT id, folder_id, client_key
+                    FROM inspections WHERE client_key IN ({placeholders})
+                """, pending_keys)
+                stored = {row['client_key']: row for row in cur.fetchall()}
+
+            changes = []
+            created_paths = []
+            for i, item, sources in pending:
+                key = results[i]['idempotency_key']
+                if key in taken:
+                    results[i].update(status='duplicate', inspection_id=taken[key])
+                    continue
+                row = stored[key]
+                results[i].update(status='created', inspection_id=row['id'])
+                changes.append(('inspection', row['id'], row['folder_id'], 'upsert'))
+                created_paths.extend(item_paths[i])
+            photo_store.acquire(cur, created_paths)
+            record_changes(cur, changes)
+    except PoolTimeout:
+        file_reaper.enqueue(all_paths)
+        raise
+    except Exception as e:
+        logger.error("Erro na ingestão em lote: %s", e)
+        # Nada foi gravado no DB: as fotos do lote vão para o reaper
+        file_reaper.enqueue(all_paths)
+        return jsonify(success=False, message=f"Erro no servidor: {str(e)}"), 500
+
+    # Fotos gravadas sem inspeção: itens cuja pasta foi marcada para exclusão e
+    # chaves gravadas por um envio concorrente. O reaper mantém as que têm referência.
+    unused = [i for i, _, _ in dropped] + [i for i, _, _ in pending if results[i]['status'] == 'duplicate']
+    file_reaper.enqueue([path for i in unused for path in item_paths[i]])
+
+    for i, first in repeated:
+        if results[first]['status'] == 'error':
+            fail(i, results[first]['message'])
+        else:
+            results[i]['inspection_id'] = results[first]['inspection_id']
+
+    created = []
+    for i, item, sources in pending:
+        if results[i]['status'] == 'created':
+            created.append((results[i]['inspection_id'], item_paths[i]))
+            for source in sources:
+                if isinstance(source, str):
+                    upload_sessions.discard(source)
+    if created:
+        derivative_executor.submit(create_inspection_derivatives, created)
+
+    return jsonify(success=True, results=results)
+
+
+def upload_session_payload(session):
+    return {
+        'upload_id': session['id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['offset'],
+        'status': session['status'],
+    }
+
+
+@app.route("/api/uploads", methods=["POST"])
+def create_upload_api():
+    """
+    Abre uma sessão de upload em partes (POST).
+    Campos: filename, size (bytes) e sha256 (opcional aqui, obrigatório até o complete).
+    """
+    data = request.get_json(silent=True) or request.form
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify(success=False, message="Tamanho do arquivo é obrigatório"), 400
+
+    try:
+        session = upload_sessions.create(data.get('filename'), size, data.get('sha256'))
+    except UploadError as e:
+        return jsonify(success=False, message=e.message, **e.extra), e.status
+
+    return jsonify(success=True, **upload_session_payload(session)), 201
+
+
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+def upload_status_api(upload_id):
+    """Retorna quantos bytes já foram recebidos, para retomar o envio (GET)."""
+    try:
+        session = upload_sessions.get(upload_id)
+    except UploadError as e:
+        return jsonify(success=False, message=e.message, **e.extra), e.status
+    return jsonify(success=True, **upload_session_payload(session))
+
+
+@app.route("/api/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk_api(upload_id):
+    """
+    Recebe um chunk no corpo da requisição (PUT ?offset=N).
+    O corpo é gravado em disco em blocos, sem ser carregado em memória.
+    """
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify(success=False, message="Parâmetro offset é obrigatório"), 400
+
+    try:
+        session = upload_sessions.write_chunk(upload_id, offset, request.stream)
+    except UploadError as e:
+        return jsonify(success=False, message=e.message, **e.extra), e.status
+    return jsonify(success=True, **upload_session_payload(session))
+
+
+@app.route("/api/uploads/<upload_id>/complete", methods=["POST"])
+def complete_upload_api(upload_id):
+    """Conclui o upload conferindo o checksum SHA-256 (POST)."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        session = upload_sessions.complete(upload_id, data.get('sha256'))
+    except UploadError as e:
+        return jsonify(success=False, message=e.message, **e.extra), e.status
+    return jsonify(success=True, **upload_session_payload(session))
+
+
 @app.route("/api/delete/<int:id>")
 def delete_record_api(id):
     """
     Exclui um registro de inspeção (GET).
     """
-    cur = mysql.connection.cursor()
-    cur.execute("DELETE FROM inspections WHERE id=%s", [id])
-    mysql.connection.commit()
+    with db_transaction() as cur:
+        cur.execute("""
+            SELECT id, folder_id, jusante_photo, montante_photo, other_photos
+            FROM inspections WHERE id=%s FOR UPDATE
+        """, [id])
+        rows = cur.fetchall()
+        photo_paths = [path for row in rows for path in inspection_photo_paths(row)]
+
+        cur.execute("DELETE FROM inspections WHERE id=%s", [id])
+        photo_store.release(cur, photo_paths)
+        record_changes(cur, [('inspection', row['id'], row['folder_id'], 'delete') for row in rows])
+    pdf_cache.invalidate_inspection(id)
+    file_reaper.enqueue(photo_paths)
     
     return jsonify(success=True, message="Registro excluído com sucesso")
 
 # ==============================================================================
-# ROTAS DE DOWNLOAD
+# ROTAS GEOGRÁFICAS
 # ==============================================================================
 
-@app.route("/api/inspection/photos/<int:id>")
-def download_photos_api(id):
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+GEO_PAGE_SIZE = 100
+GEO_MAX_RADIUS_M = 50000
+
+# Distância (haversine) em metros entre (gps_lat, gps_lon) e o ponto (%s, %s)
+HAVERSINE_SQL = """
+    (2 * %s * ASIN(SQRT(LEAST(1,
+        POW(SIN(RADIANS(i.gps_lat - %s) / 2), 2) +
+        COS(RADIANS(%s)) * COS(RADIANS(i.gps_lat)) *
+        POW(SIN(RADIANS(i.gps_lon - %s) / 2), 2)
+    ))))
+"""
+
+GEO_COLUMNS = """
+    i.id, i.name, i.created_at, i.folder_id, f.name AS folder_name,
+    i.gps_lat AS latitude, i.gps_lon AS longitude
+"""
+
+
+def radius_bbox(lat, lon, radius_m):
+    """Caixa delimitadora que contém o círculo de `radius_m` metros em volta do ponto."""
+    delta_lat = radius_m / METERS_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    delta_lon = radius_m / (METERS_PER_DEGREE_LAT * cos_lat)
+    return lat - delta_lat, lon - delta_lon, lat + delta_lat, lon + delta_lon
+
+
+def geo_rows(rows):
+    """Converte os campos numéricos (Decimal) para float no JSON."""
+    for row in rows:
+        row['latitude'] = float(row['latitude'])
+        row['longitude'] = float(row['longitude'])
+        if row.get('distance_m') is not None:
+            row['distance_m'] = round(float(row['distance_m']), 2)
+    return rows
+
+
+def fetch_nearby(cur, lat, lon, radius_m, limit, cursor=None, exclude_id=None):
     """
-    Gera um arquivo ZIP contendo todas as fotos de uma inspeção, convertidas para PNG.
+    Inspeções a até `radius_m` metros do ponto, da mais próxima para a mais distante.
+    A caixa delimitadora usa o índice (gps_lat, gps_lon); a distância exata é
+    calculada só para as linhas dentro dela. Paginação por (distance_m, id).
     """
-    if 'Image' not in globals():
-        return jsonify(
-            success=False, 
-            message="Erro no servidor: A biblioteca Pillow (PIL) não está instalada."
-        ), 500
-        
-    cur = mysql.connection.cursor()
-    cur.execute("""
-        SELECT jusante_photo, montante_photo, other_photos, name
-        FROM inspections
-        WHERE id = %s
-    """, [id])
-    inspection_data = cur.fetchone()
-    cur.close()
+    min_lat, min_lon, max_lat, max_lon = radius_bbox(lat, lon, radius_m)
+    conditions = ["i.gps_lat BETWEEN %s AND %s", "i.gps_lon BETWEEN %s AND %s"]
+    params = [EARTH_RADIUS_M, lat, lat, lon, min_lat, max_lat, min_lon, max_lon]
+    if exclude_id is not None:
+        conditions.append("i.id <> %s")
+        params.append(exclude_id)
+
+    having = ["distance_m <= %s"]
+    having_params = [radius_m]
+    if cursor is not None:
+        cursor_distance, cursor_id = cursor
+        having.append("(distance_m > %s OR (distance_m = %s AND i.id > %s))")
+        having_params.extend([cursor_distance, cursor_distance, cursor_id])
+
+    cur.execute(f"""
+        SELECT {GEO_COLUMNS}, {HAVERSINE_SQL} AS distance_m
+        FROM inspections i
+        JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+        WHERE {' AND '.join(conditions)}
+        HAVING {' AND '.join(having)}
+        ORDER BY distance_m, i.id
+        LIMIT %s
+    """, params + having_params + [limit + 1])
+    rows = list(cur.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_value_cursor(float(last['distance_m']), last['id'])
+    return geo_rows(rows), next_cursor
+
+
+def float_arg(name, minimum, maximum, default=None):
+    """Lê um parâmetro numérico obrigatório (ou com default) dentro da faixa dada."""
+    value = request.args.get(name, default, type=float)
+    if value is None:
+        raise ValueError(f"Parâmetro {name} é obrigatório")
+    if not (minimum <= value <= maximum):
+        raise ValueError(f"Parâmetro {name} fora da faixa permitida")
+    return value
+
+
+def geo_limit():
+    return max(1, min(request.args.get('limit', GEO_PAGE_SIZE, type=int), DASHBOARD_MAX_PAGE_SIZE))
+
+
+@app.route("/api/inspections/bbox")
+def inspections_bbox_api():
+    """
+    Inspeções dentro de uma caixa delimitadora (GET).
+    Parâmetros: min_lat, min_lon, max_lat, max_lon, folder_id, limit e cursor.
+    Com min_lon > max_lon a caixa atravessa o antimeridiano (180°).
+    """
+    try:
+        min_lat = float_arg('min_lat', -90, 90)
+        max_lat = float_arg('max_lat', -90, 90)
+        min_lon = float_arg('min_lon', -180, 180)
+        max_lon = float_arg('max_lon', -180, 180)
+        if min_lat > max_lat:
+            raise ValueError("min_lat não pode ser maior que max_lat")
+        cursor_param = request.args.get('cursor')
+        cursor = decode_id_cursor(cursor_param) if cursor_param else None
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    limit = geo_limit()
+    conditions = ["i.gps_lat BETWEEN %s AND %s"]
+    if min_lon <= max_lon:
+        conditions.append("i.gps_lon BETWEEN %s AND %s")
+    else:
+        conditions.append("(i.gps_lon >= %s OR i.gps_lon <= %s)")
+    params = [min_lat, max_lat, min_lon, max_lon]
+    folder_id = request.args.get('folder_id', type=int)
+    if folder_id is not None:
+        conditions.append("i.folder_id = %s")
+        params.append(folder_id)
+    if cursor is not None:
+        conditions.append("i.id > %s")
+        params.append(cursor)
+
+    with db_cursor() as cur:
+        cur.execute(f"""
+            SELECT {GEO_COLUMNS}
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE {' AND '.join(conditions)}
+            ORDER BY i.id
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = list(cur.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_id_cursor(rows[-1]['id'])
+
+    return jsonify(inspections=geo_rows(rows), next_cursor=next_cursor)
+
+
+@app.route("/api/inspections/near")
+def inspections_near_api():
+    """
+    Inspeções a até radius_m metros de um ponto, ordenadas pela distância (GET).
+    Parâmetros: lat, lon, radius_m, limit e cursor.
+    """
+    try:
+        lat = float_arg('lat', -90, 90)
+        lon = float_arg('lon', -180, 180)
+        radius_m = float_arg('radius_m', 0, GEO_MAX_RADIUS_M)
+        cursor_param = request.args.get('cursor')
+        cursor = decode_value_cursor(cursor_param) if cursor_param else None
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
 
-    if not inspection_data:
-        return jsonify(success=False, message="Inspeção não encontrada"), 404
-        
+    with db_cursor() as cur:
+        rows, next_cursor = fetch_nearby(cur, lat, lon, radius_m, geo_limit(), cursor)
+
+    return jsonify(inspections=rows, next_cursor=next_cursor)
+
+
+@app.route("/api/inspection/<int:id>/nearest")
+def inspection_nearest_api(id):
+    """
+    Vizinhos mais próximos de uma inspeção, para achar inspeções duplicadas
+    da mesma estrutura (GET). Parâmetros: radius_m (padrão 100) e limit (padrão 5).
+    """
+    try:
+        radius_m = float_arg('radius_m', 0, GEO_MAX_RADIUS_M, default=100)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+    limit = max(1, min(request.args.get('limit', 5, type=int), GEO_PAGE_SIZE))
+
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT i.gps_lat, i.gps_lon
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE i.id = %s
+        """, [id])
+        origin = cur.fetchone()
+        if not origin:
+            return jsonify(success=False, message="Inspeção não encontrada"), 404
+        if origin['gps_lat'] is None or origin['gps_lon'] is None:
+            return jsonify(success=False, message="Inspeção sem localização GPS"), 422
+
+        rows, _ = fetch_nearby(
+            cur, float(origin['gps_lat']), float(origin['gps_lon']),
+            radius_m, limit, exclude_id=id
+        )
+
+    return jsonify(inspections=rows)
+
+
+# ==============================================================================
+# BUSCA TEXTUAL
+# ==============================================================================
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_SORTS = ('relevance', 'recent')
+
+# Índice FULLTEXT (name, observations) da migração 006
+SEARCH_MATCH_SQL = "MATCH(i.name, i.observations) AGAINST (%s IN BOOLEAN MODE)"
+
+
+def fetch_search_page(cur, terms, sort='relevance', folder_id=None, date_from=None,
+                      date_to=None, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Uma página de inspeções que contêm todos os termos, por relevância
+    (cursor (score, id)) ou da mais recente para a mais antiga (cursor (created_at, id)).
+    Retorna (inspections, next_cursor).
+    """
+    query = boolean_query(terms)
+    conditions, params = inspection_filters(folder_id, date_from, date_to)
+    conditions.insert(0, SEARCH_MATCH_SQL)
+    params.insert(0, query)
+
+    having = ""
+    having_params = []
+    if sort == 'relevance':
+        order_by = "score DESC, i.id DESC"
+        if cursor is not None:
+            cursor_score, cursor_id = cursor
+            having = "HAVING (score < %s OR (score = %s AND i.id < %s))"
+            having_params = [cursor_score, cursor_score, cursor_id]
+    else:
+        order_by = "i.created_at DESC, i.id DESC"
+        if cursor is not None:
+            cursor_created_at, cursor_id = cursor
+            conditions.append("(i.created_at < %s OR (i.created_at = %s AND i.id < %s))")
+            params.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+    # score arredondado: o valor volta exato no cursor da próxima página
+    cur.execute(f"""
+        SELECT
+            i.id, i.name, i.created_at, i.folder_id, i.observations, i.jusante_photo,
+            f.name AS folder_name,
+            ROUND({SEARCH_MATCH_SQL}, 6) AS score
+        FROM inspections i
+        JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+        WHERE {' AND '.join(conditions)}
+        {having}
+        ORDER BY {order_by}
+        LIMIT %s
+    """, [query] + params + having_params + [limit + 1])
+    rows = list(cur.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if sort == 'relevance':
+            next_cursor = encode_value_cursor(float(last['score']), last['id'])
+        else:
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+
+    for row in rows:
+        row['score'] = float(row['score'])
+        row['name_highlights'] = find_matches(row['name'], terms)
+        row['snippet'], row['highlights'] = snippet(row.pop('observations'), terms)
+        with_thumbnail(row)
+    return rows, next_cursor
+
+
+@app.route("/api/inspections/search")
+def inspections_search_api():
+    """
+    Busca textual no nome e nas observações, sem acento e sem caixa (GET).
+    Parâmetros: q (palavras ou "frase entre aspas"; todas obrigatórias),
+    folder_id, date_from, date_to, sort (relevance ou recent), limit e cursor.
+    Cada resultado traz o score, um trecho das observações (snippet) e as
+    posições [início, fim] dos termos no trecho (highlights) e no nome (name_highlights).
+    """
+    terms = parse_query(request.args.get('q', ''))
+    if not terms:
+        return jsonify(success=False, message=f"Informe ao menos uma palavra com {MIN_TERM_LENGTH} letras ou mais"), 400
+
+    sort = request.args.get('sort', 'relevance')
+    if sort not in SEARCH_SORTS:
+        return jsonify(success=False, message=f"Ordenação inválida. Use: {', '.join(SEARCH_SORTS)}"), 400
+
+    try:
+        folder_id = request.args.get('folder_id', type=int)
+        date_from = parse_date_param(request.args.get('date_from'))
+        date_to = parse_date_param(request.args.get('date_to'), end_of_day=True)
+        cursor_param = request.args.get('cursor')
+        cursor = None
+        if cursor_param:
+            cursor = decode_value_cursor(cursor_param) if sort == 'relevance' else decode_cursor(cursor_param)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), SEARCH_MAX_PAGE_SIZE))
+
+    with db_cursor() as cur:
+        inspections, next_cursor = fetch_search_page(
+            cur, terms, sort=sort, folder_id=folder_id, date_from=date_from,
+            date_to=date_to, cursor=cursor, limit=limit
+        )
+
+    return jsonify(inspections=inspections, next_cursor=next_cursor)
+
+
+# ==============================================================================
+# ROTAS DE DOWNLOAD
+# ==============================================================================
+
+class ExportError(Exception):
+    """Erro ao preparar uma exportação (mensagem e status HTTP para a resposta)."""
+
+    def __init__(self, message, status=404):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def inspection_photo_labels(inspection_data):
+    """Fotos de uma inspeção como (rótulo, caminho): jusante, montante, outra_1, outra_2..."""
     photo_paths = []
     if inspection_data['jusante_photo']:
         photo_paths.append(("jusante", inspection_data['jusante_photo']))
@@ -413,42 +1600,255 @@ def download_photos_api(id):
     other_photos = json.loads(inspection_data['other_photos']) if inspection_data['other_photos'] else []
     for i, path in enumerate(other_photos):
         photo_paths.append((f"outra_{i+1}", path))
+    return photo_paths
 
-    if not photo_paths:
-        return jsonify(success=False, message="Nenhuma foto encontrada para esta inspeção"), 404
 
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for label, relative_path in photo_paths:
-            full_path = os.path.join(app.root_path, relative_path)
-            
-            if os.path.exists(full_path):
-                try:
-                    img = Image.open(full_path)
-                    img_buffer = BytesIO()
-                    img.save(img_buffer, format="PNG") 
-                    img_buffer.seek(0)
-                    
-                    file_name = f"{inspection_data['name'].replace(' ', '_')}_{label}.png"
-                    zipf.writestr(file_name, img_buffer.read())
-                    
-                except Exception as e:
-                    print(f"Erro ao processar imagem {label} em {full_path}: {e}")
-                    zipf.writestr(f"ERRO_{label}.txt", f"Falha ao carregar/converter a imagem: {e}")
-            else:
-                zipf.writestr(f"FALHA_CAMINHO_{label}.txt", f"Caminho do arquivo não encontrado: {full_path}")
+def photo_zip_entry(prefix, stem, label, relative_path, fmt):
+    """
+    Entrada do ZIP para uma foto: (nome, dados, compressão). Fotos já são
+    comprimidas, então vão sem deflate (ZIP_STORED); erros viram um .txt.
+    """
+    full_path = photo_store.full_path(relative_path)
+    if not os.path.exists(full_path):
+        return f"{prefix}FALHA_CAMINHO_{label}.txt", f"Caminho do arquivo não encontrado: {full_path}"
+    try:
+        extension, data = export_photo(relative_path, fmt)
+        return f"{prefix}{stem}.{extension}", data, zipfile.ZIP_STORED
+    except Exception as e:
+        logger.warning("Erro ao processar a imagem %s em %s: %s", label, full_path, e)
+        return f"{prefix}ERRO_{label}.txt", f"Falha ao carregar/converter a imagem: {e}"
+
+
+def load_photo_export(id, format='png'):
+    """
+    Prepara o ZIP de fotos de uma inspeção no formato `format` (original, jpeg ou png).
+    Retorna (nome_do_download, entradas, total) ou lança ExportError.
+    """
+    if format not in PHOTO_EXPORT_FORMATS:
+        raise ExportError(f"Formato inválido (use {', '.join(PHOTO_EXPORT_FORMATS)})", 400)
+
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT jusante_photo, montante_photo, other_photos, name
+            FROM inspections
+            WHERE id = %s
+        """, [id])
+        inspection_data = cur.fetchone()
+
+    if not inspection_data:
+        raise ExportError("Inspeção não encontrada")
+        
+    photo_paths = inspection_photo_labels(inspection_data)
+    if not photo_paths:
+        raise ExportError("Nenhuma foto encontrada para esta inspeção")
 
-    zip_buffer.seek(0)
-    
     clean_name = inspection_data['name'].replace(' ', '_')
+
+    def build_entry(item):
+        label, relative_path = item
+        return photo_zip_entry("", f"{clean_name}_{label}", label, relative_path, format)
+
+    # Conversões em paralelo; as entradas saem na ordem das fotos
+    entries = map_ordered(
+        photo_export_executor, build_entry, photo_paths,
+        window=app.config["PHOTO_EXPORT_WORKERS"] * 2
+    )
+
     file_download_name = f"{clean_name}_fotos.zip"
 
-    return send_file(
-        zip_buffer,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=file_download_name
+    return file_download_name, entries, len(photo_paths)
+
+
+def load_folder_pdf_export(folderId):
+    """
+    Prepara o ZIP com os PDFs de todas as inspeções de uma pasta.
+    Retorna (nome_do_download, entradas, total) ou lança ExportError.
+    """
+    with db_cursor() as cur:
+        cur.execute("SELECT name FROM folders WHERE id = %s AND status = 'active'", [folderId])
+        folder_data = cur.fetchone()
+        if not folder_data:
+            raise ExportError("Pasta não encontrada")
+        folder_name = folder_data['name']
+        
+        # Garante que i.* inclui latitude e longitude (se o DB estiver atualizado)
+        cur.execute("""
+            SELECT i.*, f.name AS folder_name
+            FROM inspections i
+            LEFT JOIN folders f ON i.folder_id=f.id
+            WHERE i.folder_id = %s
+            ORDER BY i.created_at DESC, i.id DESC
+        """, [folderId])
+        inspections = cur.fetchall()
+    
+    if not inspections:
+        raise ExportError("Nenhum registro encontrado na pasta")
+
+    def pdf_entries():
+        # PDFs gerados em paralelo no pool de processos, entregues na ordem da consulta
+        for data, pdf_output, error in pdf_render_pool.render_ordered(inspections, cache=pdf_cache):
+            clean_name = data['name'].replace(' ', '_')
+            if error is None:
+                yield f"{clean_name}_relatorio.pdf", pdf_output
+            else:
+                # A resposta já está sendo enviada: registra o erro dentro do ZIP
+                logger.error("Erro ao gerar o PDF da inspeção %s: %s", data['id'], error,
+                             extra={'event': 'pdf_render_failed', 'inspection_id': data['id']})
+                yield f"ERRO_{clean_name}_{data['id']}.txt", f"Falha ao gerar o PDF: {error}"
+
+    clean_folder_name = folder_name.replace(' ', '_')
+    file_download_name = f"{clean_folder_name}_todos_relatorios.zip"
+
+    return file_download_name, pdf_entries(), len(inspections)
+
+
+def archive_dir_name(name, inspection_id, used):
+    """
+    Nome do diretório da inspeção no ZIP; nomes repetidos recebem o id para não se misturarem.
+    Barras e pontos iniciais são removidos ("..", ".oculto"): nenhuma entrada sai da raiz do ZIP.
+    """
+    clean = (name or "").replace('/', '_').replace('\\', '_').strip().lstrip('.').strip() or f"inspecao_{inspection_id}"
+    if clean in used:
+        clean = f"{clean} ({inspection_id})"
+    used.add(clean)
+    return clean
+
+
+def load_folder_photo_export(folderId, format='jpeg'):
+    """
+    Prepara o ZIP com as fotos de todas as inspeções de uma pasta, no formato
+    <nome da inspeção>/<rótulo>.<ext> (rótulos jusante, montante, outra_N).
+    Retorna (nome_do_download, entradas, total) ou lança ExportError.
+    """
+    if format not in PHOTO_EXPORT_FORMATS:
+        raise ExportError(f"Formato inválido (use {', '.join(PHOTO_EXPORT_FORMATS)})", 400)
+
+    with db_cursor() as cur:
+        cur.execute("SELECT name FROM folders WHERE id = %s AND status = 'active'", [folderId])
+        folder_data = cur.fetchone()
+        if not folder_data:
+            raise ExportError("Pasta não encontrada")
+
+        # Só as colunas das fotos: o ZIP é montado depois, com a conexão já devolvida
+        cur.execute("""
+            SELECT id, name, jusante_photo, montante_photo, other_photos
+            FROM inspections
+            WHERE folder_id = %s
+            ORDER BY created_at DESC, id DESC
+        """, [folderId])
+        inspections = cur.fetchall()
+
+    used_names = set()
+    photos = []
+    for inspection_data in inspections:
+        prefix = archive_dir_name(inspection_data['name'], inspection_data['id'], used_names) + "/"
+        for label, relative_path in inspection_photo_labels(inspection_data):
+            photos.append((prefix, label, relative_path))
+
+    if not photos:
+        raise ExportError("Nenhuma foto encontrada na pasta")
+
+    def build_entry(item):
+        prefix, label, relative_path = item
+        return photo_zip_entry(prefix, label, label, relative_path, format)
+
+    # Janela limitada: só algumas fotos convertidas ficam em memória enquanto o ZIP é enviado
+    entries = map_ordered(
+        photo_export_executor, build_entry, photos,
+        window=app.config["PHOTO_EXPORT_WORKERS"] * 2
+    )
+
+    clean_folder_name = folder_data['name'].replace(' ', '_')
+    file_download_name = f"{clean_folder_name}_fotos.zip"
+
+    return file_download_name, entries, len(photos)
+
+
+@app.route("/api/inspection/<int:id>/photo/<label>")
+def inspection_photo_api(id, label):
+    """
+    Uma foto da inspeção (GET). `label` é jusante, montante ou outra_N.
+    Sem parâmetros devolve o original; com w=<largura> e/ou format=webp|jpeg
+    devolve uma versão reduzida (gerada uma vez e guardada em cache).
+    Sem `format`, usa WebP quando o navegador aceita. Suporta ETag e Range.
+    """
+    width = request.args.get('w', type=int)
+    fmt = request.args.get('format')
+    if width is not None and width <= 0:
+        return jsonify(success=False, message="Largura inválida"), 400
+    if fmt is not None and fmt not in VARIANT_FORMATS:
+        return jsonify(success=False, message=f"Formato inválido (use {', '.join(VARIANT_FORMATS)})"), 400
+
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT i.jusante_photo, i.montante_photo, i.other_photos
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE i.id = %s
+        """, [id])
+        inspection_data = cur.fetchone()
+    release_db()
+
+    if not inspection_data:
+        return jsonify(success=False, message="Inspeção não encontrada"), 404
+    relative_path = dict(inspection_photo_labels(inspection_data)).get(label)
+    if not relative_path:
+        return jsonify(success=False, message="Foto não encontrada"), 404
+
+    try:
+        digest = photo_store.content_digest(relative_path)
+    except OSError:
+        return jsonify(success=False, message="Arquivo da foto não encontrado"), 404
+
+    max_age = app.config["PHOTO_CACHE_MAX_AGE"]
+    if width is None and fmt is None:
+        # Original: send_file usa o file_wrapper do servidor (sendfile) e trata Range/If-None-Match
+        return send_file(photo_store.full_path(relative_path), etag=digest, max_age=max_age, conditional=True)
+
+    negotiated = fmt is None
+    if negotiated:
+        # JPEG primeiro: com Accept */* (ou image/*) o WebP só sai se o cliente o listar explicitamente
+        best = request.accept_mimetypes.best_match(['image/jpeg', 'image/webp'])
+        fmt = 'webp' if best == 'image/webp' else 'jpeg'
+    width = variant_width(width or VARIANT_WIDTHS[-1])
+
+    try:
+        variant_path = photo_variants.get_or_create(relative_path, digest, width, fmt)
+    except Exception as e:
+        logger.warning("Falha ao gerar a variante %spx/%s de %s: %s", width, fmt, relative_path, e)
+        return jsonify(success=False, message="Não foi possível processar a imagem"), 422
+
+    response = send_file(
+        variant_path,
+        mimetype=VARIANT_FORMATS[fmt][2],
+        etag=f"{digest}-{width}-{fmt}",
+        max_age=max_age,
+        conditional=True
     )
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+
+@app.route("/api/inspection/photos/<int:id>")
+def download_photos_api(id):
+    """
+    Gera um arquivo ZIP contendo todas as fotos de uma inspeção (GET).
+    ?format=original copia os arquivos sem decodificar, jpeg converte só HEIC e
+    formatos incomuns, png (padrão) converte todas. Enviado em streaming.
+    """
+    if 'Image' not in globals():
+        return jsonify(
+            success=False, 
+            message="Erro no servidor: A biblioteca Pillow (PIL) não está instalada."
+        ), 500
+
+    try:
+        file_download_name, entries, _ = load_photo_export(id, request.args.get('format', 'png'))
+    except ExportError as e:
+        return jsonify(success=False, message=e.message), e.status
+
+    return zip_response(entries, file_download_name)
 
 
 @app.route("/api/inspection/csv/<int:id>")
@@ -456,18 +1856,18 @@ def download_csv_api(id):
     """
     Gera um arquivo CSV contendo os dados de texto de uma inspeção, incluindo GPS.
     """
-    cur = mysql.connection.cursor()
-    # Inclui i.latitude e i.longitude na query
-    cur.execute("""
-        SELECT 
-            i.id, i.name, i.created_at, i.dimensions_value, i.dimensions_unit, 
-            i.observations, i.latitude, i.longitude, f.name AS folder_name
-        FROM inspections i
-        JOIN folders f ON i.folder_id = f.id
-        WHERE i.id = %s
-    """, [id])
-    inspection_data = cur.fetchone()
-    cur.close()
+    with db_cursor() as cur:
+        # Inclui i.latitude e i.longitude na query
+        cur.execute("""
+            SELECT 
+                i.id, i.name, i.created_at, i.dimensions_value, i.dimensions_unit, 
+                i.observations, i.latitude, i.longitude, f.name AS folder_name,
+                i.jusante_photo, i.montante_photo, i.other_photos
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE i.id = %s
+        """, [id])
+        inspection_data = cur.fetchone()
 
     if not inspection_data:
         return jsonify(success=False, message="Inspeção não encontrada"), 404
@@ -495,73 +1895,158 @@ def download_csv_api(id):
         }
     )
 
+# Colunas das exportações em lote (CSV / JSON Lines)
+EXPORT_COLUMNS = """
+    i.id, i.name, i.created_at, i.dimensions_value, i.dimensions_unit, 
+    i.observations, i.latitude, i.longitude, i.folder_id, f.name AS folder_name,
+    i.jusante_photo, i.montante_photo, i.other_photos
+"""
+EXPORT_COLUMN_NAMES = [
+    'id', 'name', 'created_at', 'dimensions_value', 'dimensions_unit',
+    'observations', 'latitude', 'longitude', 'folder_id', 'folder_name',
+    'jusante_photo', 'montante_photo', 'other_photos'
+]
+EXPORT_BATCH_SIZE = 1000
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+
+@app.route("/api/export/inspections")
+def export_inspections_api():
+    """
+    Exporta várias inspeções em streaming (GET).
+
+    Parâmetros: format (csv | jsonl | parquet | arrow), folder_id, date_from,
+    date_to e gzip=1 (csv/jsonl). As linhas são lidas do MySQL com um cursor
+    não bufferizado, em lotes, e enviadas conforme são lidas: o uso de memória
+    não depende do total. Parquet e Arrow saem com colunas tipadas (números
+    para GPS e dimensões, unidade canônica, nome da pasta como dicionário).
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(success=False, message="Formato inválido (use csv, jsonl, parquet ou arrow)"), 400
+    if export_format in ('parquet', 'arrow') and pa is None:
+        return jsonify(
+            success=False,
+            message="Erro no servidor: A biblioteca pyarrow não está instalada."
+        ), 500
+
+    try:
+        folder_id = request.args.get('folder_id', type=int)
+        date_from = parse_date_param(request.args.get('date_from'))
+        date_to = parse_date_param(request.args.get('date_to'), end_of_day=True)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    use_gzip = request.args.get('gzip') in ('1', 'true') and export_format in ('csv', 'jsonl')
+    conditions, params = inspection_filters(folder_id, date_from, date_to)
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    def row_batches():
+        with db_stream_cursor() as cur:
+            cur.execute(f"""
+                SELECT {EXPORT_COLUMNS}
+                FROM inspections i
+                JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+                {where_clause}
+                ORDER BY i.created_at, i.id
+            """, params)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+
+    def text_lines():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        if export_format == 'csv':
+            writer.writerow(EXPORT_COLUMN_NAMES)
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+
+        for rows in row_batches():
+            for row in rows:
+                if export_format == 'csv':
+                    writer.writerow([csv_value(row[c]) for c in EXPORT_COLUMN_NAMES])
+                else:
+                    output.write(json.dumps(row, default=str, ensure_ascii=False))
+                    output.write("\n")
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+
+    extension, mimetype = EXPORT_FORMATS[export_format]
+    scope = f"pasta_{folder_id}" if folder_id is not None else "todas"
+    file_download_name = f"inspecoes_{scope}.{extension}"
+
+    if export_format in ('parquet', 'arrow'):
+        body = stream_columnar(row_batches(), export_format)
+    else:
+        body = text_lines()
+    if use_gzip:
+        body = compress_stream(body, Compressor('gzip', gzip_level=app.config["COMPRESS_GZIP_LEVEL"]))
+        file_download_name += ".gz"
+        mimetype = 'application/gzip'
+
+    return app.response_class(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment;filename={file_download_name}",
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route("/api/folder/pdf/<int:folderId>")
 def download_folder_pdfs_api(folderId):
     """
     Gera um arquivo ZIP contendo o PDF de todas as inspeções em uma pasta.
+    Os PDFs são gerados em paralelo e o ZIP é enviado em streaming, um PDF por vez.
     """
     if FPDF is None:
         return jsonify(
             success=False, 
             message="Erro no servidor: A biblioteca FPDF (fpdf2) não está instalada ou configurada."
         ), 500
-        
-    cur = mysql.connection.cursor()
-    
-    cur.execute("SELECT name FROM folders WHERE id = %s", [folderId])
-    folder_data = cur.fetchone()
-    if not folder_data:
-        cur.close()
-        return jsonify(success=False, message="Pasta não encontrada"), 404
-    folder_name = folder_data['name']
-    
-    # Garante que i.* inclui latitude e longitude (se o DB estiver atualizado)
-    cur.execute("""
-        SELECT i.*, f.name AS folder_name
-        FROM inspections i
-        LEFT JOIN folders f ON i.folder_id=f.id
-        WHERE i.folder_id = %s
-        ORDER BY i.created_at DESC
-    """, [folderId])
-    inspections = cur.fetchall()
-    cur.close()
-    
-    if not inspections:
-        return jsonify(success=False, message="Nenhum registro encontrado na pasta"), 404
 
-    zip_buffer = BytesIO()
     try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for data in inspections:
-                pdf = FPDF()
-                generate_single_pdf(pdf, data) 
-                
-                pdf_output_raw = pdf.output(dest='S')
-                
-                if isinstance(pdf_output_raw, str):
-                    pdf_output = pdf_output_raw.encode('latin-1')
-                else:
-                    pdf_output = bytes(pdf_output_raw)
+        file_download_name, entries, _ = load_folder_pdf_export(folderId)
+    except ExportError as e:
+        return jsonify(success=False, message=e.message), e.status
 
-                clean_name = data['name'].replace(' ', '_')
-                file_name = f"{clean_name}_relatorio.pdf"
-                zipf.writestr(file_name, pdf_output)
-        
-    except Exception as e:
-        print(f"ERRO AO GERAR ZIP DE PDFS: {e}")
-        return jsonify(success=False, message=f"Erro ao gerar o ZIP de PDFs: {str(e)}"), 500
+    return zip_response(entries, file_download_name)
 
-    zip_buffer.seek(0)
-    
-    clean_folder_name = folder_name.replace(' ', '_')
-    file_download_name = f"{clean_folder_name}_todos_relatorios.zip"
 
-    return send_file(
-        zip_buffer,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=file_download_name
-    )
+@app.route("/api/folder/photos/<int:folderId>")
+def download_folder_photos_api(folderId):
+    """
+    Gera um ZIP com as fotos de todas as inspeções de uma pasta (GET), uma
+    subpasta por inspeção. ?format=original|jpeg|png (padrão jpeg: só HEIC e
+    formatos incomuns são convertidos). Enviado em streaming.
+    """
+    try:
+        file_download_name, entries, _ = load_folder_photo_export(folderId, request.args.get('format', 'jpeg'))
+    except ExportError as e:
+        return jsonify(success=False, message=e.message), e.status
+
+    return zip_response(entries, file_download_name)
 
 
 @app.route("/api/inspection/pdf/<int:id>")
@@ -575,33 +2060,21 @@ def download_pdf_api(id):
             message="Erro no servidor: A biblioteca FPDF (fpdf2) não está instalada ou configurada."
         ), 500
         
-    cur = mysql.connection.cursor()
-    
-    # Garante que i.* inclui latitude e longitude (se o DB estiver atualizado)
-    cur.execute("""
-        SELECT i.*, f.name AS folder_name
-        FROM inspections i
-        LEFT JOIN folders f ON i.folder_id=f.id
-        WHERE i.id = %s
-    """, [id])
-    inspection_data = cur.fetchone()
-    cur.close()
+    with db_cursor() as cur:
+        # Garante que i.* inclui latitude e longitude (se o DB estiver atualizado)
+        cur.execute("""
+            SELECT i.*, f.name AS folder_name
+            FROM inspections i
+            JOIN folders f ON i.folder_id = f.id AND f.status = 'active'
+            WHERE i.id = %s
+        """, [id])
+        inspection_data = cur.fetchone()
 
     if not inspection_data:
         return jsonify(success=False, message="Inspeção não encontrada"), 404
 
     try:
-        pdf = FPDF()
-        generate_single_pdf(pdf, inspection_data) 
-        
-        pdf_output_raw = pdf.output(dest='S')
-        
-        if isinstance(pdf_output_raw, str):
-            pdf_output = pdf_output_raw.encode('latin-1')
-        elif isinstance(pdf_output_raw, (bytes, bytearray)):
-            pdf_output = bytes(pdf_output_raw)
-        else:
-             raise TypeError(f"A saída do PDF tem um tipo inesperado: {type(pdf_output_raw)}")
+        pdf_output = render_pdf_cached(inspection_data, cache=pdf_cache)
         
         response = app.response_class(
             pdf_output, 
@@ -614,11 +2087,156 @@ def download_pdf_api(id):
         return response
 
     except Exception as e:
-        mysql.connection.rollback()
-        print(f"ERRO GERAL NO DOWNLOAD PDF: {e}")
+        logger.exception("Erro geral no download do PDF: %s", e)
         return jsonify(success=False, message=f"Erro ao gerar PDF: {str(e)}"), 500
 
 
+# ==============================================================================
+# EXPORTAÇÕES EM SEGUNDO PLANO
+# ==============================================================================
+
+EXPORT_LOADERS = {
+    'folder_pdfs': ('folder_id', load_folder_pdf_export),
+    'photos': ('inspection_id', load_photo_export),
+    'folder_photos': ('folder_id', load_folder_photo_export),
+}
+
+
+def run_export_job(job, artifact_path, report_progress):
+    """Executa um job de exportação: grava o ZIP em disco e reporta o progresso por entrada."""
+    param_name, loader = EXPORT_LOADERS[job['kind']]
+
+    with app.app_context():
+        options = {key: value for key, value in job['params'].items() if key != param_name}
+        file_download_name, entries, total = loader(job['params'][param_name], **options)
+        # Os dados já foram lidos; não segura a conexão durante a geração do ZIP
+        release_db()
+        report_progress(0, total)
+
+        def counted_entries():
+            for done, entry in enumerate(entries, start=1):
+                yield entry
+                report_progress(done, total)
+
+        with open(artifact_path, 'wb') as f:
+            for chunk in stream_zip(counted_entries()):
+                f.write(chunk)
+
+    return file_download_name
+
+
+def export_job_payload(job):
+    payload = {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'done': job['done'],
+        'total': job['total'],
+        'error': job['error'],
+    }
+    if job['status'] == 'done':
+        payload['download_url'] = f"/api/exports/{job['id']}/download"
+    return payload
+
+
+@app.route("/api/exports", methods=["POST"])
+def create_export_api():
+    """
+    Enfileira uma exportação pesada (POST).
+    kind=folder_pdfs ou folder_photos com folder_id, ou kind=photos com inspection_id.
+    Os tipos de fotos aceitam format (original, jpeg ou png).
+    """
+    data = request.get_json(silent=True) or request.form
+    kind = data.get('kind')
+    if kind not in EXPORT_LOADERS:
+        return jsonify(success=False, message="Tipo de exportação inválido"), 400
+
+    param_name, _ = EXPORT_LOADERS[kind]
+    try:
+        param_value = int(data.get(param_name))
+    except (TypeError, ValueError):
+        return jsonify(success=False, message=f"Parâmetro {param_name} é obrigatório"), 400
+
+    if kind == 'folder_pdfs' and FPDF is None:
+        return jsonify(
+            success=False, 
+            message="Erro no servidor: A biblioteca FPDF (fpdf2) não está instalada ou configurada."
+        ), 500
+
+    params = {param_name: param_value}
+    if kind in ('photos', 'folder_photos'):
+        params['format'] = data.get('format') or ('png' if kind == 'photos' else 'jpeg')
+        if params['format'] not in PHOTO_EXPORT_FORMATS:
+            return jsonify(success=False, message=f"Formato inválido (use {', '.join(PHOTO_EXPORT_FORMATS)})"), 400
+
+    job = export_jobs.submit(kind, params, run_export_job)
+    return jsonify(success=True, **export_job_payload(job)), 202
+
+
+@app.route("/api/exports/<job_id>")
+def export_status_api(job_id):
+    """Retorna o status e o progresso de uma exportação (GET)."""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify(success=False, message="Exportação não encontrada"), 404
+    return jsonify(success=True, **export_job_payload(job))
+
+
+@app.route("/api/exports/<job_id>/download")
+def export_download_api(job_id):
+    """Baixa o arquivo de uma exportação concluída (GET)."""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify(success=False, message="Exportação não encontrada"), 404
+    if job['status'] != 'done':
+        return jsonify(success=False, message="Exportação ainda não concluída"), 409
+
+    artifact_path = export_jobs.artifact_path(job_id)
+    if not os.path.exists(artifact_path):
+        return jsonify(success=False, message="Arquivo da exportação expirou"), 410
+
+    return send_file(
+        artifact_path,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=job['download_name']
+    )
+
+
+# ==============================================================================
+# BANCO DE DADOS
+# ==============================================================================
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout_handler(e):
+    logger.error("Pool de conexões esgotado: %s", pool.stats())
+    return jsonify(success=False, message="Servidor ocupado, tente novamente"), 503
+
+
+@app.route("/api/metrics/db")
+def db_metrics_api():
+    """Métricas do pool de conexões (em uso, livres, tempo de espera) (GET)."""
+    return jsonify(pool.stats())
+
+
+@app.route("/metrics")
+def prometheus_metrics_api():
+    """
+    Métricas no formato texto do Prometheus (GET): latência por rota, duração
+    dos comandos SQL, etapas pesadas (fotos, EXIF, Pillow, FPDF, ZIP) e o pool.
+    """
+    stats = pool.stats()
+    gauges = {
+        'campo_db_pool_in_use': ("Conexões em uso.", stats['in_use']),
+        'campo_db_pool_idle': ("Conexões livres.", stats['idle']),
+        'campo_db_pool_waits': ("Aquisições que precisaram esperar.", stats['waits']),
+        'campo_db_pool_timeouts': ("Aquisições que estouraram o tempo limite.", stats['timeouts']),
+        'campo_file_reaper_pending': ("Fotos aguardando remoção.", file_reaper.pending()),
+        'campo_folder_delete_pending': ("Pastas em exclusão em segundo plano.", folder_deleter.pending()),
+    }
+    return app.response_class(render_metrics(gauges), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == "__main__":
     # Altere app.run() para usar host='0.0.0.0'
     app.run(host='0.0.0.0', debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Reprocessa o GPS das fotos já salvas e preenche latitude/longitude das inspeções sem localização.
+
+Uso:
+    python backfill_gps.py [--workers N] [--batch-size N] [--limit N] [--dry-run] [--restart] [--all]
+
+- A leitura do EXIF roda em processos paralelos (só o cabeçalho, sem decodificar os pixels).
+- Cada lote é gravado numa transação (executemany) junto com o change_log.
+- O progresso (último id processado) fica no arquivo de checkpoint: se o processo
+  for interrompido, a próxima execução continua de onde parou.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from changelog import record_changes
+from gps import extract_gps_data, gps_numeric
+from storage import ROOT_PATH, inspection_photo_paths, photo_store
+
+
+DEFAULT_CHECKPOINT = os.path.join(ROOT_PATH, "cache", "gps_backfill.json")
+
+
+def extract_first_gps(paths):
+    """
+    Executado nos processos de trabalho: GPS da primeira foto que tiver localização.
+    Retorna (latitude, longitude, status) com status 'found', 'no_gps' ou 'missing'.
+    """
+    missing = 0
+    for path in paths:
+        if not photo_store.exists(path):
+            missing += 1
+            continue
+        latitude, longitude = extract_gps_data(path)
+        if latitude is not None:
+            return latitude, longitude, 'found'
+    return None, None, 'missing' if missing == len(paths) else 'no_gps'
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'last_id': 0, 'processed': 0, 'updated': 0, 'no_gps': 0, 'missing': 0}
+
+
+def save_checkpoint(path, checkpoint):
+    """Gravação atômica (arquivo temporário + rename) para não corromper o checkpoint."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_batch(cur, last_id, batch_size, include_all):
+    condition = "" if include_all else "AND gps_lat IS NULL"
+    cur.execute(f"""
+        SELECT id, folder_id, jusante_photo, montante_photo, other_photos
+        FROM inspections
+        WHERE id > %s {condition}
+        ORDER BY id
+        LIMIT %s
+    """, [last_id, batch_size])
+    return list(cur.fetchall())
+
+
+def apply_batch(conn, rows, results, dry_run):
+    """Grava as coordenadas encontradas numa única transação. Retorna os contadores do lote."""
+    counts = {'updated': 0, 'no_gps': 0, 'missing': 0}
+    updates, changes = [], []
+    for row, (latitude, longitude, status) in zip(rows, results):
+        if status != 'found':
+            counts[status] += 1
+            continue
+        updates.append((latitude, longitude, *gps_numeric(latitude, longitude), row['id']))
+        changes.append(('inspection', row['id'], row['folder_id'], 'upsert'))
+    counts['updated'] = len(updates)
+
+    if updates and not dry_run:
+        cur = conn.cursor()
+        try:
+            cur.executemany("""
+                UPDATE inspections
+                SET latitude = %s, longitude = %s, gps_lat = %s, gps_lon = %s
+                WHERE id = %s
+            """, updates)
+            record_changes(cur, changes)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    return counts
+
+
+def print_stats(checkpoint, started, processed_now, final=False):
+    elapsed = max(time.monotonic() - started, 1e-6)
+    label = "Concluído" if final else "Progresso"
+    print(
+        f"{label}: {checkpoint['processed']} inspeções (último id {checkpoint['last_id']}), "
+        f"{checkpoint['updated']} atualizadas, {checkpoint['no_gps']} sem GPS, "
+        f"{checkpoint['missing']} sem arquivo | {processed_now / elapsed:.1f} inspeções/s "
+        f"em {elapsed:.1f}s",
+        flush=True
+    )
+
+
+def run(args):
+    from db import pool
+
+    checkpoint_path = args.checkpoint
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint['last_id']:
+        print(f"Retomando a partir do id {checkpoint['last_id']}", flush=True)
+
+    entry = pool.acquire()
+    conn = entry.conn
+    started = time.monotonic()
+    processed_now = 0
+    chunksize = max(1, args.batch_size // (args.workers * 4))
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            cur = conn.cursor()
+            try:
+                rows = fetch_batch(cur, checkpoint['last_id'], args.batch_size, args.all)
+                while rows:
+                    if args.limit:
+                        rows = rows[:args.limit - processed_now]
+                    # Os processos leem o EXIF deste lote enquanto o próximo é buscado no DB
+                    results = executor.map(extract_first_gps, [inspection_photo_paths(row) for row in rows], chunksize=chunksize)
+                    done = args.limit and processed_now + len(rows) >= args.limit
+                    next_rows = [] if done else fetch_batch(cur, rows[-1]['id'], args.batch_size, args.all)
+
+                    counts = apply_batch(conn, rows, list(results), args.dry_run)
+                    processed_now += len(rows)
+                    checkpoint['last_id'] = rows[-1]['id']
+                    checkpoint['processed'] += len(rows)
+                    for key, value in counts.items():
+                        checkpoint[key] += value
+                    if not args.dry_run:
+                        save_checkpoint(checkpoint_path, checkpoint)
+                    print_stats(checkpoint, started, processed_now)
+                    rows = next_rows
+            finally:
+                cur.close()
+    finally:
+        pool.release(entry)
+
+    print_stats(checkpoint, started, processed_now, final=True)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preenche o GPS das inspeções a partir do EXIF das fotos salvas.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos de leitura do EXIF")
+    parser.add_argument("--batch-size", type=int, default=500, help="inspeções por lote/transação")
+    parser.add_argument("--limit", type=int, default=0, help="máximo de inspeções nesta execução (0 = todas)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="arquivo de progresso para retomar")
+    parser.add_argument("--restart", action="store_true", help="ignora o checkpoint e começa do início")
+    parser.add_argument("--all", action="store_true", help="reprocessa também inspeções que já têm GPS")
+    parser.add_argument("--dry-run", action="store_true", help="só conta, sem gravar no DB nem no checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.batch_size < 1 or args.limit < 0:
+        parser.error("--workers e --batch-size devem ser positivos e --limit não pode ser negativo")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,538 @@
+"""
+Benchmark reproduzível dos endpoints principais (upload, dashboard, ZIP de fotos, PDFs da pasta).
+
+Roda contra um MySQL local de teste (banco <nome>_bench, recriado a cada execução) e
+um diretório de trabalho próprio para as fotos e caches, sem tocar nos dados reais.
+
+Uso:
+    python benchmark.py --rows 1000 --concurrency 1,8 --output bench_results/
+    python benchmark.py --rows 100000 --scenarios dashboard --concurrency 1,16,32
+    python benchmark.py --compare bench_results/antes.json bench_results/depois.json
+
+- Gera pastas, inspeções e fotos JPEG (e HEIC, se o pillow-heif estiver instalado)
+  com GPS no EXIF, na escala pedida (--rows).
+- Cada cenário é executado pelo test client do Flask, em série e com N threads
+  concorrentes (--concurrency), depois de algumas requisições de aquecimento.
+- Reporta vazão, latência p50/p95/p99 e pico de RSS por cenário, e grava tudo em
+  JSON (com o commit atual) para comparar execuções entre commits.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Tabelas base (anteriores às migrações em migrations/)
+BASE_SCHEMA = [
+    """
+    CREATE TABLE folders (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE inspections (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        folder_id INT NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        dimensions_value VARCHAR(50),
+        dimensions_unit VARCHAR(20),
+        observations TEXT,
+        jusante_photo VARCHAR(255),
+        montante_photo VARCHAR(255),
+        other_photos TEXT,
+        latitude VARCHAR(32),
+        longitude VARCHAR(32),
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+BENCH_TABLES = ["change_counter", "change_log", "photo_objects", "inspections", "folders"]
+
+# Requisições medidas por cenário (--requests substitui todas)
+DEFAULT_REQUESTS = {
+    'dashboard': 500,
+    'add': 100,
+    'photos_zip': 100,
+    'folder_pdfs': 5,
+    'search': 500,
+}
+
+UNITS = ["m", "cm", "mm", "m2", "m3"]
+# Vocabulário das observações sintéticas (também usado nas buscas do cenário search)
+OBSERVATION_WORDS = [
+    "erosão", "trinca", "fissura", "assoreamento", "corrosão", "infiltração", "vegetação",
+    "desgaste", "recalque", "obstrução", "rachadura", "armadura", "exposta", "margem",
+    "bueiro", "cabeceira", "drenagem", "pavimento", "talude", "concreto",
+]
+
+
+# ==============================================================================
+# AMBIENTE E DADOS SINTÉTICOS
+# ==============================================================================
+
+def prepare_environment(args, workdir):
+    """Aponta o app para o banco e os diretórios do benchmark (antes de importar o app)."""
+    os.environ["MYSQL_DB"] = args.database
+    os.environ["PHOTO_STORE_ROOT"] = workdir
+    os.environ["PDF_CACHE_DIR"] = os.path.join(workdir, "cache", "pdf")
+    os.environ["PHOTO_VARIANT_CACHE_DIR"] = os.path.join(workdir, "cache", "photos")
+    os.environ["EXPORT_JOBS_DIR"] = os.path.join(workdir, "cache", "exports")
+    os.environ["UPLOAD_SESSIONS_DIR"] = os.path.join(workdir, "cache", "uploads")
+    os.environ["PROFILE_DIR"] = os.path.join(workdir, "cache", "profiles")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.warm_cache:
+        # Cache de PDFs desligado (limite 0): mede a renderização, não a leitura do cache
+        os.environ["PDF_CACHE_MAX_BYTES"] = "0"
+
+
+def split_sql(text):
+    """Comandos de um arquivo .sql (sem as linhas de comentário), separados por ';'."""
+    lines = [line for line in text.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+def create_schema(pool):
+    """Recria as tabelas do banco de benchmark e aplica as migrações em ordem."""
+    import MySQLdb
+
+    server_kwargs = {key: value for key, value in pool.connect_kwargs.items() if key not in ('db', 'cursorclass')}
+    conn = MySQLdb.connect(**server_kwargs)
+    try:
+        conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{pool.connect_kwargs['db']}` CHARACTER SET utf8mb4")
+    finally:
+        conn.close()
+
+    entry = pool.acquire()
+    try:
+        cur = entry.conn.cursor()
+        for table in BENCH_TABLES:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in BASE_SCHEMA:
+            cur.execute(statement)
+        migrations_dir = os.path.join(ROOT_PATH, "migrations")
+        for file_name in sorted(os.listdir(migrations_dir)):
+            if file_name.endswith(".sql"):
+                with open(os.path.join(migrations_dir, file_name), encoding="utf-8") as f:
+                    for statement in split_sql(f.read()):
+                        cur.execute(statement)
+        entry.conn.commit()
+        cur.close()
+    finally:
+        pool.release(entry)
+
+
+def to_dms(value):
+    """Graus decimais -> ((graus, minutos, segundos), referência positiva?)."""
+    from PIL.TiffImagePlugin import IFDRational
+
+    value_abs = abs(value)
+    degrees = int(value_abs)
+    minutes = int((value_abs - degrees) * 60)
+    seconds = round((value_abs - degrees - minutes / 60) * 3600, 2)
+    return (IFDRational(degrees), IFDRational(minutes), IFDRational(int(seconds * 100), 100)), value >= 0
+
+
+def make_photo(rng, width, height, fmt):
+    """Foto sintética com ruído (não comprime como uma cor sólida) e GPS no EXIF."""
+    from PIL import Image
+
+    latitude = rng.uniform(-33.0, -3.0)
+    longitude = rng.uniform(-60.0, -35.0)
+    lat_dms, north = to_dms(latitude)
+    lon_dms, east = to_dms(longitude)
+
+    base = Image.effect_noise((width // 8, height // 8), rng.uniform(40, 90)).convert("RGB")
+    img = base.resize((width, height), Image.BICUBIC)
+
+    exif = Image.Exif()
+    exif[0x8825] = {1: 'N' if north else 'S', 2: lat_dms, 3: 'E' if east else 'W', 4: lon_dms}
+
+    buffer = io.BytesIO()
+    if fmt == "heic":
+        img.save(buffer, format="HEIF", quality=80, exif=exif.tobytes())
+    else:
+        img.save(buffer, format="JPEG", quality=88, exif=exif.tobytes())
+    return buffer.getvalue(), f"{latitude:.6f}", f"{longitude:.6f}"
+
+
+def build_photo_pool(args, rng, photo_store, create_derivatives):
+    """
+    Gera `--photo-pool` fotos distintas e grava no armazenamento do benchmark.
+    As inspeções sintéticas reaproveitam essas fotos (como fotos deduplicadas).
+    Retorna [(caminho, bytes, nome, latitude, longitude)].
+    """
+    try:
+        import pillow_heif  # noqa: F401
+        heif_available = True
+    except ImportError:
+        heif_available = False
+
+    photos = []
+    for i in range(args.photo_pool):
+        fmt = "heic" if heif_available and args.heic_ratio and rng.random() < args.heic_ratio else "jpg"
+        data, latitude, longitude = make_photo(rng, args.photo_width, args.photo_height, fmt)
+        name = f"bench_{i}.{fmt}"
+        path = photo_store.put_stream(io.BytesIO(data), name)
+        create_derivatives(path)
+        photos.append((path, data, name, latitude, longitude))
+    if args.heic_ratio and not heif_available:
+        print("AVISO: pillow-heif não instalado; todas as fotos sintéticas são JPEG.", flush=True)
+    return photos
+
+
+def seed_database(pool, args, rng, photos):
+    """Insere as pastas e inspeções sintéticas em lotes. Retorna (ids das pastas, id da pasta de PDFs)."""
+    from gps import gps_numeric
+
+    entry = pool.acquire()
+    try:
+        cur = entry.conn.cursor()
+        cur.executemany("INSERT INTO folders (name) VALUES (%s)", [(f"Contrato {i + 1:04d}",) for i in range(args.folders)])
+        cur.execute("INSERT INTO folders (name) VALUES ('Benchmark PDFs')")
+        pdf_folder_id = cur.lastrowid
+        cur.execute("SELECT id FROM folders WHERE id <> %s ORDER BY id", [pdf_folder_id])
+        folder_ids = [row['id'] for row in cur.fetchall()]
+
+        def rows(count, folder_choice):
+            for i in range(count):
+                chosen = rng.sample(photos, min(len(photos), 2 + args.other_photos))
+                latitude, longitude = chosen[0][3], chosen[0][4]
+                yield (
+                    folder_choice(), f"Estrutura {i + 1:06d}", f"{rng.uniform(0.3, 12):.2f}", rng.choice(UNITS),
+                    " ".join(rng.choices(OBSERVATION_WORDS, k=rng.randint(4, 40))), chosen[0][0], chosen[1][0],
+                    json.dumps([photo[0] for photo in chosen[2:]]), latitude, longitude,
+                    *gps_numeric(latitude, longitude)
+                )
+
+        insert = """
+            INSERT INTO inspections (
+                folder_id, name, dimensions_value, dimensions_unit, observations,
+                jusante_photo, montante_photo, other_photos, latitude, longitude, gps_lat, gps_lon
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        batch = []
+        for row in rows(args.rows, lambda: rng.choice(folder_ids)):
+            batch.append(row)
+            if len(batch) >= 1000:
+                cur.executemany(insert, batch)
+                batch = []
+        batch.extend(rows(args.pdf_folder_size, lambda: pdf_folder_id))
+        cur.executemany(insert, batch)
+        entry.conn.commit()
+        cur.close()
+        return folder_ids, pdf_folder_id
+    finally:
+        pool.release(entry)
+
+
+# ==============================================================================
+# CENÁRIOS
+# ==============================================================================
+
+class Scenarios:
+    """Cada cenário faz uma requisição com o test client e devolve o status HTTP."""
+
+    def __init__(self, args, folder_ids, pdf_folder_id, inspection_ids, photos):
+        self.args = args
+        self.folder_ids = folder_ids
+        self.pdf_folder_id = pdf_folder_id
+        self.inspection_ids = inspection_ids
+        self.photos = photos
+
+    def dashboard(self, client, rng):
+        folder_id = rng.choice(self.folder_ids)
+        response = client.get(f"/api/dashboard?folder_id={folder_id}&limit=100")
+        return response.status_code, len(response.data)
+
+    def add(self, client, rng):
+        chosen = rng.sample(self.photos, min(len(self.photos), 2 + self.args.other_photos))
+        data = {
+            'folder_id': str(rng.choice(self.folder_ids)),
+            'name': f"Upload {rng.randint(1, 10 ** 9)}",
+            'dim_value': "1.5",
+            'dim_unit': "m",
+            'obs': "Benchmark",
+            'foto_jusante': (io.BytesIO(chosen[0][1]), chosen[0][2]),
+            'foto_montante': (io.BytesIO(chosen[1][1]), chosen[1][2]),
+            'outras_fotos': [(io.BytesIO(photo[1]), photo[2]) for photo in chosen[2:]],
+        }
+        response = client.post("/api/add", data=data, content_type="multipart/form-data")
+        return response.status_code, len(response.data)
+
+    def photos_zip(self, client, rng):
+        inspection_id = rng.choice(self.inspection_ids)
+        response = client.get(f"/api/inspection/photos/{inspection_id}?format={self.args.photo_format}")
+        return response.status_code, len(response.data)
+
+    def search(self, client, rng):
+        query = " ".join(rng.sample(OBSERVATION_WORDS, rng.randint(1, 2)))
+        response = client.get("/api/inspections/search", query_string={'q': query, 'limit': 20})
+        return response.status_code, len(response.data)
+
+    def folder_pdfs(self, client, rng):
+        response = client.get(f"/api/folder/pdf/{self.pdf_folder_id}")
+        return response.status_code, len(response.data)
+
+
+def percentile(sorted_values, fraction):
+    """Percentil pelo método do posto mais próximo."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def current_rss_bytes():
+    """RSS atual do processo (Linux: /proc; outros sistemas: pico do getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Amostra o RSS em segundo plano e guarda o pico durante um cenário."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def run_scenario(app, scenario, name, requests, concurrency, warmup, seed):
+    """Executa `requests` requisições com `concurrency` threads e retorna as estatísticas."""
+    local = threading.local()
+
+    def call(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        rng = random.Random(seed * 1_000_003 + index)
+        start = time.perf_counter()
+        try:
+            status, size = scenario(client, rng)
+        except Exception as e:
+            print(f"  erro em {name}: {e}", file=sys.stderr)
+            status, size = 599, 0
+        return time.perf_counter() - start, status, size
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(-warmup, 0)))
+
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            results = list(executor.map(call, range(requests)))
+            duration = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _, _ in results)
+    errors = sum(1 for _, status, _ in results if status >= 400)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(requests / duration, 3) if duration else None,
+        'bytes_mean': round(sum(size for _, _, size in results) / len(results)) if results else 0,
+        'latency_ms': {
+            'p50': to_ms(percentile(latencies, 0.50)),
+            'p95': to_ms(percentile(latencies, 0.95)),
+            'p99': to_ms(percentile(latencies, 0.99)),
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'max': to_ms(latencies[-1]) if latencies else None,
+        },
+        'peak_rss_mb': round(rss.peak / (1024 * 1024), 1),
+    }
+
+
+# ==============================================================================
+# RELATÓRIO
+# ==============================================================================
+
+def git_revision():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=ROOT_PATH, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {'commit': git("rev-parse", "HEAD"), 'dirty': bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_table(results):
+    print(f"{'cenário':<12} {'conc':>4} {'req':>5} {'erros':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for r in results:
+        latency = r['latency_ms']
+        print(f"{r['scenario']:<12} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>5} "
+              f"{r['throughput_rps']:>9} {latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} {r['peak_rss_mb']:>8}")
+
+
+def compare(old_path, new_path):
+    """Compara dois resultados (mesmo cenário e concorrência): variação de vazão e latência."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)['results']
+
+    def delta(before, after):
+        if not before or after is None:
+            return "n/a"
+        return f"{(after - before) / before * 100:+.1f}%"
+
+    print(f"{'cenário':<12} {'conc':>4} {'req/s':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'RSS':>10}")
+    for r in new:
+        before = old.get((r['scenario'], r['concurrency']))
+        if before is None:
+            continue
+        print(f"{r['scenario']:<12} {r['concurrency']:>4} "
+              f"{delta(before['throughput_rps'], r['throughput_rps']):>10} "
+              f"{delta(before['latency_ms']['p50'], r['latency_ms']['p50']):>10} "
+              f"{delta(before['latency_ms']['p95'], r['latency_ms']['p95']):>10} "
+              f"{delta(before['latency_ms']['p99'], r['latency_ms']['p99']):>10} "
+              f"{delta(before['peak_rss_mb'], r['peak_rss_mb']):>10}")
+    return 0
+
+
+# ==============================================================================
+# EXECUÇÃO
+# ==============================================================================
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="campo_bench_")
+    prepare_environment(args, workdir)
+    rng = random.Random(args.seed)
+
+    from db import pool
+    from storage import photo_store
+    from images import create_derivatives
+
+    started = time.perf_counter()
+    create_schema(pool)
+    photos = build_photo_pool(args, rng, photo_store, create_derivatives)
+    folder_ids, pdf_folder_id = seed_database(pool, args, rng, photos)
+    print(f"Dados gerados em {time.perf_counter() - started:.1f}s: {args.rows} inspeções, "
+          f"{args.folders} pastas, {len(photos)} fotos distintas ({workdir})", flush=True)
+
+    # Só depois dos dados: o app cria os singletons apontando para o ambiente do benchmark
+    from app import app
+    from db import db_cursor
+
+    with app.app_context():
+        with db_cursor() as cur:
+            cur.execute("SELECT id FROM inspections ORDER BY RAND(%s) LIMIT 1000", [args.seed])
+            inspection_ids = [row['id'] for row in cur.fetchall()]
+
+    scenarios = Scenarios(args, folder_ids, pdf_folder_id, inspection_ids, photos)
+    results = []
+    for name in args.scenarios:
+        requests = args.requests or DEFAULT_REQUESTS[name]
+        for concurrency in args.concurrency:
+            warmup = min(args.warmup, requests)
+            result = run_scenario(app, getattr(scenarios, name), name, requests, concurrency, warmup, args.seed)
+            results.append(result)
+            print(f"  {name} x{concurrency}: {result['throughput_rps']} req/s, "
+                  f"p95 {result['latency_ms']['p95']} ms, {result['errors']} erros", flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            **git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+        },
+        'results': results,
+    }
+
+    print()
+    print_table(results)
+
+    output = args.output
+    if os.path.isdir(output) or output.endswith(os.sep):
+        commit = (report['meta']['commit'] or "nocommit")[:10]
+        output = os.path.join(output, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {output}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints de upload, dashboard e exportação.")
+    parser.add_argument("--database", default=os.environ.get("BENCH_MYSQL_DB", "campo_manager_bench"),
+                        help="banco MySQL de teste (recriado; o nome precisa terminar em _bench)")
+    parser.add_argument("--rows", type=int, default=1000, help="inspeções sintéticas (1k a 100k)")
+    parser.add_argument("--folders", type=int, default=20, help="pastas sintéticas")
+    parser.add_argument("--other-photos", type=int, default=1, help="fotos extras por inspeção")
+    parser.add_argument("--photo-pool", type=int, default=24, help="fotos distintas geradas")
+    parser.add_argument("--photo-width", type=int, default=1600)
+    parser.add_argument("--photo-height", type=int, default=1200)
+    parser.add_argument("--heic-ratio", type=float, default=0.25, help="fração das fotos em HEIC (requer pillow-heif)")
+    parser.add_argument("--photo-format", default="png", choices=["original", "jpeg", "png"], help="formato do ZIP de fotos")
+    parser.add_argument("--pdf-folder-size", type=int, default=20, help="inspeções da pasta usada no cenário folder_pdfs")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_REQUESTS), help="lista separada por vírgula")
+    parser.add_argument("--concurrency", default="1,8", help="níveis de concorrência, separados por vírgula")
+    parser.add_argument("--requests", type=int, default=0, help="requisições por cenário (0 = padrão de cada um)")
+    parser.add_argument("--warmup", type=int, default=3, help="requisições de aquecimento (não medidas)")
+    parser.add_argument("--warm-cache", action="store_true", help="mantém o cache de PDFs ligado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="diretório das fotos e caches (padrão: temporário)")
+    parser.add_argument("--output", default=os.path.join("bench_results", ""), help="arquivo ou diretório do JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois JSONs e sai")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in DEFAULT_REQUESTS]
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(unknown)}")
+    try:
+        args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    except ValueError:
+        parser.error("--concurrency deve ser uma lista de inteiros")
+    if not args.database.endswith("_bench"):
+        parser.error("por segurança o banco de benchmark precisa terminar em _bench (ele é recriado)")
+    if args.rows < 1 or args.folders < 1 or args.photo_pool < 2 or min(args.concurrency) < 1:
+        parser.error("--rows, --folders e --concurrency devem ser positivos e --photo-pool >= 2")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,59 @@
 export const API_BASE = "http://192.168.0.20:5001"; // seu IP de casa
 
-export async function fetchDashboard() {
-  const resp = await fetch(`${API_BASE}/api/dashboard`);
+export type DashboardQuery = {
+  folder_id?: number;
+  date_from?: string;
+  date_to?: string;
+  name?: string;
+  cursor?: string;
+  limit?: number;
+};
+
+type Columns = Record<string, any[]>;
+
+// Resposta colunar ({campo: [valores]}) de volta para uma lista de objetos
+function rowsFromColumns(columns: Columns): Record<string, any>[] {
+  const names = Object.keys(columns);
+  const count = names.length ? columns[names[0]].length : 0;
+  const rows = [];
+  for (let i = 0; i < count; i++) {
+    const row: Record<string, any> = {};
+    names.forEach((name) => {
+      row[name] = columns[name][i];
+    });
+    rows.push(row);
+  }
+  return rows;
+}
+
+// O dashboard é pedido no formato colunar (bem menor) e remontado aqui
+function decodeDashboard(data: any) {
+  if (data.format !== "columnar") return data;
+  const inspections = rowsFromColumns(data.inspections).map((row) => ({
+    ...row,
+    folder_name: data.folder_names[row.folder_id],
+    thumbnail: row.thumbnail ? `${data.thumbnail_base}${row.thumbnail}` : null,
+  }));
+  const folders = data.folders ? rowsFromColumns(data.folders) : data.folders;
+  return { ...data, inspections, folders };
+}
+
+export async function fetchDashboard(query: DashboardQuery = {}) {
+  const params = new URLSearchParams({ format: "columnar" });
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== "") {
+      params.append(key, String(value));
+    }
+  });
+  const qs = params.toString();
+  const resp = await fetch(`${API_BASE}/api/dashboard${qs ? `?${qs}` : ""}`);
   if (!resp.ok) throw new Error("Erro ao carregar dashboard");
+  return decodeDashboard(await resp.json());
+}
+
+export async function fetchFolders() {
+  const resp = await fetch(`${API_BASE}/api/folders`);
+  if (!resp.ok) throw new Error("Erro ao carregar pastas");
   return resp.json();
 }
 
@@ -17,7 +68,15 @@ export async function createFolder(name: string) {
 }
 
 export async function deleteFolder(folderId: number) {
-  const resp = await fetch(`${API_BASE}/api/folder/delete/${folderId}`);
+  // A exclusão continua no servidor em segundo plano (ver getFolderDeleteStatus)
+  const resp = await fetch(`${API_BASE}/api/folder/${folderId}`, {
+    method: "DELETE",
+  });
+  return resp.json();
+}
+
+export async function getFolderDeleteStatus(folderId: number) {
+  const resp = await fetch(`${API_BASE}/api/folder/${folderId}/delete-status`);
   return resp.json();
 }
 
@@ -11,7 +11,7 @@ import {
 import { NativeStackScreenProps } from "@react-navigation/native-stack";
 import * as ImagePicker from "expo-image-picker";
 import { RootStackParamList } from "../../App";
-import { API_BASE, createInspection, fetchDashboard } from "../api/api";
+import { API_BASE, createInspection, fetchFolders } from "../api/api";
 
 type Props = NativeStackScreenProps<RootStackParamList, "AddInspection">;
 
@@ -33,7 +33,7 @@ export default function AddInspectionScreen({ navigation }: Props) {
 
   useEffect(() => {
     (async () => {
-      const data = await fetchDashboard();
+      const data = await fetchFolders();
       setFolders(data.folders);
       if (data.folders.length > 0) setFolderId(data.folders[0].id);
     })();
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   View,
   Text,
@@ -13,6 +13,7 @@ import { RootStackParamList } from "../../App";
 import {
   API_BASE,
   fetchDashboard,
+  fetchFolders,
   deleteFolder,
   deleteInspection,
 } from "../api/api";
@@ -22,6 +23,13 @@ type Props = NativeStackScreenProps<RootStackParamList, "Dashboard">;
 type Folder = {
   id: number;
   name: string;
+  inspection_count: number;
+  latest_created_at: string | null;
+};
+
+type FolderPage = {
+  items: Inspection[];
+  nextCursor: string | null;
 };
 
 type Inspection = {
@@ -31,21 +39,51 @@ type Inspection = {
   created_at: string;
   dimensions_value: string;
   dimensions_unit: string;
-  latitude?: string;
-  longitude?: string;
+  latitude?: number | null;
+  longitude?: number | null;
 };
 
 export default function DashboardScreen({ navigation }: Props) {
   const [folders, setFolders] = useState<Folder[]>([]);
-  const [inspections, setInspections] = useState<Inspection[]>([]);
+  const [folderPages, setFolderPages] = useState<Record<number, FolderPage>>({});
+  const [openFolderId, setOpenFolderId] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
+  // O listener de "focus" é registrado uma vez; a pasta aberta atual é lida pelo ref
+  const openFolderIdRef = useRef<number | null>(null);
+  openFolderIdRef.current = openFolderId;
+
+  async function loadFolderPage(folderId: number, cursor: string | null = null) {
+    try {
+      const data = await fetchDashboard({
+        folder_id: folderId,
+        cursor: cursor ?? undefined,
+      });
+      setFolderPages((prev) => {
+        const previousItems = cursor && prev[folderId] ? prev[folderId].items : [];
+        return {
+          ...prev,
+          [folderId]: {
+            items: [...previousItems, ...data.inspections],
+            nextCursor: data.next_cursor,
+          },
+        };
+      });
+    } catch (e) {
+      console.log(e);
+      Alert.alert("Erro", "Falha ao carregar registros");
+    }
+  }
 
   async function load() {
     try {
       setLoading(true);
-      const data = await fetchDashboard();
+      const data = await fetchFolders();
       setFolders(data.folders);
-      setInspections(data.inspections);
+      setFolderPages({});
+      const currentFolderId = openFolderIdRef.current;
+      if (currentFolderId !== null) {
+        loadFolderPage(currentFolderId);
+      }
     } catch (e) {
       console.log(e);
       Alert.alert("Erro", "Falha ao carregar dashboard");
@@ -59,8 +97,19 @@ export default function DashboardScreen({ navigation }: Props) {
     return unsub;
   }, [navigation]);
 
-  function getInspectionsByFolder(folderName: string) {
-    return inspections.filter((i) => i.folder_name === folderName);
+  function getInspectionsByFolder(folderId: number) {
+    return folderPages[folderId] ? folderPages[folderId].items : [];
+  }
+
+  function toggleFolder(folderId: number) {
+    if (openFolderId === folderId) {
+      setOpenFolderId(null);
+      return;
+    }
+    setOpenFolderId(folderId);
+    if (!folderPages[folderId]) {
+      loadFolderPage(folderId);
+    }
   }
 
   function openAdd() {
@@ -125,11 +174,18 @@ export default function DashboardScreen({ navigation }: Props) {
         data={folders}
         keyExtractor={(item) => item.id.toString()}
         renderItem={({ item }) => {
-          const folderInspections = getInspectionsByFolder(item.name);
+          const folderInspections = getInspectionsByFolder(item.id);
+          const isOpen = openFolderId === item.id;
+          const nextCursor = folderPages[item.id]?.nextCursor ?? null;
           return (
             <View style={styles.folderCard}>
               <View style={styles.folderHeader}>
-                <Text style={styles.folderName}>{item.name}</Text>
+                <TouchableOpacity onPress={() => toggleFolder(item.id)}>
+                  <Text style={styles.folderName}>{item.name}</Text>
+                  <Text style={styles.inspectionMeta}>
+                    {item.inspection_count} registros
+                  </Text>
+                </TouchableOpacity>
                 <TouchableOpacity
                   onPress={() => handleDeleteFolder(item.id)}
                 >
@@ -137,7 +193,7 @@ export default function DashboardScreen({ navigation }: Props) {
                 </TouchableOpacity>
               </View>
 
-              {folderInspections.length === 0 ? (
+              {!isOpen ? null : item.inspection_count === 0 ? (
                 <Text style={styles.emptyText}>0 registros</Text>
               ) : (
                 folderInspections.map((ins) => (
@@ -165,6 +221,13 @@ export default function DashboardScreen({ navigation }: Props) {
                   </View>
                 ))
               )}
+              {isOpen && nextCursor && (
+                <TouchableOpacity
+                  onPress={() => loadFolderPage(item.id, nextCursor)}
+                >
+                  <Text style={styles.actionText}>Carregar mais</Text>
+                </TouchableOpacity>
+              )}
             </View>
           );
         }}
@@ -0,0 +1,37 @@
+"""
+Registro de alterações (change_log) usado pelo ETag e pela sincronização incremental do dashboard.
+
+O token de alteração é a coluna `seq`, alocada do contador `change_counter`
+com a linha travada até o commit: as transações que registram alterações
+recebem seq em ordem e ficam visíveis nessa mesma ordem. (O id AUTO_INCREMENT
+não serve de token: ids podem ser confirmados fora de ordem, e um cliente com
+since=N perderia para sempre um N-1 que ainda não tinha sido confirmado.)
+"""
+
+
+def next_change_seq(cur):
+    """
+    Aloca o próximo seq. A linha do contador fica travada até o fim da
+    transação: registre as alterações por último, depois dos outros locks da
+    transação, para não segurar o contador (nem criar deadlocks com ele).
+    """
+    cur.execute("UPDATE change_counter SET value = LAST_INSERT_ID(value + 1) WHERE id = 1")
+    cur.execute("SELECT LAST_INSERT_ID() AS seq")
+    return cur.fetchone()['seq']
+
+
+def record_changes(cur, changes):
+    """Registra várias alterações (entity, entity_id, folder_id, action) com um único seq."""
+    changes = list(changes)
+    if not changes:
+        return
+    seq = next_change_seq(cur)
+    cur.executemany("""
+        INSERT INTO change_log (seq, entity, entity_id, folder_id, action, changed_at)
+        VALUES (%s, %s, %s, %s, %s, UTC_TIMESTAMP())
+    """, [(seq, *change) for change in changes])
+
+
+def record_change(cur, entity, entity_id, action, folder_id=None):
+    """Registra uma alteração no change_log (entity: 'folder'/'inspection', action: 'upsert'/'delete')."""
+    record_changes(cur, [(entity, entity_id, folder_id, action)])
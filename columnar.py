@@ -0,0 +1,210 @@
+import re
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# Unidades aceitas em dimensions_unit -> (unidade canônica, fator de conversão)
+UNIT_CONVERSIONS = {
+    'mm': ('m', 0.001),
+    'cm': ('m', 0.01),
+    'm': ('m', 1.0),
+    'km': ('m', 1000.0),
+    'pol': ('m', 0.0254),
+    'in': ('m', 0.0254),
+    'ft': ('m', 0.3048),
+    'cm2': ('m2', 0.0001),
+    'm2': ('m2', 1.0),
+    'ha': ('m2', 10000.0),
+    'l': ('m3', 0.001),
+    'm3': ('m3', 1.0),
+}
+
+_UNIT_ALIASES = {
+    'metro': 'm', 'metros': 'm',
+    'centimetro': 'cm', 'centimetros': 'cm', 'centímetro': 'cm', 'centímetros': 'cm',
+    'milimetro': 'mm', 'milimetros': 'mm', 'milímetro': 'mm', 'milímetros': 'mm',
+    'polegada': 'pol', 'polegadas': 'pol', '"': 'pol',
+    'litro': 'l', 'litros': 'l',
+}
+
+
+def to_float(value):
+    """Converte números gravados como texto (inclusive com vírgula decimal) para float."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(',', '.')
+    if not text or text.lower() == 'none':
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def normalize_dimension(value, unit):
+    """Retorna (valor, unidade) na unidade canônica, ou (None, None) se a unidade for desconhecida."""
+    number = to_float(value)
+    if number is None or not unit:
+        return None, None
+    key = re.sub(r"\s+", "", str(unit).lower()).replace('²', '2').replace('³', '3').rstrip('.')
+    key = _UNIT_ALIASES.get(key, key)
+    if key not in UNIT_CONVERSIONS:
+        return None, None
+    canonical, factor = UNIT_CONVERSIONS[key]
+    return number * factor, canonical
+
+
+def inspection_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('name', pa.string()),
+        ('created_at', pa.timestamp('s')),
+        ('folder_id', pa.int64()),
+        ('folder_name', pa.dictionary(pa.int32(), pa.string())),
+        ('dimensions_value', pa.float64()),
+        ('dimensions_unit', pa.dictionary(pa.int32(), pa.string())),
+        ('dimensions_value_canonical', pa.float64()),
+        ('dimensions_unit_canonical', pa.dictionary(pa.int32(), pa.string())),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('observations', pa.string()),
+        ('jusante_photo', pa.string()),
+        ('montante_photo', pa.string()),
+        ('other_photos', pa.string()),
+    ])
+
+
+def rows_to_record_batch(rows, schema):
+    """Converte um lote de linhas do cursor (dicts) num RecordBatch tipado."""
+    canonical = [normalize_dimension(r['dimensions_value'], r['dimensions_unit']) for r in rows]
+    columns = {
+        'id': [r['id'] for r in rows],
+        'name': [r['name'] for r in rows],
+        'created_at': [r['created_at'] for r in rows],
+        'folder_id': [r['folder_id'] for r in rows],
+        'folder_name': [r['folder_name'] for r in rows],
+        'dimensions_value': [to_float(r['dimensions_value']) for r in rows],
+        'dimensions_unit': [r['dimensions_unit'] for r in rows],
+        'dimensions_value_canonical': [c[0] for c in canonical],
+        'dimensions_unit_canonical': [c[1] for c in canonical],
+        'latitude': [to_float(r['latitude']) for r in rows],
+        'longitude': [to_float(r['longitude']) for r in rows],
+        'observations': [r['observations'] for r in rows],
+        'jusante_photo': [r['jusante_photo'] for r in rows],
+        'montante_photo': [r['montante_photo'] for r in rows],
+        'other_photos': [r['other_photos'] for r in rows],
+    }
+    arrays = [pa.array(columns[field.name], type=field.type) for field in schema]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _SinkBuffer:
+    """Destino de escrita do pyarrow que acumula os bytes até serem drenados."""
+
+    def __init__(self):
+        self._chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_columnar(row_batches, export_format):
+    """
+    Gera um arquivo Parquet ou Arrow IPC (stream) em pedaços.
+    `row_batches` é um iterável de listas de linhas; cada lista vira um
+    row group (Parquet) ou um record batch (Arrow) e é enviada em seguida.
+    """
+    schema = inspection_schema()
+    buffer = _SinkBuffer()
+    sink = pa.PythonFile(buffer, mode='w')
+
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    for rows in row_batches:
+        write(rows_to_record_batch(rows, schema))
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
+
+    writer.close()
+    yield buffer.drain()
+
+
+# ==============================================================================
+# MODO COLUNAR DO DASHBOARD (format=columnar)
+# ==============================================================================
+
+DASHBOARD_INSPECTION_COLUMNS = (
+    'id', 'name', 'created_at', 'folder_id', 'dimensions_value', 'dimensions_unit',
+    'latitude', 'longitude', 'thumbnail',
+)
+DASHBOARD_FOLDER_COLUMNS = ('id', 'name', 'inspection_count', 'latest_created_at')
+
+
+def iso_datetime(value):
+    return value.isoformat(timespec='seconds') if value is not None else None
+
+
+def strip_prefix(value, prefix):
+    if value and value.startswith(prefix):
+        return value[len(prefix):]
+    return value
+
+
+def columns_from_rows(rows, columns):
+    """Lista de dicts -> {coluna: [valores, ...]}: o nome de cada campo vai uma única vez."""
+    return {column: [row[column] for row in rows] for column in columns}
+
+
+def compact_dashboard(folders, inspections, thumbnail_base):
+    """
+    Resposta compacta do dashboard: pastas e inspeções em colunas, sem o
+    folder_name repetido (folder_names traz o nome de cada pasta da página),
+    GPS numérico, datas ISO e miniaturas relativas a `thumbnail_base`.
+    """
+    folder_names = {}
+    rows = []
+    for row in inspections:
+        folder_names[row['folder_id']] = row['folder_name']
+        rows.append({
+            **row,
+            'created_at': iso_datetime(row['created_at']),
+            'latitude': to_float(row['latitude']),
+            'longitude': to_float(row['longitude']),
+            'thumbnail': strip_prefix(row['thumbnail'], thumbnail_base),
+        })
+
+    result = {
+        'inspections': columns_from_rows(rows, DASHBOARD_INSPECTION_COLUMNS),
+        'folder_names': folder_names,
+        'thumbnail_base': thumbnail_base,
+    }
+    if folders is not None:
+        folders = [{**folder, 'latest_created_at': iso_datetime(folder['latest_created_at'])} for folder in folders]
+        result['folders'] = columns_from_rows(folders, DASHBOARD_FOLDER_COLUMNS)
+    return result
@@ -0,0 +1,96 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Tipos de resposta comprimidos (fotos, PDFs e ZIPs já são comprimidos)
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv', 'application/x-ndjson'}
+
+
+def available_encodings():
+    """Codificações suportadas, da preferida para a menos preferida."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Escolhe a codificação pelo Accept-Encoding da requisição (respeitando os
+    pesos q=); em empate, prefere brotli. Retorna None se nenhuma for aceita.
+    """
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    """Compressor incremental (gzip ou brotli) com a mesma interface para os dois."""
+
+    def __init__(self, encoding, gzip_level=6, brotli_quality=5):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress_stream(chunks, compressor):
+    """Comprime um gerador de bytes pedaço por pedaço (respostas em streaming)."""
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def init_app(app, min_size=1024, gzip_level=6, brotli_quality=5):
+    """
+    Comprime as respostas JSON e CSV com gzip ou brotli, conforme o
+    Accept-Encoding do cliente. Respostas menores que `min_size` bytes saem
+    sem compressão; as em streaming (exportações) são comprimidas por pedaço.
+    O ETag vira fraco (W/"..."), já que o corpo depende da codificação.
+    """
+    from flask import request
+
+    @app.after_request
+    def _compress_response(response):
+        if (request.method == 'HEAD' or response.status_code != 200
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        compressor = Compressor(encoding, gzip_level, brotli_quality)
+        if response.is_streamed:
+            response.response = compress_stream(response.iter_encoded(), compressor)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(compressor.compress(data) + compressor.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -1,11 +1,274 @@
-from flask_mysqldb import MySQL
-from flask import Flask
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import Flask, g
+
+from instrumentation import observe_query
 
 app = Flask(__name__)
-app.config["MYSQL_HOST"] = "localhost"
-app.config["MYSQL_USER"] = "root"
-app.config["MYSQL_PASSWORD"] = "rodrigo09!"
-app.config["MYSQL_DB"] = "campo_manager"
+app.config["MYSQL_HOST"] = os.environ.get("MYSQL_HOST", "localhost")
+app.config["MYSQL_USER"] = os.environ.get("MYSQL_USER", "root")
+app.config["MYSQL_PASSWORD"] = os.environ.get("MYSQL_PASSWORD", "rodrigo09!")
+app.config["MYSQL_DB"] = os.environ.get("MYSQL_DB", "campo_manager")
 app.config["MYSQL_CURSORCLASS"] = "DictCursor"
 
-mysql = MySQL(app)
+# Pool de conexões
+app.config["MYSQL_POOL_SIZE"] = int(os.environ.get("MYSQL_POOL_SIZE", 10))
+app.config["MYSQL_POOL_TIMEOUT"] = float(os.environ.get("MYSQL_POOL_TIMEOUT", 10))
+app.config["MYSQL_POOL_RECYCLE"] = int(os.environ.get("MYSQL_POOL_RECYCLE", 3600))
+app.config["MYSQL_POOL_PING_INTERVAL"] = int(os.environ.get("MYSQL_POOL_PING_INTERVAL", 30))
+
+
+class _TimedCursorMixin:
+    """Registra a duração de cada execute/executemany nas métricas (e loga SQL lento)."""
+
+    _in_executemany = False
+
+    def execute(self, query, args=None):
+        if self._in_executemany:
+            # executemany de comandos que não são INSERT chama execute por linha: mede só o total
+            return super().execute(query, args)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            observe_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        self._in_executemany = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            observe_query(query, time.perf_counter() - start)
+
+
+class TimedDictCursor(_TimedCursorMixin, MySQLdb.cursors.DictCursor):
+    pass
+
+
+class TimedSSDictCursor(_TimedCursorMixin, MySQLdb.cursors.SSDictCursor):
+    pass
+
+
+TIMED_CURSORS = {'DictCursor': TimedDictCursor, 'SSDictCursor': TimedSSDictCursor}
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite do pool."""
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Pool de conexões MySQL com tamanho máximo, verificação de saúde e reciclagem.
+
+    - Conexões são criadas sob demanda até `size`; acima disso a requisição
+      espera até `timeout` segundos por uma conexão livre (PoolTimeout).
+    - Conexões paradas há mais de `ping_interval` segundos são testadas com ping.
+    - Conexões mais velhas que `recycle` segundos são fechadas e recriadas.
+    """
+
+    def __init__(self, connect_kwargs, size=10, timeout=10, recycle=3600, ping_interval=30):
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._created = 0
+        self._in_use = 0
+
+        # Métricas acumuladas
+        self._acquires = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._failed_pings = 0
+
+    def _connect(self):
+        return _PooledConnection(MySQLdb.connect(**self.connect_kwargs))
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, entry):
+        now = time.monotonic()
+        if now - entry.created_at > self.recycle:
+            self._close(entry)
+            self._recycled += 1
+            return self._connect()
+        if now - entry.last_used > self.ping_interval:
+            try:
+                entry.conn.ping()
+            except MySQLdb.Error:
+                self._close(entry)
+                self._failed_pings += 1
+                return self._connect()
+        return entry
+
+    def acquire(self):
+        """Retira uma conexão do pool (bloqueia até `timeout` se estiver cheio)."""
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    entry = None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout("Nenhuma conexão disponível no pool")
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._acquires += 1
+            wait_time = time.monotonic() - start
+            if waited:
+                self._waits += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        try:
+            return self._connect() if entry is None else self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, entry, discard=False):
+        """Devolve a conexão; transações não confirmadas são desfeitas."""
+        if not discard:
+            try:
+                entry.conn.rollback()
+            except MySQLdb.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+
+        if discard:
+            self._close(entry)
+
+    def stats(self):
+        """Métricas do pool para dimensionamento em produção."""
+        with self._cond:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'acquires': self._acquires,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_time_total, 6),
+                'wait_time_avg': round(self._wait_time_total / self._acquires, 6) if self._acquires else 0.0,
+                'wait_time_max': round(self._wait_time_max, 6),
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'failed_pings': self._failed_pings,
+            }
+
+
+pool = ConnectionPool(
+    {
+        'host': app.config["MYSQL_HOST"],
+        'user': app.config["MYSQL_USER"],
+        'passwd': app.config["MYSQL_PASSWORD"],
+        'db': app.config["MYSQL_DB"],
+        'charset': 'utf8mb4',
+        'cursorclass': TIMED_CURSORS.get(app.config["MYSQL_CURSORCLASS"]) or getattr(MySQLdb.cursors, app.config["MYSQL_CURSORCLASS"]),
+    },
+    size=app.config["MYSQL_POOL_SIZE"],
+    timeout=app.config["MYSQL_POOL_TIMEOUT"],
+    recycle=app.config["MYSQL_POOL_RECYCLE"],
+    ping_interval=app.config["MYSQL_POOL_PING_INTERVAL"],
+)
+
+
+def get_db():
+    """Conexão do contexto atual (requisição ou job), retirada do pool no primeiro uso."""
+    if 'db_conn' not in g:
+        g.db_conn = pool.acquire()
+    return g.db_conn.conn
+
+
+def release_db(exc=None):
+    """Devolve a conexão do contexto atual ao pool (pode ser chamada antes do fim da requisição)."""
+    entry = g.pop('db_conn', None)
+    if entry is not None:
+        pool.release(entry, discard=isinstance(exc, MySQLdb.OperationalError))
+
+
+app.teardown_appcontext(release_db)
+
+
+@contextmanager
+def db_cursor():
+    """Cursor que é sempre fechado, mesmo em caso de erro ou retorno antecipado."""
+    cur = get_db().cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+
+@contextmanager
+def db_transaction():
+    """Cursor numa transação: commit ao sair normalmente, rollback em caso de exceção."""
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+@contextmanager
+def db_stream_cursor():
+    """
+    Cursor não bufferizado (server-side): as linhas vêm do MySQL conforme
+    são lidas com fetchmany, sem carregar o resultado inteiro em memória.
+    A conexão não pode executar outra consulta até o cursor ser fechado.
+    """
+    cur = get_db().cursor(TimedSSDictCursor)
+    try:
+        yield cur
+    finally:
+        cur.close()
@@ -31,7 +31,7 @@ function AddRecord() {
 
   // Busca pastas para o <select>
   useEffect(() => {
-    apiClient.get('/api/dashboard').then(res => {
+    apiClient.get('/api/folders').then(res => {
       setFolders(res.data.folders);
       if (res.data.folders.length > 0) {
         setFolderId(res.data.folders[0].id); // Seleciona a primeira
@@ -20,22 +20,60 @@ const apiClient = axios.create({
 });
 
 
+// Resposta colunar do dashboard ({campo: [valores]}) de volta para objetos
+const inspectionsFromColumns = (data) => {
+  const columns = data.inspections;
+  const names = Object.keys(columns);
+  const count = names.length ? columns[names[0]].length : 0;
+  return Array.from({ length: count }, (_, i) => {
+    const row = {};
+    names.forEach(name => { row[name] = columns[name][i]; });
+    row.folder_name = data.folder_names[row.folder_id];
+    row.thumbnail = row.thumbnail ? `${data.thumbnail_base}${row.thumbnail}` : null;
+    return row;
+  });
+};
+
+
 function Dashboard() {
   const [folders, setFolders] = useState([]);
-  const [inspections, setInspections] = useState([]);
+  // Inspeções carregadas por pasta: { [folderId]: { items: [], nextCursor: null } }
+  const [folderPages, setFolderPages] = useState({});
   const [newFolderName, setNewFolderName] = useState('');
   
   const [openFolder, setOpenFolder] = useState(null); 
 
+  const fetchFolderPage = (folderId, cursor = null) => {
+    const params = { folder_id: folderId, format: 'columnar' };
+    if (cursor) params.cursor = cursor;
+
+    apiClient.get('/api/dashboard', { params })
+      .then(response => {
+        setFolderPages(prev => {
+          const previousItems = cursor && prev[folderId] ? prev[folderId].items : [];
+          return {
+            ...prev,
+            [folderId]: {
+              items: [...previousItems, ...inspectionsFromColumns(response.data)],
+              nextCursor: response.data.next_cursor
+            }
+          };
+        });
+      })
+      .catch(error => console.error("Erro ao buscar inspeções:", error));
+  };
+
   const fetchData = () => {
-    // ... (restante da função fetchData)
-    apiClient.get('/api/dashboard')
+    apiClient.get('/api/folders')
       .then(response => {
-        setFolders(response.data.folders);
-        setInspections(response.data.inspections);
-        
-        if (!openFolder && response.data.folders.length > 0) {
-            setOpenFolder(response.data.folders[0].name);
+        const loadedFolders = response.data.folders;
+        setFolders(loadedFolders);
+        setFolderPages({});
+
+        const current = loadedFolders.find(f => f.name === openFolder) || (!openFolder && loadedFolders[0]);
+        if (current) {
+          setOpenFolder(current.name);
+          fetchFolderPage(current.id);
         }
       })
       .catch(error => console.error("Erro ao buscar dados:", error));
@@ -45,6 +83,17 @@ function Dashboard() {
     fetchData();
   }, []);
 
+  const toggleFolder = (folder) => {
+    if (openFolder === folder.name) {
+      setOpenFolder(null);
+      return;
+    }
+    setOpenFolder(folder.name);
+    if (!folderPages[folder.id]) {
+      fetchFolderPage(folder.id);
+    }
+  };
+
   const handleCreateFolder = (e) => {
     // ... (restante da função handleCreateFolder)
     e.preventDefault();
@@ -75,7 +124,7 @@ function Dashboard() {
     const confirmMessage = `Tem certeza que deseja excluir a pasta "${folderName}"?\n\nATENÇÃO: Todos os registros de inspeção dentro dela também serão permanentemente excluídos.`;
 
     if (window.confirm(confirmMessage)) {
-      apiClient.get(`/api/folder/delete/${folderId}`)
+      apiClient.delete(`/api/folder/${folderId}`)
         .then(res => {
           if (res.data.success) {
             fetchData(); 
@@ -117,9 +166,10 @@ function Dashboard() {
   // NOVAS FUNÇÕES DE DOWNLOAD (Features 1, 2, 4)
   // =================================================================
 
-  // Feature 1: Baixar Fotos (ZIP/PNG)
+  // Feature 1: Baixar Fotos (ZIP; JPEG/PNG vão como estão, só HEIC é convertido)
   const handleDownloadPhotos = (id, name) => {
     apiClient.get(`/api/inspection/photos/${id}`, {
+      params: { format: 'jpeg' },
       responseType: 'blob' 
     }).then(response => {
       const url = window.URL.createObjectURL(new Blob([response.data]));
@@ -190,10 +240,12 @@ function Dashboard() {
   // FIM DAS NOVAS FUNÇÕES
   // =================================================================
   
-  const getInspectionsByFolder = (folderName) => {
-    return inspections.filter(i => i.folder_name === folderName);
+  const getInspectionsByFolder = (folderId) => {
+    return folderPages[folderId] ? folderPages[folderId].items : [];
   };
 
+  const totalInspections = folders.reduce((total, f) => total + f.inspection_count, 0);
+
   // --- Renderização ---
   return (
     <div className="dashboard-container">
@@ -202,7 +254,7 @@ function Dashboard() {
       <div className="card list-header">
         <div className="list-header-title">
           <h3>Arquivos de Inspeção</h3>
-          <small>{inspections.length} registros encontrados</small>
+          <small>{totalInspections} registros encontrados</small>
         </div>
         
         <form onSubmit={handleCreateFolder} className="new-folder-form">
@@ -221,14 +273,15 @@ function Dashboard() {
 
       {/* Lista de Pastas e Inspeções */}
       {folders.map(folder => {
-        const inspectionsInFolder = getInspectionsByFolder(folder.name);
+        const inspectionsInFolder = getInspectionsByFolder(folder.id);
+        const nextCursor = folderPages[folder.id] ? folderPages[folder.id].nextCursor : null;
         const isOpen = openFolder === folder.name;
 
         return (
           <div className="folder-group" key={folder.id}>
             
             {/* Header da Pasta */}
-            <div className="folder-header" onClick={() => setOpenFolder(isOpen ? null : folder.name)}>
+            <div className="folder-header" onClick={() => toggleFolder(folder)}>
               <div className="folder-title">
                 {isOpen ? <IoChevronUp /> : <IoChevronDown />}
                 <h3>{folder.name}</h3>
@@ -237,20 +290,20 @@ function Dashboard() {
               <div className="folder-header-right">
                 
                 {/* NOVO BOTÃO: Baixar Todos os PDFs da Pasta (Feature 4) */}
-                {inspectionsInFolder.length > 0 && (
+                {folder.inspection_count > 0 && (
                   <button 
                     className="button-icon-pdf" /* Reutilizando o estilo do PDF individual */
                     onClick={(e) => {
                       e.stopPropagation(); // Evita fechar/abrir a pasta
                       handleDownloadFolderPdfs(folder.id, folder.name);
                     }}
-                    title={`Baixar todos os ${inspectionsInFolder.length} PDFs da pasta`}
+                    title={`Baixar todos os ${folder.inspection_count} PDFs da pasta`}
                   >
                     <IoAlbumsOutline size={16} />
                   </button>
                 )}
                 
-                <span className="folder-count">{inspectionsInFolder.length} registros</span>
+                <span className="folder-count">{folder.inspection_count} registros</span>
                 <button 
                   className="button-icon-delete"
                   onClick={(e) => handleDeleteFolder(e, folder.id, folder.name)}
@@ -324,6 +377,11 @@ function Dashboard() {
                     </div>
                   ))
                 )}
+                {nextCursor && (
+                  <button className="button-load-more" onClick={() => fetchFolderPage(folder.id, nextCursor)}>
+                    Carregar mais
+                  </button>
+                )}
               </div>
             )}
           </div>
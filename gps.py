@@ -0,0 +1,167 @@
+import os
+import logging
+
+from PIL import Image
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
+
+from instrumentation import stage
+from storage import photo_store
+
+logger = logging.getLogger("campo_manager")
+
+GPS_IFD_TAG = 34853 # ID da tag para o bloco GPS
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+
+def rational_to_float(value):
+    """
+    Converte um valor EXIF numérico para float. Aceita as formas que o Pillow
+    devolve conforme a versão: tupla (numerador, denominador), IFDRational,
+    Fraction, int/float ou texto.
+    """
+    if isinstance(value, (tuple, list)):
+        if len(value) != 2:
+            raise ValueError(f"racional inválido: {value!r}")
+        numerator, denominator = value
+        return float(numerator) / float(denominator)
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore").strip("\x00 ")
+    result = float(value)
+    if result != result: # NaN (IFDRational com denominador 0)
+        raise ValueError("racional com denominador zero")
+    return result
+
+
+def normalize_ref(ref):
+    """Normaliza a referência (N/S/E/W), que pode vir como bytes com NUL no final."""
+    if isinstance(ref, bytes):
+        ref = ref.decode("ascii", "ignore")
+    return str(ref or "").strip("\x00 ").upper()[:1]
+
+
+def convert_dms_to_decimal(dms, ref):
+    """
+    Converte coordenadas EXIF (Graus, Minutos, Segundos) para formato decimal.
+    Aceita DMS completo, só graus e minutos, ou um único valor em graus decimais.
+    """
+    if isinstance(dms, (tuple, list)) and len(dms) == 2 and not isinstance(dms[0], (tuple, list)):
+        # (graus, minutos) — alguns aparelhos omitem os segundos
+        parts = [rational_to_float(part) for part in dms]
+    elif isinstance(dms, (tuple, list)):
+        parts = [rational_to_float(part) for part in dms[:3]]
+    else:
+        parts = [rational_to_float(dms)]
+
+    degrees = parts[0]
+    minutes = parts[1] if len(parts) > 1 else 0.0
+    seconds = parts[2] if len(parts) > 2 else 0.0
+
+    decimal = abs(degrees) + (minutes / 60.0) + (seconds / 3600.0)
+
+    if degrees < 0 or normalize_ref(ref) in ('S', 'W'):
+        decimal = -decimal
+    return f"{decimal:.6f}" # Retorna como string formatada
+
+
+def extract_gps_from_exif(exif_data):
+    """
+    Extrai Latitude e Longitude de um objeto EXIF do Pillow (Image.getexif()).
+    Retorna (latitude_str, longitude_str) ou (None, None).
+    """
+    if not exif_data:
+        logger.debug("GPS: nenhum dado EXIF encontrado na imagem.")
+        return None, None
+
+    try:
+        gps_info = exif_data.get_ifd(GPS_IFD_TAG)
+    except AttributeError:
+         gps_info = exif_data.get(GPS_IFD_TAG)
+
+    if not gps_info:
+        logger.debug("GPS: bloco GPS (tag 34853) não encontrado (sem localização).")
+        return None, None
+
+    if not all(tag in gps_info for tag in [GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE]):
+        logger.debug("GPS: tags de latitude/longitude incompletas.")
+        return None, None
+
+    lat_dms_raw = gps_info.get(GPS_LATITUDE)
+    lon_dms_raw = gps_info.get(GPS_LONGITUDE)
+    lat_ref_raw = gps_info.get(GPS_LATITUDE_REF)
+    lon_ref_raw = gps_info.get(GPS_LONGITUDE_REF)
+
+    logger.debug("GPS: dados brutos lat=%s %s lon=%s %s", lat_dms_raw, lat_ref_raw, lon_dms_raw, lon_ref_raw)
+
+    try:
+        latitude = convert_dms_to_decimal(lat_dms_raw, lat_ref_raw)
+        longitude = convert_dms_to_decimal(lon_dms_raw, lon_ref_raw)
+    except (TypeError, ValueError, ZeroDivisionError) as e:
+        logger.debug("GPS: formato DMS inválido (%s).", e)
+        return None, None
+
+    if gps_numeric(latitude, longitude) == (None, None):
+        logger.debug("GPS: coordenadas fora da faixa: %s, %s", latitude, longitude)
+        return None, None
+
+    logger.debug("GPS: conversão concluída. Lat: %s, Lon: %s", latitude, longitude)
+    return latitude, longitude
+
+
+def gps_numeric(latitude, longitude):
+    """Converte as coordenadas em texto para números (colunas gps_lat/gps_lon) ou (None, None)."""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, None
+    return lat, lon
+
+
+def extract_gps_data(file_path):
+    """
+    Extrai Latitude e Longitude de uma imagem já salva usando dados EXIF.
+    Retorna (latitude_str, longitude_str) ou (None, None).
+    """
+    if not file_path:
+        return None, None
+
+    full_path = photo_store.full_path(file_path)
+    if not os.path.exists(full_path):
+        logger.debug("GPS: arquivo não encontrado: %s", full_path)
+        return None, None
+
+    try:
+        with stage('exif'), Image.open(full_path) as img:
+            return extract_gps_from_exif(img.getexif())
+    except Exception as e:
+        logger.warning("GPS: erro durante a extração de %s: %s", full_path, e)
+        return None, None
+
+
+def extract_gps_from_upload(file):
+    """
+    Extrai o GPS direto do stream do upload, antes de gravar em disco.
+    Image.open só lê o cabeçalho (EXIF), sem decodificar os pixels.
+    O stream volta para o início para o arquivo ser salvo depois.
+    """
+    if not file:
+        return None, None
+
+    try:
+        file.stream.seek(0)
+        with stage('exif'), Image.open(file.stream) as img:
+            return extract_gps_from_exif(img.getexif())
+    except Exception as e:
+        logger.warning("GPS: erro durante a extração do upload %s: %s", file.filename, e)
+        return None, None
+    finally:
+        file.stream.seek(0)
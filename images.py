@@ -0,0 +1,281 @@
+import io
+import os
+import glob
+import uuid
+import pathlib
+import threading
+
+from PIL import Image, ImageOps
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener() 
+except ImportError:
+    pass
+
+from instrumentation import stage
+from storage import photo_store
+
+DERIVATIVES_DIR = "derivatives"
+
+# Tipos de derivado: lado maior em pixels e qualidade JPEG.
+# 'print' é usado nos PDFs (80 mm de largura a ~300 dpi ≈ 950 px),
+# 'thumb' nas listas do dashboard.
+DERIVATIVE_SPECS = {
+    "print": (1200, 80),
+    "thumb": (320, 70),
+}
+
+
+def derivative_path(relative_path, kind):
+    """
+    Caminho relativo do derivado `kind` de uma foto original.
+    Ex.: static/uploads/foto_20240101.heic -> static/uploads/derivatives/foto_20240101_print.jpg
+    """
+    directory, file_name = os.path.split(relative_path)
+    base, _ = os.path.splitext(file_name)
+    return f"{directory}/{DERIVATIVES_DIR}/{base}_{kind}.jpg"
+
+
+def create_derivatives(relative_path):
+    """
+    Gera os derivados JPEG (print e thumb) de uma foto recém-enviada.
+    A imagem é decodificada uma única vez; o original é mantido intacto.
+    Retorna {kind: caminho_relativo} dos derivados criados ({} se já existiam).
+    """
+    full_path = photo_store.full_path(relative_path)
+    created = {}
+
+    # Fotos deduplicadas: o objeto já tem derivados de um envio anterior
+    existing = {kind: derivative_path(relative_path, kind) for kind in DERIVATIVE_SPECS}
+    if all(os.path.exists(photo_store.full_path(path)) for path in existing.values()):
+        return created
+
+    with stage('derivatives'), Image.open(full_path) as img:
+        # Aplica a rotação do EXIF, já que os derivados não levam os metadados
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        # Do maior para o menor, reaproveitando a imagem já reduzida
+        for kind, (max_side, quality) in sorted(DERIVATIVE_SPECS.items(), key=lambda item: -item[1][0]):
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            target = derivative_path(relative_path, kind)
+            target_full = photo_store.full_path(target)
+            os.makedirs(os.path.dirname(target_full), exist_ok=True)
+            img.save(target_full, format="JPEG", quality=quality, optimize=True, progressive=True)
+            created[kind] = target
+
+    return created
+
+
+def resolve_photo(relative_path, kind):
+    """
+    Retorna o derivado `kind` se existir, senão o próprio original
+    (registros antigos, anteriores à geração de derivados).
+    """
+    if not relative_path:
+        return relative_path
+    candidate = derivative_path(relative_path, kind)
+    if os.path.exists(photo_store.full_path(candidate)):
+        return candidate
+    return relative_path
+
+
+def remove_upload(relative_path, not_modified_since=None, still_referenced=None):
+    """
+    Remove uma foto original e seus derivados, ignorando arquivos ausentes.
+
+    O original é primeiro renomeado para uma lápide em photo_store.tmp_dir; só
+    depois são conferidos `not_modified_since` (o mtime muda quando um novo
+    upload de mesmo conteúdo reaproveita o objeto) e `still_referenced(caminho)`
+    (consulta ao DB). Se a foto voltou a ser usada, a lápide é restaurada. Um
+    upload que chega durante a janela não encontra o arquivo e grava outra cópia.
+
+    Os derivados são nomeados pelo nome base e podem ser compartilhados
+    (<sha>.jpg e <sha>.jpeg): só saem se nenhum arquivo com o mesmo nome base restar.
+    Retorna a quantidade de bytes liberados.
+    """
+    if not relative_path:
+        return 0
+    full_path = photo_store.full_path(relative_path)
+    tombstone = os.path.join(photo_store.tmp_dir, f"{uuid.uuid4().hex}.reap")
+    try:
+        os.rename(full_path, tombstone)
+    except OSError:
+        tombstone = None
+
+    freed = 0
+    if tombstone:
+        modified = not_modified_since is not None and os.path.getmtime(tombstone) > not_modified_since
+        if modified or (still_referenced and still_referenced(relative_path)):
+            try:
+                os.link(tombstone, full_path)
+            except FileExistsError:
+                # Um upload de mesmo conteúdo já gravou outra cópia
+                pass
+            os.remove(tombstone)
+            return 0
+        freed += os.path.getsize(tombstone)
+        os.remove(tombstone)
+
+    if has_same_base_name(relative_path):
+        return freed
+    for kind in DERIVATIVE_SPECS:
+        derivative_full = photo_store.full_path(derivative_path(relative_path, kind))
+        try:
+            size = os.path.getsize(derivative_full)
+            os.remove(derivative_full)
+            freed += size
+        except OSError:
+            pass
+    return freed
+
+
+def has_same_base_name(relative_path):
+    """True se resta no diretório outro arquivo com o mesmo nome base (e portanto os mesmos derivados)."""
+    directory, file_name = os.path.split(photo_store.full_path(relative_path))
+    base = glob.escape(os.path.splitext(file_name)[0])
+    return bool(glob.glob(os.path.join(directory, base)) or glob.glob(os.path.join(directory, f"{base}.*")))
+
+
+# Formatos do ZIP de fotos: 'original' copia os bytes sem decodificar,
+# 'jpeg' só converte o que não é JPEG/PNG (HEIC etc.), 'png' converte tudo
+PHOTO_EXPORT_FORMATS = ("original", "jpeg", "png")
+JPEG_PASSTHROUGH_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def export_photo(relative_path, fmt):
+    """
+    Prepara uma foto para o ZIP no formato `fmt`.
+    Retorna (extensão, dados): dados é um pathlib.Path quando o arquivo vai
+    como está (copiado do disco em blocos) ou bytes quando foi convertido.
+    """
+    full_path = photo_store.full_path(relative_path)
+    extension = os.path.splitext(relative_path)[1].lower()
+    if fmt == "original" or (fmt == "jpeg" and extension in JPEG_PASSTHROUGH_EXTENSIONS):
+        return extension.lstrip(".") or "bin", pathlib.Path(full_path)
+
+    buffer = io.BytesIO()
+    with stage(f'convert_{fmt}'), Image.open(full_path) as img:
+        if fmt == "jpeg":
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(buffer, format="JPEG", quality=90)
+            return "jpg", buffer.getvalue()
+        img.save(buffer, format="PNG")
+        return "png", buffer.getvalue()
+
+
+# Larguras servidas pelo endpoint de fotos; a largura pedida é arredondada para
+# cima para uma delas, para o cache não crescer com uma variante por pixel
+VARIANT_WIDTHS = (160, 320, 640, 960, 1280, 1920)
+
+VARIANT_FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 78, "method": 4}),
+}
+
+
+def variant_width(requested):
+    """Menor largura de VARIANT_WIDTHS que atende à pedida (ou a maior disponível)."""
+    for width in VARIANT_WIDTHS:
+        if width >= requested:
+            return width
+    return VARIANT_WIDTHS[-1]
+
+
+class PhotoVariantCache:
+    """
+    Cache em disco das versões reduzidas (largura + formato) das fotos.
+
+    A chave é o SHA-256 do original, então uma foto nova nunca reaproveita a
+    variante de outra. Os arquivos ficam em <diretório>/ab/<sha>_<largura>.<ext>;
+    o tamanho total é limitado por `max_bytes`, removendo primeiro os menos
+    usados (LRU pelo mtime).
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(f) for f in self._entries())
+
+    def _entries(self):
+        return [path for path in glob.glob(os.path.join(self.directory, '*', '*.*')) if not path.endswith('.tmp')]
+
+    def path(self, digest, width, fmt):
+        extension = VARIANT_FORMATS[fmt][1]
+        return os.path.join(self.directory, digest[:2], f"{digest}_{width}.{extension}")
+
+    def get_or_create(self, relative_path, digest, width, fmt):
+        """Caminho da variante; gera a partir da foto na primeira vez."""
+        path = self.path(digest, width, fmt)
+        if os.path.exists(path):
+            # Marca como usada recentemente para o LRU
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+        # O derivado de impressão (1200 px, já rotacionado) é bem mais barato de decodificar
+        print_side = DERIVATIVE_SPECS['print'][0]
+        source = resolve_photo(relative_path, 'print') if width <= print_side else relative_path
+        pil_format, _, _, options = VARIANT_FORMATS[fmt]
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with stage('image_variant'):
+                img = Image.open(photo_store.full_path(source))
+                if source != relative_path and img.width < width and max(img.size) >= print_side:
+                    # Foto em retrato: o derivado é limitado pelo lado maior e sai mais estreito que o pedido
+                    img.close()
+                    img = Image.open(photo_store.full_path(relative_path))
+                with img:
+                    img = ImageOps.exif_transpose(img)
+                    if img.mode not in ("RGB", "L"):
+                        img = img.convert("RGB")
+                    if img.width > width:
+                        img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+                    img.save(tmp_path, format=pil_format, **options)
+            try:
+                # link falha se outra thread já gravou a mesma variante: só quem grava conta o tamanho
+                os.link(tmp_path, path)
+            except FileExistsError:
+                return path
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        # Remove até ficar abaixo de 90% do limite, para não despejar a cada gravação
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
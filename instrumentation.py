@@ -0,0 +1,261 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import pstats
+import logging
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("campo_manager")
+
+# Limites dos buckets (segundos), do padrão dos clientes Prometheus com faixas extras para ZIPs/PDFs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Histograma cumulativo por combinação de rótulos (formato Prometheus)."""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # rótulos -> [contagem por bucket..., +Inf], soma
+        self._series = {}
+
+    def observe(self, seconds, *labels):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                sep = "," if base else ""
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "campo_http_request_duration_seconds",
+    "Duração das requisições HTTP por rota (até o fim do envio da resposta).",
+    ("method", "route", "status"),
+)
+QUERY_SECONDS = Histogram(
+    "campo_db_query_duration_seconds",
+    "Duração de cada comando SQL por tipo e tabela principal.",
+    ("statement", "table"),
+)
+STAGE_SECONDS = Histogram(
+    "campo_stage_duration_seconds",
+    "Duração das etapas pesadas (gravação de fotos, EXIF, Pillow, FPDF, ZIP).",
+    ("stage",),
+)
+
+HISTOGRAMS = [REQUEST_SECONDS, QUERY_SECONDS, STAGE_SECONDS]
+
+# METRICS_ENABLED=0 desliga os timers (as funções continuam existindo, sem custo de medição)
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 1.0))
+
+
+@contextmanager
+def stage(name):
+    """Mede uma etapa do caminho crítico: `with stage('exif'): ...`."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+def observe_stage(name, seconds):
+    """Registra uma etapa medida em outro lugar (ex.: num processo do pool de PDFs)."""
+    if ENABLED:
+        STAGE_SECONDS.observe(seconds, name)
+
+
+_STATEMENT_RE = re.compile(r"^\s*(\w+)", re.S)
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(\w+)", re.I)
+
+
+def observe_query(query, seconds):
+    """Registra a duração de um comando SQL (rótulos: verbo e primeira tabela)."""
+    if not ENABLED:
+        return
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    verb = _STATEMENT_RE.match(query)
+    table = _TABLE_RE.search(query)
+    QUERY_SECONDS.observe(seconds, verb.group(1).upper() if verb else "?", table.group(1) if table else "")
+    if seconds >= SLOW_QUERY_SECONDS:
+        logger.warning("SQL lento (%.3fs): %s", seconds, " ".join(query.split())[:500],
+                       extra={'event': 'slow_query', 'duration': round(seconds, 6)})
+
+
+def render_metrics(extra_gauges=None):
+    """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ==============================================================================
+# LOGGING ESTRUTURADO
+# ==============================================================================
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento, com os campos passados em extra={...}."""
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level="INFO", fmt="json"):
+    """
+    Configura o logger da aplicação. level=OFF desliga o log por completo
+    (nenhuma mensagem é formatada); fmt=json ou text.
+    """
+    app_logger = logging.getLogger("campo_manager")
+    app_logger.handlers.clear()
+    app_logger.propagate = False
+
+    if str(level).upper() == "OFF":
+        app_logger.disabled = True
+        return app_logger
+
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    app_logger.addHandler(handler)
+    app_logger.setLevel(str(level).upper())
+    app_logger.disabled = False
+    return app_logger
+
+
+# ==============================================================================
+# INTEGRAÇÃO COM O FLASK
+# ==============================================================================
+
+class RequestProfiler:
+    """
+    Perfil (cProfile) de uma amostra das requisições. Só um perfil roda por vez
+    (o profiler do Python é global ao processo); os que passarem de
+    `slow_seconds` são gravados em <diretório>/<timestamp>_<rota>.prof.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, slow_seconds=1.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self._busy = threading.Lock()
+
+    def start(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Outro profiler já ativo (ex.: depurador)
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile, route, seconds):
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        if seconds < self.slow_seconds:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        safe_route = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_route}.prof")
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(10)
+        logger.warning("Requisição lenta perfilada (%.3fs) em %s: %s", seconds, route, path,
+                       extra={'event': 'slow_request_profile', 'route': route,
+                              'duration': round(seconds, 6), 'profile': path})
+        logger.debug("Resumo do perfil de %s:\n%s", route, summary.getvalue())
+
+
+def init_app(app, profiler=None):
+    """Mede a latência de cada requisição por rota e, por amostragem, gera perfis das lentas."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+        g.request_profile = profiler.start() if profiler is not None else None
+
+    @app.after_request
+    def _finish_timer(response):
+        started = g.pop('request_started', None)
+        profile = g.pop('request_profile', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        method, status = request.method, response.status_code
+
+        def finish():
+            # Chamado quando a resposta termina de ser enviada (inclui ZIPs em streaming)
+            seconds = time.perf_counter() - started
+            if ENABLED:
+                REQUEST_SECONDS.observe(seconds, method, route, str(status))
+            if profile is not None:
+                profiler.stop(profile, route, seconds)
+
+        response.call_on_close(finish)
+        return response
@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+import concurrent.futures
+
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+logger = logging.getLogger("campo_manager")
+
+
+class ExportJobManager:
+    """
+    Fila de exportações pesadas executadas em segundo plano.
+
+    O estado de cada job fica em <diretório>/<job_id>.json (lido por qualquer
+    processo do servidor) e o arquivo final em <diretório>/<job_id>.zip.
+    Cada job guarda o pid e o id de instância do processo dono: se esse processo
+    não existe mais, o job é marcado como falho em vez de ficar "rodando" para
+    sempre. Uma thread verifica isso e remove os jobs concluídos há mais de
+    `max_age` segundos a cada `cleanup_interval` segundos.
+    """
+
+    def __init__(self, directory, workers=2, max_age=24 * 3600, cleanup_interval=600):
+        self.directory = directory
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export-job")
+        self._instance_id = uuid.uuid4().hex
+        os.makedirs(directory, exist_ok=True)
+        self._fail_interrupted_jobs()
+        self._thread = threading.Thread(target=self._run_cleanup, name="export-job-cleanup", daemon=True)
+        self._thread.start()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def artifact_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.zip")
+
+    def _save(self, job):
+        job['updated_at'] = time.time()
+        tmp_path = f"{self._state_path(job['id'])}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._state_path(job['id']))
+
+    def get(self, job_id):
+        """Retorna o estado do job ou None se não existir."""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def submit(self, kind, params, runner):
+        """
+        Enfileira um job e retorna seu estado inicial.
+
+        `runner(job, artifact_path, report_progress)` gera o arquivo final;
+        report_progress(done, total) atualiza o progresso persistido.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'params': params,
+            'status': 'queued',
+            'done': 0,
+            'total': None,
+            'error': None,
+            'download_name': None,
+            'created_at': time.time(),
+            'owner_pid': os.getpid(),
+            'owner_instance': self._instance_id,
+        }
+        self._save(job)
+        self._executor.submit(self._run, job, runner)
+        return job
+
+    def _run(self, job, runner):
+        job['status'] = 'running'
+        self._save(job)
+
+        def report_progress(done, total):
+            job['done'] = done
+            job['total'] = total
+            self._save(job)
+
+        artifact_path = self.artifact_path(job['id'])
+        tmp_path = f"{artifact_path}.tmp"
+        try:
+            job['download_name'] = runner(job, tmp_path, report_progress)
+            os.replace(tmp_path, artifact_path)
+            job['status'] = 'done'
+        except Exception as e:
+            logger.error("Erro no job de exportação %s: %s", job['id'], e,
+                         extra={'event': 'export_job_failed', 'job_id': job['id'], 'kind': job['kind']})
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        job['finished_at'] = time.time()
+        self._save(job)
+
+    def _fail_interrupted_jobs(self):
+        """Jobs na fila ou rodando cujo processo dono terminou não serão retomados."""
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json'):
+                continue
+            job = self.get(file_name[:-5])
+            if job and job['status'] in ('queued', 'running') and self._is_orphaned(job):
+                job['status'] = 'failed'
+                job['error'] = "Exportação interrompida pelo reinício do servidor"
+                self._save(job)
+
+    def _is_orphaned(self, job):
+        owner_pid = job.get('owner_pid')
+        if owner_pid is None:
+            # Estado gravado antes do registro do dono: só considera interrompido sem atualização recente
+            return time.time() - job.get('updated_at', 0) > self.cleanup_interval
+        if owner_pid == os.getpid():
+            # Mesmo pid: é deste processo só se for desta instância (senão o pid foi reutilizado)
+            return job.get('owner_instance') != self._instance_id
+        try:
+            os.kill(owner_pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def _run_cleanup(self):
+        while True:
+            time.sleep(self.cleanup_interval)
+            try:
+                self._fail_interrupted_jobs()
+                self.cleanup()
+            except Exception as e:
+                logger.error("Erro na limpeza dos jobs de exportação: %s", e)
+
+    def cleanup(self):
+        """Remove estados e arquivos de jobs antigos."""
+        now = time.time()
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,9 @@
+-- Índices para a paginação por cursor e os filtros do /api/dashboard.
+-- Paginação geral: ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_inspections_created_id ON inspections (created_at, id);
+
+-- Filtro por pasta + paginação, e resumo de pastas (COUNT / MAX(created_at))
+CREATE INDEX idx_inspections_folder_created_id ON inspections (folder_id, created_at, id);
+
+-- Filtro por prefixo do nome (LIKE 'abc%')
+CREATE INDEX idx_inspections_name ON inspections (name);
@@ -0,0 +1,13 @@
+-- Registro de alterações usado pelo ETag e pela sincronização incremental (since=<token>).
+-- O token de alteração é a coluna seq (migração 008), alocada de change_counter em
+-- ordem de commit; não use o id, que o AUTO_INCREMENT pode confirmar fora de ordem.
+CREATE TABLE change_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    entity ENUM('folder', 'inspection') NOT NULL,
+    entity_id INT NOT NULL,
+    folder_id INT NULL,
+    action ENUM('upsert', 'delete') NOT NULL,
+    changed_at DATETIME NOT NULL
+);
+
+CREATE INDEX idx_change_log_entity ON change_log (entity, entity_id);
@@ -0,0 +1,5 @@
+-- Chave de idempotência enviada pelo cliente na ingestão em lote (/api/bulk).
+-- Reenvios do mesmo registro são reconhecidos pela chave e não duplicam a inspeção.
+ALTER TABLE inspections
+    ADD COLUMN client_key VARCHAR(64) NULL,
+    ADD UNIQUE INDEX uq_inspections_client_key (client_key);
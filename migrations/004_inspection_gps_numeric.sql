@@ -0,0 +1,16 @@
+-- Coordenadas numéricas para consultas geográficas (caixa delimitadora, raio, vizinhos).
+-- latitude/longitude continuam como texto para compatibilidade; gps_lat/gps_lon são
+-- preenchidas pela aplicação em cada inserção.
+ALTER TABLE inspections
+    ADD COLUMN gps_lat DECIMAL(9, 6) NULL,
+    ADD COLUMN gps_lon DECIMAL(9, 6) NULL;
+
+-- Backfill dos registros existentes (apenas valores decimais válidos)
+UPDATE inspections
+SET gps_lat = CAST(latitude AS DECIMAL(9, 6)),
+    gps_lon = CAST(longitude AS DECIMAL(9, 6))
+WHERE latitude REGEXP '^-?[0-9]+(\\.[0-9]+)?$'
+  AND longitude REGEXP '^-?[0-9]+(\\.[0-9]+)?$';
+
+-- A faixa de latitude usa o índice; a longitude é filtrada na mesma varredura
+CREATE INDEX idx_inspections_gps ON inspections (gps_lat, gps_lon);
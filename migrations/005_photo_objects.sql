@@ -0,0 +1,13 @@
+-- Armazenamento de fotos endereçado pelo conteúdo (static/uploads/objects/ab/cd/<sha256><ext>).
+-- refcount = quantas colunas de inspeções apontam para o objeto; objetos com
+-- refcount 0 podem ser removidos do disco pela limpeza.
+CREATE TABLE photo_objects (
+    path VARCHAR(255) PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    size BIGINT NOT NULL,
+    refcount INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+
+CREATE INDEX idx_photo_objects_refcount ON photo_objects (refcount, updated_at);
@@ -0,0 +1,34 @@
+-- Busca textual no nome e nas observações das inspeções (/api/inspections/search).
+-- utf8mb4_unicode_ci compara sem acento e sem caixa: "erosao" encontra "Erosão".
+-- Só as duas colunas buscadas mudam de collation: um CONVERT da tabela inteira
+-- tornaria o índice único de client_key insensível a caixa ("abc" = "ABC") e
+-- poderia promover colunas TEXT para MEDIUMTEXT ao trocar o charset.
+-- O MODIFY redeclara a coluna inteira, então é montado a partir de
+-- information_schema.COLUMNS: tipo, nulidade, default e comentário são os do
+-- banco em que a migração roda, e só o charset/collation muda.
+SET @inspection_text_columns = (
+    SELECT GROUP_CONCAT(
+        CONCAT(
+            'MODIFY `', COLUMN_NAME, '` ', COLUMN_TYPE,
+            ' CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci',
+            IF(IS_NULLABLE = 'YES', ' NULL', ' NOT NULL'),
+            IF(COLUMN_DEFAULT IS NULL, '', CONCAT(' DEFAULT ', QUOTE(COLUMN_DEFAULT))),
+            IF(COLUMN_COMMENT = '', '', CONCAT(' COMMENT ', QUOTE(COLUMN_COMMENT)))
+        )
+        ORDER BY ORDINAL_POSITION SEPARATOR ', '
+    )
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'inspections'
+      AND COLUMN_NAME IN ('name', 'observations')
+);
+-- Sem as colunas a string fica NULL e o PREPARE falha: a migração para aqui
+SET @inspection_collation_sql = CONCAT('ALTER TABLE inspections ', @inspection_text_columns);
+PREPARE inspection_collation FROM @inspection_collation_sql;
+EXECUTE inspection_collation;
+DEALLOCATE PREPARE inspection_collation;
+
+-- O InnoDB atualiza o índice FULLTEXT na mesma transação dos INSERT/DELETE.
+-- As exclusões só são compactadas pelo OPTIMIZE; após exclusões em massa:
+--   SET GLOBAL innodb_optimize_fulltext_only = ON; OPTIMIZE TABLE inspections;
+-- Palavras com menos de innodb_ft_min_token_size (padrão 3) letras não são indexadas.
+CREATE FULLTEXT INDEX ft_inspections_name_observations ON inspections (name, observations);
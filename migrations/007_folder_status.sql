@@ -0,0 +1,11 @@
+-- Exclusão de pastas em segundo plano (DELETE /api/folder/<id>).
+-- A pasta é marcada como 'deleting' e some das listagens na hora; as inspeções
+-- são excluídas em lotes pequenos e a pasta é removida quando fica vazia.
+-- delete_total/delete_done alimentam /api/folder/<id>/delete-status.
+ALTER TABLE folders
+    ADD COLUMN status ENUM('active', 'deleting') NOT NULL DEFAULT 'active',
+    ADD COLUMN delete_requested_at DATETIME NULL,
+    ADD COLUMN delete_total INT NULL,
+    ADD COLUMN delete_done INT NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_folders_status ON folders (status);
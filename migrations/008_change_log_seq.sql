@@ -0,0 +1,17 @@
+-- Token de alteração confirmado em ordem (ver changelog.py).
+-- change_log.id (AUTO_INCREMENT) pode ser confirmado fora de ordem; seq é
+-- alocado do contador travado até o commit, então nunca aparece um seq menor depois.
+CREATE TABLE change_counter (
+    id TINYINT PRIMARY KEY,
+    value BIGINT NOT NULL
+);
+
+INSERT INTO change_counter (id, value)
+SELECT 1, COALESCE(MAX(id), 0) FROM change_log;
+
+-- Os tokens já entregues aos clientes (ids) continuam válidos: seq = id nos registros existentes
+ALTER TABLE change_log ADD COLUMN seq BIGINT NULL;
+UPDATE change_log SET seq = id;
+ALTER TABLE change_log MODIFY seq BIGINT NOT NULL;
+
+CREATE INDEX idx_change_log_seq ON change_log (seq, id);
@@ -0,0 +1,201 @@
+import os
+import time
+import queue
+import logging
+import threading
+import contextlib
+
+from images import DERIVATIVE_SPECS, derivative_path
+
+
+logger = logging.getLogger("campo_manager")
+
+
+class RateLimiter:
+    """Limita operações por segundo (remoções de arquivo), para não saturar o disco."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self, count=1):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + self.interval * count
+
+
+class FileReaper:
+    """
+    Remove em segundo plano as fotos das inspeções excluídas.
+
+    As exclusões só enfileiram os caminhos; uma thread os entrega em lotes de
+    até `batch_size` pares (caminho, enfileirado_em) para `remove_batch(batch)`,
+    respeitando `rate` arquivos por segundo. A fila fica em memória: o que se perder num reinício do
+    servidor é recolhido pela varredura de órfãos (sweep_orphans.py).
+    """
+
+    def __init__(self, remove_batch, rate=50, batch_size=100):
+        self.remove_batch = remove_batch
+        self.batch_size = batch_size
+        self._limiter = RateLimiter(rate)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="file-reaper", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, paths):
+        """Agenda a remoção das fotos (com os derivados); retorna imediatamente."""
+        enqueued_at = time.time()
+        for path in paths:
+            if path:
+                self._queue.put((path, enqueued_at))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._limiter.wait(len(batch))
+            try:
+                self.remove_batch(batch)
+            except Exception as e:
+                logger.error("Reaper: falha ao remover %d arquivos: %s", len(batch), e)
+
+
+class FolderDeleter:
+    """
+    Exclui em segundo plano as pastas marcadas como 'deleting'.
+
+    `delete_batch(folder_id, batch_size)` exclui até `batch_size` inspeções da
+    pasta numa transação curta (ou a própria pasta, quando já está vazia) e
+    retorna (excluídas, concluída). Entre os lotes, `rate` limita as inspeções
+    excluídas por segundo, para que inserções e leituras concorrentes não
+    fiquem esperando pelos locks. `resume()` lista as pastas que ficaram
+    pendentes num reinício; é chamado quando a thread começa.
+
+    Com vários processos no servidor, `resume_lock()` (context manager que
+    produz True se obteve o lock) garante que só um deles retome as pendentes:
+    as pastas retomadas são excluídas com o lock mantido, antes da fila normal.
+    """
+
+    def __init__(self, delete_batch, batch_size=500, rate=2000, resume=None, retry_delay=30, resume_lock=None):
+        self.delete_batch = delete_batch
+        self.batch_size = batch_size
+        self.resume = resume
+        self.resume_lock = resume_lock
+        self.retry_delay = retry_delay
+        self._limiter = RateLimiter(rate)
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="folder-deleter", daemon=True)
+        self._thread.start()
+
+    def submit(self, folder_id):
+        """Agenda a exclusão da pasta; pedidos repetidos da mesma pasta são ignorados."""
+        with self._lock:
+            if folder_id in self._queued:
+                return
+            self._queued.add(folder_id)
+        self._queue.put(folder_id)
+
+    def pending(self):
+        return len(self._queued)
+
+    def _run(self):
+        if self.resume is not None:
+            try:
+                self._resume()
+            except Exception as e:
+                logger.error("Exclusão de pastas: falha ao retomar as pendentes: %s", e)
+
+        while True:
+            folder_id = self._queue.get()
+            try:
+                self._delete_folder_or_retry(folder_id)
+            finally:
+                with self._lock:
+                    self._queued.discard(folder_id)
+
+    def _resume(self):
+        lock = self.resume_lock() if self.resume_lock is not None else contextlib.nullcontext(True)
+        with lock as acquired:
+            if not acquired:
+                logger.info("Exclusão de pastas: pendentes já retomadas por outro processo")
+                return
+            for folder_id in self.resume():
+                self._delete_folder_or_retry(folder_id)
+
+    def _delete_folder_or_retry(self, folder_id):
+        try:
+            self._delete_folder(folder_id)
+        except Exception as e:
+            logger.error("Exclusão de pastas: falha na pasta %s (nova tentativa em %ss): %s",
+                         folder_id, self.retry_delay, e,
+                         extra={'event': 'folder_delete_failed', 'folder_id': folder_id})
+            timer = threading.Timer(self.retry_delay, self.submit, [folder_id])
+            timer.daemon = True
+            timer.start()
+
+    def _delete_folder(self, folder_id):
+        started = time.monotonic()
+        total = 0
+        while True:
+            removed, finished = self.delete_batch(folder_id, self.batch_size)
+            total += removed
+            if finished:
+                break
+            self._limiter.wait(removed)
+        logger.info("Pasta %s excluída: %d inspeções em %.1fs", folder_id, total, time.monotonic() - started,
+                    extra={'event': 'folder_deleted', 'folder_id': folder_id, 'inspections': total})
+
+
+def referenced_with_derivatives(paths):
+    """Conjunto dos caminhos referenciados mais os derivados de cada um."""
+    referenced = set()
+    for path in paths:
+        referenced.add(path)
+        for kind in DERIVATIVE_SPECS:
+            referenced.add(derivative_path(path, kind))
+    return referenced
+
+
+def iter_upload_files(root_path, upload_dir):
+    """
+    Percorre o diretório de uploads (inclusive os subdiretórios dos objetos)
+    sem montar a lista inteira em memória. Gera (caminho_relativo, stat).
+    """
+    stack = [upload_dir.strip("/")]
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root_path, relative_dir)) as entries:
+                for entry in entries:
+                    relative_path = f"{relative_dir}/{entry.name}"
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(relative_path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield relative_path, entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+
+
+def find_orphans(root_path, upload_dir, referenced, grace_seconds):
+    """
+    Arquivos do diretório de uploads que nenhuma inspeção referencia (nem como
+    derivado). Arquivos mais novos que `grace_seconds` são ignorados: podem ser
+    uploads em andamento cuja inspeção ainda não foi gravada.
+    """
+    cutoff = time.time() - grace_seconds
+    for relative_path, stat in iter_upload_files(root_path, upload_dir):
+        if relative_path in referenced or stat.st_mtime > cutoff:
+            continue
+        yield relative_path, stat.st_size
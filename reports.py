@@ -0,0 +1,510 @@
+import os
+import json
+import glob
+import time
+import shutil
+import hashlib
+import logging
+import queue
+import itertools
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener() 
+except ImportError:
+    pass
+
+from images import resolve_photo
+from instrumentation import observe_stage, stage
+from storage import inspection_photo_paths, photo_store
+
+logger = logging.getLogger("campo_manager")
+
+# --- Importação FPDF2 ---
+try:
+    from fpdf import FPDF
+    try:
+        from fpdf import XPos, YPos
+    except ImportError:
+        class XPos: LMARGIN = 'L'
+        class YPos: NEXT = 'Y'
+
+except ImportError:
+    FPDF = None
+
+# Incrementar quando o layout do PDF mudar, para invalidar o cache inteiro
+PDF_LAYOUT_VERSION = 2
+
+
+def generate_single_pdf(pdf, inspection_data):
+    """Preenche o objeto FPDF com os dados de uma única inspeção."""
+    if FPDF is None:
+        raise ImportError("FPDF (fpdf2) library not available.")
+        
+    pdf.add_page()
+    
+    # Define XPos e YPos para compatibilidade
+    try:
+        from fpdf import XPos, YPos
+    except ImportError:
+        class XPos: LMARGIN = 'L'
+        class YPos: NEXT = 'Y'
+
+    # --- Conteúdo do PDF ---
+    pdf.set_font("Arial", style='B', size=16)
+    pdf.cell(0, 10, text="Relatório de Inspeção", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+    pdf.set_font("Arial", size=12)
+    pdf.ln(5)
+    
+    pdf.cell(0, 7, text=f"ID do Registro: #{str(inspection_data['id'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 7, text=f"Pasta: {str(inspection_data['folder_name'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 7, text=f"Nome: {str(inspection_data['name'])}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    
+    created_at = inspection_data.get('created_at')
+    if created_at and hasattr(created_at, 'strftime'):
+         created_at_str = created_at.strftime('%d/%m/%Y %H:%M')
+    else:
+         created_at_str = str(created_at)
+
+    pdf.cell(0, 7, text=f"Data: {created_at_str}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    # NOVO: Inclusão de Geolocation no PDF
+    latitude = inspection_data.get('latitude')
+    longitude = inspection_data.get('longitude')
+    
+    if latitude and longitude and latitude != 'None' and longitude != 'None':
+        pdf.ln(5)
+        pdf.set_font("Arial", style='B', size=12)
+        pdf.cell(0, 7, text="Localização (GPS):", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.set_font("Arial", size=12)
+        pdf.cell(0, 7, text=f"Latitude: {latitude}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.cell(0, 7, text=f"Longitude: {longitude}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+    pdf.ln(5) # Linha adicionada para consistência
+    
+    pdf.set_font("Arial", style='B', size=12)
+    pdf.cell(0, 7, text="Dimensões:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("Arial", size=12)
+    dim_text = f"Valor: {str(inspection_data['dimensions_value'])} {str(inspection_data['dimensions_unit'])}"
+    pdf.cell(0, 7, text=dim_text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    pdf.ln(5)
+    pdf.set_font("Arial", style='B', size=12)
+    pdf.cell(0, 7, text="Observações:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("Arial", size=12)
+    pdf.multi_cell(0, 5, text=str(inspection_data['observations'] or 'N/A'))
+    pdf.ln(5)
+
+    pdf.set_font("Arial", style='B', size=12)
+    pdf.cell(0, 7, text="Fotos:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(2)
+    
+    photo_paths = [
+        ("Foto Jusante", inspection_data['jusante_photo']),
+        ("Foto Montante", inspection_data['montante_photo'])
+    ]
+    
+    other_photos = json.loads(inspection_data['other_photos']) if inspection_data['other_photos'] else []
+    for i, path in enumerate(other_photos):
+        photo_paths.append((f"Outra Foto {i+1}", path))
+        
+    for label, path in photo_paths:
+        if not path:
+            continue
+
+        # Usa o derivado em resolução de impressão em vez do original da câmera
+        full_path = photo_store.full_path(resolve_photo(path, 'print'))
+        pdf.set_font("Arial", style='B', size=10)
+        pdf.cell(0, 5, text=f"{label}:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        
+        if os.path.exists(full_path):
+            try:
+                pdf.image(full_path, w=80) 
+                pdf.ln(5)
+            except Exception as img_e:
+                 logger.error("Falha ao carregar a imagem '%s' no PDF (%s): %s", label, full_path, img_e)
+                 
+                 pdf.set_text_color(255, 0, 0) # Red
+                 pdf.set_font("Arial", size=10)
+                 pdf.cell(0, 5, text=f"Erro: Não foi possível carregar {label}. Verifique o formato (JPEG, PNG).", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+                 pdf.set_text_color(0, 0, 0) # Black
+                 pdf.ln(5)
+        else:
+            pdf.set_font("Arial", size=10)
+            pdf.cell(0, 5, text="Caminho do arquivo não encontrado.", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            pdf.ln(5)
+
+
+def render_pdf_bytes(inspection_data):
+    """Gera o PDF de uma inspeção e retorna o conteúdo em bytes."""
+    with stage('pdf_render'):
+        pdf = FPDF()
+        generate_single_pdf(pdf, inspection_data)
+
+        pdf_output_raw = pdf.output(dest='S')
+
+    if isinstance(pdf_output_raw, str):
+        return pdf_output_raw.encode('latin-1')
+    elif isinstance(pdf_output_raw, (bytes, bytearray)):
+        return bytes(pdf_output_raw)
+    raise TypeError(f"A saída do PDF tem um tipo inesperado: {type(pdf_output_raw)}")
+
+
+def render_pdf_timed(inspection_data):
+    """Versão para o pool de processos: devolve (pdf_bytes, segundos) para a métrica no processo principal."""
+    start = time.perf_counter()
+    pdf_output = render_pdf_bytes(inspection_data)
+    return pdf_output, time.perf_counter() - start
+
+
+# Fila (multiprocessing) em que os processos do pool avisam o início de cada PDF
+_render_started = None
+
+
+def _init_render_worker(started_queue):
+    """Inicializador dos processos do PdfRenderPool."""
+    global _render_started
+    _render_started = started_queue
+
+
+def render_pdf_task(token, inspection_data):
+    """Executado no pool: avisa o início da renderização (o tempo limite conta daí) e gera o PDF."""
+    if _render_started is not None:
+        _render_started.put((token, time.time()))
+    return render_pdf_timed(inspection_data)
+
+
+
+class PdfCache:
+    """
+    Cache em disco dos PDFs gerados, endereçado pelo conteúdo.
+
+    A chave é um hash da linha da inspeção (incluindo o nome da pasta), do
+    conteúdo de cada foto e da existência do derivado usado no PDF, então
+    qualquer alteração gera uma chave nova.
+    Os arquivos ficam em <diretório>/<folder_id>/<inspection_id>_<chave>.pdf
+    para permitir invalidar por inspeção ou por pasta. O tamanho total é
+    limitado por `max_bytes`, removendo primeiro os menos usados (LRU pelo mtime).
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(f) for f in self._entries())
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.directory, '*', '*.pdf'))
+
+    def _photo_digest(self, relative_path):
+        try:
+            return photo_store.content_digest(relative_path)
+        except OSError:
+            return "missing"
+
+    def key(self, inspection_data):
+        sha = hashlib.sha256()
+        sha.update(f"layout:{PDF_LAYOUT_VERSION}".encode())
+        sha.update(json.dumps(inspection_data, sort_keys=True, default=str).encode('utf-8'))
+        for path in inspection_photo_paths(inspection_data):
+            sha.update(self._photo_digest(path).encode())
+            # O PDF usa o derivado 'print' quando já existe: a chave muda quando ele fica pronto
+            sha.update(resolve_photo(path, 'print').encode())
+        return sha.hexdigest()
+
+    def _path(self, inspection_data):
+        folder_dir = str(inspection_data.get('folder_id') or 0)
+        file_name = f"{inspection_data['id']}_{self.key(inspection_data)}.pdf"
+        return os.path.join(self.directory, folder_dir, file_name)
+
+    def get(self, inspection_data):
+        """Retorna os bytes do PDF em cache ou None."""
+        path = self._path(inspection_data)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Marca como usado recentemente para o LRU
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, inspection_data, pdf_bytes):
+        """Grava o PDF no cache (escrita atômica) e aplica o limite de tamanho."""
+        path = self._path(inspection_data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Versões antigas da mesma inspeção não serão mais usadas
+        self.invalidate_inspection(inspection_data['id'])
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(pdf_bytes)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        # Remove até ficar abaixo de 90% do limite, para não despejar a cada gravação
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def _remove(self, paths):
+        removed = 0
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed += size
+            except OSError:
+                pass
+        with self._lock:
+            self._total_bytes = max(0, self._total_bytes - removed)
+
+    def invalidate_inspection(self, inspection_id):
+        self._remove(glob.glob(os.path.join(self.directory, '*', f"{inspection_id}_*.pdf")))
+
+    def invalidate_folder(self, folder_id):
+        folder_dir = os.path.join(self.directory, str(folder_id))
+        self._remove(glob.glob(os.path.join(folder_dir, '*.pdf')))
+        shutil.rmtree(folder_dir, ignore_errors=True)
+
+
+def render_pdf_cached(inspection_data, cache=None):
+    """Retorna o PDF do cache ou gera e grava no cache."""
+    if cache is not None:
+        pdf_output = cache.get(inspection_data)
+        if pdf_output is not None:
+            return pdf_output
+    pdf_output = render_pdf_bytes(inspection_data)
+    if cache is not None:
+        cache.put(inspection_data, pdf_output)
+    return pdf_output
+
+
+# Tentativas de um PDF cujo pool foi reiniciado por causa de outro documento
+PDF_RENDER_ATTEMPTS = 3
+# Um PDF que não começou a ser renderizado em timeout * este fator indica um pool travado
+PDF_QUEUE_TIMEOUT_FACTOR = 3
+# Intervalo para verificar se um PDF da fila já começou a ser renderizado
+PDF_START_POLL_INTERVAL = 0.5
+
+
+class PdfRenderPool:
+    """
+    Renderiza PDFs de inspeções em paralelo usando processos.
+
+    Os resultados são entregues na mesma ordem da entrada. No máximo
+    `workers * 2` documentos ficam em processamento ao mesmo tempo, para que
+    o consumo de memória continue limitado durante o streaming do ZIP.
+    Com workers <= 1 os PDFs são gerados no próprio processo.
+
+    Os processos vêm de um forkserver (ou spawn), não de fork: o servidor já
+    tem threads rodando (uploads, reaper, métricas) e um fork herdaria locks
+    travados. O tempo limite de cada PDF conta do início da sua renderização
+    (os processos avisam por uma fila). Um PDF que o estoura não pode ser
+    cancelado, então o pool, compartilhado por todas as exportações, é
+    encerrado e recriado; os PDFs das outras exportações interrompidos por
+    isso são reenviados (até PDF_RENDER_ATTEMPTS vezes) em vez de falhar.
+    """
+
+    def __init__(self, workers=None, timeout=60):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.timeout = timeout
+        self._executor = None
+        self._started_queue = None
+        self._started = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._started_queue = context.Queue()
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_render_worker,
+                    initargs=(self._started_queue,)
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        """Encerra `executor` (se ainda for o atual), matando os processos travados."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            # Um processo morto no meio de um put pode deixar a fila travada: usa uma nova
+            self._started_queue = None
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            try:
+                process.terminate()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, data, attempts=1):
+        """Envia um PDF ao pool atual (outra requisição pode tê-lo recriado)."""
+        executor = self._get_executor()
+        with self._lock:
+            token = next(self._tokens)
+        return {
+            'data': data,
+            'future': executor.submit(render_pdf_task, token, data),
+            'executor': executor,
+            'token': token,
+            'attempts': attempts,
+            'submitted_at': time.time(),
+        }
+
+    def _started_at(self, token):
+        """Quando o PDF `token` começou a ser renderizado (None se ainda está na fila do pool)."""
+        with self._lock:
+            while self._started_queue is not None:
+                try:
+                    started_token, started_at = self._started_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._started[started_token] = started_at
+            if len(self._started) > 4096:
+                # Avisos que chegaram depois do resultado (o PDF já foi entregue)
+                cutoff = time.time() - self.timeout * PDF_QUEUE_TIMEOUT_FACTOR
+                self._started = {key: value for key, value in self._started.items() if value > cutoff}
+            return self._started.get(token)
+
+    def _forget(self, task):
+        with self._lock:
+            self._started.pop(task['token'], None)
+
+    def _wait(self, task):
+        """Resultado do PDF; TimeoutError se passar de `timeout` segundos desde o início da renderização."""
+        future = task['future']
+        while True:
+            started_at = self._started_at(task['token'])
+            if started_at is not None:
+                remaining = started_at + self.timeout - time.time()
+            else:
+                remaining = task['submitted_at'] + self.timeout * PDF_QUEUE_TIMEOUT_FACTOR - time.time()
+            if remaining <= 0 and not future.done():
+                raise concurrent.futures.TimeoutError()
+            try:
+                if started_at is not None:
+                    return future.result(timeout=max(remaining, 0))
+                return future.result(timeout=min(max(remaining, 0), PDF_START_POLL_INTERVAL))
+            except concurrent.futures.TimeoutError:
+                continue
+
+    def render_ordered(self, inspections, cache=None):
+        """
+        Gera tuplas (inspection_data, pdf_bytes, erro) na ordem de `inspections`.
+        Em caso de falha ou timeout, pdf_bytes é None e erro traz a exceção.
+        PDFs encontrados em `cache` (PdfCache) não são enviados ao pool.
+        """
+        if self.workers <= 1:
+            for data in inspections:
+                try:
+                    yield data, render_pdf_cached(data, cache), None
+                except Exception as e:
+                    yield data, None, e
+            return
+
+        window = self.workers * 2
+        pending = []
+        items = iter(inspections)
+
+        def submit_next():
+            data = next(items, None)
+            if data is None:
+                return False
+            cached = cache.get(data) if cache is not None else None
+            if cached is not None:
+                future = concurrent.futures.Future()
+                future.set_result(cached)
+                pending.append({'data': data, 'future': future, 'executor': None, 'token': None,
+                                'attempts': 0, 'submitted_at': time.time()})
+            else:
+                pending.append(self._submit(data))
+            return True
+
+        def resubmit(task):
+            self._forget(task)
+            return self._submit(task['data'], attempts=task['attempts'] + 1)
+
+        def restart(executor):
+            # Encerra o pool e reenvia os PDFs desta exportação que ainda não tinham terminado nele
+            self._reset_executor(executor)
+            for index, task in enumerate(pending):
+                future = task['future']
+                if task['executor'] is executor and (not future.done() or future.cancelled() or future.exception()):
+                    pending[index] = resubmit(task)
+
+        try:
+            while len(pending) < window and submit_next():
+                pass
+
+            while pending:
+                task = pending.pop(0)
+                data = task['data']
+                try:
+                    pdf_output = self._wait(task)
+                except concurrent.futures.TimeoutError:
+                    logger.warning("PDF da inspeção %s excedeu %ss; reiniciando o pool de renderização",
+                                   data.get('id'), self.timeout)
+                    restart(task['executor'])
+                    yield data, None, TimeoutError(f"Tempo limite de {self.timeout}s excedido")
+                except BrokenProcessPool as e:
+                    # Pool reiniciado por um timeout (talvez de outra exportação) ou processo
+                    # morto (ex.: falta de memória): o PDF é reenviado, com limite de tentativas
+                    restart(task['executor'])
+                    if task['attempts'] < PDF_RENDER_ATTEMPTS:
+                        pending.insert(0, resubmit(task))
+                        continue
+                    yield data, None, e
+                except Exception as e:
+                    yield data, None, e
+                else:
+                    if task['executor'] is not None:
+                        pdf_output, seconds = pdf_output
+                        observe_stage('pdf_render', seconds)
+                        if cache is not None:
+                            cache.put(data, pdf_output)
+                    yield data, pdf_output, None
+                finally:
+                    self._forget(task)
+                submit_next()
+        finally:
+            # Exportação encerrada antes do fim (ex.: cliente desconectou): libera a fila do pool
+            for task in pending:
+                task['future'].cancel()
+                self._forget(task)
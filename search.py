@@ -0,0 +1,118 @@
+import re
+import unicodedata
+
+
+# Tamanho mínimo das palavras indexadas pelo InnoDB (innodb_ft_min_token_size)
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 10
+SNIPPET_LENGTH = 160
+
+# Stopwords padrão do InnoDB com 3+ letras: com "+" na busca booleana elas
+# fariam a consulta não retornar nada, então são ignoradas
+INNODB_STOPWORDS = {
+    "about", "are", "com", "for", "from", "how", "that", "the", "this",
+    "was", "what", "when", "where", "who", "will", "with", "und", "www",
+}
+
+_TERM_RE = re.compile(r'"([^"]*)"|(\w+)')
+_WORD_RE = re.compile(r"\w+")
+
+
+def fold(text):
+    """
+    Remove acentos e caixa ("Erosão" -> "erosao"), como a collation do MySQL.
+    Retorna (texto_normalizado, posições) com a posição no texto original de
+    cada caractere normalizado, para mapear as ocorrências de volta.
+    """
+    folded = []
+    positions = []
+    for index, char in enumerate(text):
+        for folded_char in unicodedata.normalize("NFD", char).lower():
+            if not unicodedata.combining(folded_char):
+                folded.append(folded_char)
+                positions.append(index)
+    return "".join(folded), positions
+
+
+def parse_query(text):
+    """
+    Termos da busca: palavras soltas e frases entre aspas. Os operadores da
+    busca booleana do MySQL são descartados. Retorna [[palavra, ...], ...],
+    uma lista de palavras por termo (uma só para palavras soltas).
+    """
+    terms = []
+    for phrase, word in _TERM_RE.findall(text or ""):
+        if phrase:
+            words = _WORD_RE.findall(phrase)
+            if any(len(w) >= MIN_TERM_LENGTH for w in words):
+                terms.append(words)
+        elif len(word) >= MIN_TERM_LENGTH and word.lower() not in INNODB_STOPWORDS:
+            terms.append([word])
+    return terms[:MAX_TERMS]
+
+
+def boolean_query(terms):
+    """
+    Expressão para MATCH ... AGAINST (... IN BOOLEAN MODE): todos os termos são
+    obrigatórios e as palavras soltas casam por prefixo ("trinca" acha "trincas").
+    """
+    parts = []
+    for words in terms:
+        if len(words) == 1:
+            parts.append(f"+{words[0]}*")
+        else:
+            parts.append('+"' + " ".join(words) + '"')
+    return " ".join(parts)
+
+
+def _term_patterns(terms):
+    patterns = []
+    for words in terms:
+        folded_words = [re.escape(fold(w)[0]) for w in words]
+        patterns.append(r"\b" + r"\W+".join(folded_words) + r"\w*")
+    return re.compile("|".join(patterns)) if patterns else None
+
+
+def find_matches(text, terms):
+    """Ocorrências dos termos no texto (sem acento e sem caixa) como [início, fim] no texto original."""
+    pattern = _term_patterns(terms)
+    if not text or pattern is None:
+        return []
+    folded, positions = fold(text)
+    return [
+        [positions[m.start()], positions[m.end() - 1] + 1]
+        for m in pattern.finditer(folded) if m.end() > m.start()
+    ]
+
+
+def snippet(text, terms, length=SNIPPET_LENGTH):
+    """
+    Trecho de até `length` caracteres em volta da primeira ocorrência dos termos.
+    Retorna (trecho, highlights), com highlights = [[início, fim], ...] relativos
+    ao trecho (o cliente decide como destacar, em HTML ou no app).
+    """
+    if not text:
+        return "", []
+    matches = find_matches(text, terms)
+    if len(text) <= length:
+        return text, matches
+
+    start = 0
+    if matches:
+        # Centraliza a primeira ocorrência, começando numa palavra inteira
+        start = max(0, min(matches[0][0] - length // 3, len(text) - length))
+        while 0 < start < matches[0][0] and not text[start - 1].isspace():
+            start += 1
+    end = min(len(text), start + length)
+    while start < end < len(text) and not text[end].isspace() and end > start + length // 2:
+        end -= 1
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    offset = len(prefix) - start
+    highlights = [
+        [max(match_start, start) + offset, min(match_end, end) + offset]
+        for match_start, match_end in matches
+        if match_start < end and match_end > start
+    ]
+    return prefix + text[start:end] + suffix, highlights
@@ -0,0 +1,215 @@
+import os
+import glob
+import json
+import uuid
+import shutil
+import hashlib
+import tempfile
+from collections import Counter
+
+from werkzeug.utils import secure_filename
+
+
+# Raiz do projeto (mesmo valor de app.root_path); os caminhos das fotos no DB são relativos a ela
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+# Extensões equivalentes: o mesmo conteúdo enviado como .jpeg ou .JPG vira o mesmo objeto .jpg
+EXTENSION_ALIASES = {'.jpeg': '.jpg', '.jpe': '.jpg', '.jfif': '.jpg', '.tif': '.tiff', '.heif': '.heic'}
+
+
+class PhotoStore:
+    """
+    Armazenamento das fotos endereçado pelo conteúdo.
+
+    Cada foto é gravada uma única vez em `<base_dir>/objects/ab/cd/<sha256><ext>`:
+    o nome é o SHA-256 do conteúdo e os primeiros bytes do hash formam
+    subdiretórios, para nenhum diretório crescer demais. Reenvios da mesma foto
+    apontam para o mesmo arquivo; a tabela photo_objects guarda quantas
+    referências (colunas de inspeções) cada objeto tem.
+
+    Os caminhos gravados no DB continuam relativos à raiz do projeto, então
+    fotos antigas (arquivos soltos em static/uploads) são lidas da mesma forma.
+    """
+
+    def __init__(self, root_path, base_dir="static/uploads", shard_levels=2):
+        self.root_path = root_path
+        self.base_dir = base_dir.strip("/")
+        self.objects_dir = f"{self.base_dir}/objects"
+        self.shard_levels = shard_levels
+        self.tmp_dir = os.path.join(root_path, self.objects_dir, ".tmp")
+        # (caminho, tamanho, mtime) -> sha256 das fotos antigas, para não relê-las
+        self._digests = {}
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    # --------------------------------------------------------------------------
+    # Leitura
+    # --------------------------------------------------------------------------
+
+    def full_path(self, relative_path):
+        """Caminho absoluto de uma foto a partir do caminho gravado no DB."""
+        return os.path.join(self.root_path, relative_path)
+
+    def exists(self, relative_path):
+        return bool(relative_path) and os.path.exists(self.full_path(relative_path))
+
+    def open(self, relative_path):
+        return open(self.full_path(relative_path), 'rb')
+
+    def content_digest(self, relative_path):
+        """
+        SHA-256 do conteúdo da foto. Para objetos vem do próprio nome; fotos
+        antigas são lidas uma vez e memorizadas por (tamanho, mtime).
+        Lança OSError se o arquivo não existir.
+        """
+        full_path = self.full_path(relative_path)
+        stat = os.stat(full_path)
+        if self.is_object(relative_path):
+            return os.path.splitext(os.path.basename(relative_path))[0]
+
+        memo_key = (full_path, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(full_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            self._digests[memo_key] = digest
+        return digest
+
+    def is_object(self, relative_path):
+        """True se o caminho é um objeto endereçado pelo conteúdo (e não uma foto antiga)."""
+        return bool(relative_path) and relative_path.startswith(self.objects_dir + "/")
+
+    # --------------------------------------------------------------------------
+    # Gravação
+    # --------------------------------------------------------------------------
+
+    def object_path(self, digest, extension):
+        shards = [digest[i * 2:i * 2 + 2] for i in range(self.shard_levels)]
+        return "/".join([self.objects_dir, *shards, f"{digest}{extension}"])
+
+    @staticmethod
+    def _extension(original_name):
+        _, ext = os.path.splitext(secure_filename(original_name or ""))
+        ext = ext.lower()
+        return EXTENSION_ALIASES.get(ext, ext)
+
+    def find_object(self, digest):
+        """Caminho relativo do objeto com este SHA-256, com qualquer extensão (ou None)."""
+        shard_dir = os.path.dirname(self.full_path(self.object_path(digest, "")))
+        matches = sorted(glob.glob(os.path.join(shard_dir, f"{digest}*")))
+        if not matches:
+            return None
+        return os.path.relpath(matches[0], self.root_path).replace(os.sep, "/")
+
+    def put_stream(self, stream, original_name):
+        """Grava um stream (upload do multipart) calculando o hash durante a cópia."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b''):
+                    digest.update(block)
+                    f.write(block)
+            return self._publish(tmp_path, digest.hexdigest(), self._extension(original_name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, source_path, original_name, sha256=None):
+        """
+        Grava um arquivo já em disco (upload em partes concluído). Com `sha256`
+        já conferido não relê o arquivo; usa hard link quando possível.
+        """
+        if not sha256:
+            digest = hashlib.sha256()
+            with open(source_path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        try:
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                shutil.copyfile(source_path, tmp_path)
+            return self._publish(tmp_path, sha256.lower(), self._extension(original_name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _publish(self, tmp_path, digest, extension):
+        """
+        Move o arquivo temporário para o caminho do objeto. Se o objeto já existe
+        (mesmo conteúdo), o temporário é descartado e o existente é reaproveitado,
+        mesmo que tenha sido gravado com outra extensão: a identidade é o hash.
+        """
+        relative_path = self.find_object(digest) or self.object_path(digest, extension)
+        target = self.full_path(relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        while True:
+            try:
+                # link falha se o destino já existe: sem sobrescrever um objeto em uso
+                os.link(tmp_path, target)
+            except FileExistsError:
+                try:
+                    # Atualiza o mtime: a limpeza de objetos sem referência respeita um período de carência
+                    os.utime(target)
+                except FileNotFoundError:
+                    # O reaper acabou de mover o objeto para a lápide: grava de novo
+                    continue
+            return relative_path
+
+    # --------------------------------------------------------------------------
+    # Contagem de referências (no cursor da transação que grava a inspeção)
+    # --------------------------------------------------------------------------
+
+    def acquire(self, cur, paths):
+        """Soma uma referência para cada ocorrência dos objetos em `paths`."""
+        counts = Counter(path for path in paths if self.is_object(path))
+        if not counts:
+            return
+        rows = []
+        for path, count in counts.items():
+            digest = os.path.splitext(os.path.basename(path))[0]
+            try:
+                size = os.path.getsize(self.full_path(path))
+            except OSError:
+                size = 0
+            rows.append((path, digest, size, count))
+        cur.executemany("""
+            INSERT INTO photo_objects (path, sha256, size, refcount, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, UTC_TIMESTAMP(), UTC_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE refcount = refcount + VALUES(refcount), updated_at = UTC_TIMESTAMP()
+        """, rows)
+
+    def release(self, cur, paths):
+        """Remove uma referência para cada ocorrência; objetos que chegam a zero ficam para a limpeza."""
+        counts = Counter(path for path in paths if self.is_object(path))
+        if not counts:
+            return
+        cur.executemany("""
+            UPDATE photo_objects
+            SET refcount = GREATEST(refcount - %s, 0), updated_at = UTC_TIMESTAMP()
+            WHERE path = %s
+        """, [(count, path) for path, count in counts.items()])
+
+
+def inspection_photo_paths(row):
+    """Lista os caminhos relativos de todas as fotos de uma inspeção (jusante, montante, outras)."""
+    paths = [row.get('jusante_photo'), row.get('montante_photo')]
+    try:
+        paths.extend(json.loads(row.get('other_photos') or '[]'))
+    except (TypeError, ValueError):
+        pass
+    return [path for path in paths if path]
+
+
+photo_store = PhotoStore(
+    os.environ.get("PHOTO_STORE_ROOT", ROOT_PATH),
+    os.environ.get("PHOTO_STORE_DIR", "static/uploads")
+)
@@ -0,0 +1,113 @@
+"""
+Varredura de fotos órfãs: remove do armazenamento de fotos os arquivos que nenhuma inspeção referencia.
+
+Uso (ex.: diariamente pelo cron):
+    python sweep_orphans.py [--dry-run] [--rate N] [--batch-size N] [--grace-hours N]
+
+- As referências são lidas do DB em lotes (cursor não bufferizado), incluindo o JSON other_photos.
+- O diretório é percorrido com scandir, sem listar tudo em memória.
+- Arquivos mais novos que --grace-hours são mantidos (uploads ainda sem inspeção gravada).
+- --rate limita as remoções por segundo para não saturar o disco.
+- --dry-run só lista o que seria removido.
+"""
+import argparse
+import os
+import sys
+import time
+
+from reaper import RateLimiter, find_orphans, referenced_with_derivatives
+from storage import inspection_photo_paths, photo_store
+
+
+def fetch_referenced_paths(conn, batch_size):
+    """Caminhos referenciados pelas inspeções e pelos objetos com referência, lidos em lotes."""
+    import MySQLdb.cursors
+
+    paths = set()
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute("SELECT jusante_photo, montante_photo, other_photos FROM inspections")
+        for rows in iter(lambda: cur.fetchmany(batch_size), ()):
+            for row in rows:
+                paths.update(inspection_photo_paths(row))
+    finally:
+        cur.close()
+
+    cur = conn.cursor(MySQLdb.cursors.SSDictCursor)
+    try:
+        cur.execute("SELECT path FROM photo_objects WHERE refcount > 0")
+        for rows in iter(lambda: cur.fetchmany(batch_size), ()):
+            paths.update(row['path'] for row in rows)
+    finally:
+        cur.close()
+    return paths
+
+
+def forget_objects(conn, paths, dry_run):
+    """Apaga as linhas de photo_objects dos objetos removidos do disco."""
+    paths = [path for path in paths if photo_store.is_object(path)]
+    if not paths or dry_run:
+        return
+    placeholders = ", ".join(["%s"] * len(paths))
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DELETE FROM photo_objects WHERE path IN ({placeholders}) AND refcount = 0", paths)
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def run(args):
+    from db import pool
+
+    entry = pool.acquire()
+    conn = entry.conn
+    started = time.monotonic()
+    try:
+        referenced = referenced_with_derivatives(fetch_referenced_paths(conn, args.batch_size))
+        print(f"{len(referenced)} caminhos referenciados (com derivados) lidos em {time.monotonic() - started:.1f}s", flush=True)
+
+        limiter = RateLimiter(args.rate)
+        orphans = find_orphans(photo_store.root_path, photo_store.base_dir, referenced, args.grace_hours * 3600)
+        removed = freed = 0
+        batch = []
+        for relative_path, size in orphans:
+            if args.dry_run:
+                print(f"órfão: {relative_path} ({size} bytes)")
+            else:
+                limiter.wait()
+                try:
+                    os.remove(photo_store.full_path(relative_path))
+                except OSError as e:
+                    print(f"falha ao remover {relative_path}: {e}", file=sys.stderr)
+                    continue
+            removed += 1
+            freed += size
+            batch.append(relative_path)
+            if len(batch) >= args.batch_size:
+                forget_objects(conn, batch, args.dry_run)
+                batch = []
+        forget_objects(conn, batch, args.dry_run)
+    finally:
+        pool.release(entry)
+
+    label = "Seriam removidos" if args.dry_run else "Removidos"
+    print(f"{label}: {removed} arquivos, {freed / (1024 * 1024):.1f} MiB em {time.monotonic() - started:.1f}s", flush=True)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove fotos que nenhuma inspeção referencia.")
+    parser.add_argument("--dry-run", action="store_true", help="só lista os órfãos, sem remover")
+    parser.add_argument("--rate", type=float, default=100, help="máximo de remoções por segundo (0 = sem limite)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="linhas lidas do DB por lote")
+    parser.add_argument("--grace-hours", type=float, default=24, help="mantém arquivos mais novos que isso")
+    args = parser.parse_args(argv)
+
+    if args.batch_size < 1 or args.rate < 0 or args.grace_hours < 0:
+        parser.error("--batch-size deve ser positivo; --rate e --grace-hours não podem ser negativos")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
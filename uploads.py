@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Tamanho dos blocos lidos do corpo da requisição e do arquivo (nunca o chunk inteiro em memória)
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Erro numa sessão de upload (mensagem e status HTTP para a resposta)."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+class UploadSessionStore:
+    """
+    Sessões de upload em partes (chunks), retomáveis.
+
+    Cada sessão guarda o estado em <diretório>/<upload_id>.json e os bytes
+    recebidos em <diretório>/<upload_id>.part. Os chunks são gravados em disco
+    em blocos, direto do stream da requisição. Sessões sem atividade há mais
+    de `max_age` segundos são removidas.
+
+    As operações numa sessão são serializadas por um flock no arquivo .part,
+    que vale também entre os processos do servidor.
+    """
+
+    def __init__(self, directory, max_size, max_age=24 * 3600, cleanup_interval=600):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_lock = threading.Lock()
+        self._last_cleanup = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def data_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    @contextmanager
+    def _locked_data(self, upload_id, mode):
+        """Abre o .part da sessão com lock exclusivo (liberado ao fechar o arquivo)."""
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError("Upload não encontrado", 404)
+        try:
+            f = open(self.data_path(upload_id), mode)
+        except FileNotFoundError:
+            raise UploadError("Upload não encontrado", 404)
+        with f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield f
+
+    def _save(self, session):
+        session['updated_at'] = time.time()
+        tmp_path = f"{self._state_path(session['id'])}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self._state_path(session['id']))
+
+    def get(self, upload_id):
+        """Retorna o estado da sessão ou lança UploadError(404)."""
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError("Upload não encontrado", 404)
+        try:
+            with open(self._state_path(upload_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Upload não encontrado", 404)
+
+    def create(self, filename, size, sha256=None):
+        """Abre uma sessão para um arquivo de `size` bytes."""
+        self._maybe_cleanup()
+
+        if not filename:
+            raise UploadError("Nome do arquivo é obrigatório")
+        if size is None or size <= 0:
+            raise UploadError("Tamanho do arquivo inválido")
+        if size > self.max_size:
+            raise UploadError("Arquivo maior que o limite permitido", 413)
+
+        session = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'offset': 0,
+            'status': 'uploading',
+            'created_at': time.time(),
+        }
+        open(self.data_path(session['id']), 'wb').close()
+        self._save(session)
+        return session
+
+    def write_chunk(self, upload_id, offset, stream):
+        """
+        Grava um chunk a partir de `offset`. Idempotente: bytes já recebidos
+        (reenvio após queda de conexão) são descartados do stream.
+        Um offset além do recebido retorna 409 com o offset esperado.
+        """
+        with self._locked_data(upload_id, 'r+b') as f:
+            session = self.get(upload_id)
+            if session['status'] != 'uploading':
+                raise UploadError("Upload já concluído", 409, offset=session['offset'])
+            if offset < 0 or offset > session['offset']:
+                raise UploadError("Offset fora de ordem", 409, offset=session['offset'])
+
+            # Pula a parte do chunk que já foi gravada
+            to_skip = session['offset'] - offset
+            while to_skip > 0:
+                block = stream.read(min(COPY_BLOCK_SIZE, to_skip))
+                if not block:
+                    break
+                to_skip -= len(block)
+
+            # Grava a partir do offset confirmado, não do fim do arquivo: bytes de uma
+            # gravação interrompida antes de salvar o estado são sobrescritos
+            received = session['offset']
+            f.seek(received)
+            try:
+                while True:
+                    block = stream.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if received + len(block) > session['size']:
+                        raise UploadError("Chunk ultrapassa o tamanho declarado", 413, offset=received)
+                    f.write(block)
+                    received += len(block)
+            finally:
+                # Mesmo se a conexão cair no meio do chunk, o que foi gravado vale para a retomada
+                f.truncate()
+                session['offset'] = received
+                self._save(session)
+            return session
+
+    def complete(self, upload_id, sha256=None):
+        """Confere tamanho e checksum SHA-256 e marca a sessão como concluída."""
+        with self._locked_data(upload_id, 'rb') as f:
+            session = self.get(upload_id)
+            if session['status'] == 'complete':
+                return session
+
+            expected = (sha256 or session['sha256'] or '').lower()
+            if not expected:
+                raise UploadError("Checksum sha256 é obrigatório")
+            if session['offset'] != session['size']:
+                raise UploadError("Upload incompleto", 409, offset=session['offset'])
+
+            digest = hashlib.sha256()
+            for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+                digest.update(block)
+            if digest.hexdigest() != expected:
+                raise UploadError("Checksum não confere", 422)
+
+            session['sha256'] = expected
+            session['status'] = 'complete'
+            self._save(session)
+            return session
+
+    def claim(self, upload_id):
+        """
+        Entrega um upload concluído para virar foto de uma inspeção.
+        Retorna (caminho_do_arquivo, nome_original); a sessão é encerrada por discard().
+        """
+        session = self.get(upload_id)
+        if session['status'] != 'complete':
+            raise UploadError(f"Upload {upload_id} não foi concluído", 409)
+        return self.data_path(upload_id), session['filename']
+
+    def discard(self, upload_id):
+        for path in (self._state_path(upload_id), self.data_path(upload_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _maybe_cleanup(self):
+        with self._cleanup_lock:
+            if time.time() - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = time.time()
+        self.cleanup()
+
+    def cleanup(self):
+        """Remove sessões abandonadas (sem atividade há mais de max_age)."""
+        now = time.time()
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,87 @@
+import io
+import pathlib
+import zipfile
+import collections
+
+from instrumentation import stage
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """
+    Destino não-pesquisável (sem seek/tell) para o ZipFile.
+    Acumula os bytes escritos até serem drenados pelo gerador.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+COPY_BLOCK_SIZE = 256 * 1024
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    """
+    Gera um arquivo ZIP em pedaços, uma entrada por vez.
+
+    `entries` é um iterável (pode ser um gerador) de tuplas (nome, dados) ou
+    (nome, dados, compressão). `dados` é bytes/str ou um pathlib.Path, que é
+    copiado do disco em blocos (sem carregar o arquivo inteiro). Cada entrada
+    é enviada assim que é escrita, então a memória usada fica limitada ao
+    tamanho da maior entrada em memória.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression) as zipf:
+        for entry in entries:
+            name, data = entry[0], entry[1]
+            compress_type = entry[2] if len(entry) > 2 else compression
+            if isinstance(data, pathlib.Path):
+                zinfo = zipfile.ZipInfo.from_file(data, name)
+                zinfo.compress_type = compress_type
+                with open(data, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    for block in iter(lambda: src.read(COPY_BLOCK_SIZE), b''):
+                        with stage('zip_write'):
+                            dest.write(block)
+                        chunk = buffer.drain()
+                        if chunk:
+                            yield chunk
+            else:
+                with stage('zip_write'):
+                    zipf.writestr(name, data, compress_type=compress_type)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+    # Diretório central do ZIP, escrito ao fechar o arquivo
+    yield buffer.drain()
+
+
+def map_ordered(executor, fn, items, window):
+    """
+    Aplica `fn` aos itens no `executor`, com no máximo `window` tarefas em
+    andamento, e gera os resultados na ordem dos itens (para as entradas do
+    ZIP saírem em ordem estável enquanto as seguintes são processadas).
+    """
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Download interrompido: não processa o que ainda não começou
+        for future in pending:
+            future.cancel()